@@ -1,3 +1,30 @@
+"""
+CLI calculator.
+
+    python calc.py                      # interactive menu
+    python calc.py --batch [FILE|-]     # one "op a b" per line, e.g. "divide 7 2"
+    python calc.py --expr "(qty*price)*1.05-discount" [--rows FILE.csv]
+
+Batch mode writes one output line per input line: the result, or an error
+record "error: line N: reason". Blank lines and lines starting with # are
+echoed as blank. The exit status is 1 if any line failed. With NumPy
+installed, large inputs are evaluated a chunk at a time with vectorized
+arithmetic. The results are identical to the pure-Python path.
+
+Expressions are parsed without eval() and compiled to nested closures;
+compile_expression() keeps the last EXPR_CACHE_SIZE compiled forms, so a
+formula evaluated over many rows is parsed once.
+"""
+import re
+import sys
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:   # optional: batch mode falls back to pure Python
+    np = None
+
 def add(a, b):
     return a + b
 
@@ -9,12 +36,368 @@ def multiply(a, b):
 
 def divide(a, b):
     if b == 0:
-        return "Error! Division by zero."
+        raise ZeroDivisionError("Division by zero.")
     return a / b
 
+# ------------------- Operation table -------------------
+# Names and symbols accepted in batch input; the code indexes the vectorized path
+OPERATIONS: Dict[str, Callable[[float, float], float]] = {
+    "add": add, "+": add,
+    "subtract": subtract, "-": subtract,
+    "multiply": multiply, "*": multiply,
+    "divide": divide, "/": divide,
+}
+_CODES = {name: code for code, fn in enumerate((add, subtract, multiply, divide))
+          for name, op in OPERATIONS.items() if op is fn}
+
+# Inputs at least this long (in lines) use NumPy when it is available
+VECTOR_THRESHOLD = 4096
+CHUNK_LINES = 65536
+
+
+class Record(NamedTuple):
+    line: int
+    value: Optional[float] = None
+    error: Optional[str] = None
+
+    def format(self) -> str:
+        if self.error is not None:
+            return f"error: line {self.line}: {self.error}"
+        return "" if self.value is None else repr(self.value)
+
+
+# ------------------- Batch engine -------------------
+def evaluate_line(line: str, lineno: int = 0) -> Record:
+    parts = line.split()
+    if not parts or parts[0].startswith("#"):
+        return Record(lineno)
+    if len(parts) != 3:
+        return Record(lineno, error=f"expected 'op a b', got {line.strip()!r}")
+    fn = OPERATIONS.get(parts[0].lower())
+    if fn is None:
+        return Record(lineno, error=f"unknown operation {parts[0]!r}")
+    try:
+        a, b = float(parts[1]), float(parts[2])
+    except ValueError:
+        return Record(lineno, error=f"not a number in {line.strip()!r}")
+    try:
+        return Record(lineno, fn(a, b))
+    except ArithmeticError as e:
+        return Record(lineno, error=str(e))
+
+
+# A chunk evaluates to columns: values (None for blank lines and errors) and
+# {index: message} for the lines that failed
+Columns = Tuple[List[Optional[float]], Dict[int, str]]
+
+
+def _evaluate_python(lines: List[str]) -> Columns:
+    values, errors = [], {}
+    for i, line in enumerate(lines):
+        record = evaluate_line(line)
+        values.append(record.value)
+        if record.error is not None:
+            errors[i] = record.error
+    return values, errors
+
+
+def _evaluate_numpy(lines: List[str]) -> Columns:
+    """Vectorized chunk; a chunk with anything but clean "op a b" lines goes to Python"""
+    text = "".join(lines)
+    if "#" in text or "\0" in text:
+        return _evaluate_python(lines)
+    n = len(lines)
+    # Mark line ends so one split() yields op, a, b, marker for every line
+    tokens = (text if text.endswith("\n") else text + "\n").replace("\n", " \0 ").split()
+    if len(tokens) != 4 * n or tokens[3::4].count("\0") != n:
+        return _evaluate_python(lines)
+    try:
+        codes = np.fromiter(map(_CODES.__getitem__, map(str.lower, tokens[0::4])), np.int8, n)
+        # float() per token keeps parsing identical to the Python path
+        a = np.fromiter(map(float, tokens[1::4]), np.float64, n)
+        b = np.fromiter(map(float, tokens[2::4]), np.float64, n)
+    except (KeyError, ValueError):
+        return _evaluate_python(lines)
+    zero_div = (codes == 3) & (b == 0)
+    with np.errstate(all="ignore"):
+        out = np.select([codes == 0, codes == 1, codes == 2],
+                        [a + b, a - b, a * b],
+                        a / np.where(zero_div, 1.0, b))
+    values = out.tolist()
+    errors = {}
+    for i in np.flatnonzero(zero_div).tolist():
+        values[i] = None
+        errors[i] = "Division by zero."
+    return values, errors
+
+
+def _chunks(lines: Iterable[str], vectorize: Optional[bool]) -> Iterator[Columns]:
+    if vectorize and np is None:
+        raise RuntimeError("NumPy is not installed")
+    it = iter(lines)
+    while True:
+        chunk = []
+        for line in it:
+            chunk.append(line)
+            if len(chunk) == CHUNK_LINES:
+                break
+        if not chunk:
+            return
+        use_numpy = np is not None and (vectorize or (vectorize is None and len(chunk) >= VECTOR_THRESHOLD))
+        yield (_evaluate_numpy if use_numpy else _evaluate_python)(chunk)
+
+
+def evaluate_stream(lines: Iterable[str], vectorize: Optional[bool] = None) -> Iterator[Record]:
+    """
+    Evaluate "op a b" lines, yielding one Record per line in order.
+    vectorize=None uses NumPy for chunks of VECTOR_THRESHOLD lines or more.
+    """
+    first = 1
+    for values, errors in _chunks(lines, vectorize):
+        for i, value in enumerate(values):
+            yield Record(first + i, value, errors.get(i))
+        first += len(values)
+
+
+def run_batch(source, out=None, vectorize: Optional[bool] = None) -> int:
+    """Evaluate a file object or path ("-" for stdin); returns the number of error records"""
+    out = out or sys.stdout
+    if source in (None, "-"):
+        f = sys.stdin
+    elif hasattr(source, "read"):
+        f = source
+    else:
+        f = open(source, "r", encoding="utf-8")
+    first = 1
+    error_count = 0
+    try:
+        for values, errors in _chunks(f, vectorize):
+            if errors or None in values:
+                text = [Record(first + i, v, errors.get(i)).format() for i, v in enumerate(values)]
+            else:
+                text = map(repr, values)
+            out.write("\n".join(text) + "\n")
+            error_count += len(errors)
+            first += len(values)
+    finally:
+        if f is not source and f is not sys.stdin:
+            f.close()
+    return error_count
+
+# ------------------- Expressions -------------------
+EXPR_CACHE_SIZE = 256
+
+_TOKEN = re.compile(r"(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)|([A-Za-z_]\w*)|(\S)")
+_SPACE = re.compile(r"\s*")
+_BINARY = {"+": add, "-": subtract, "*": multiply, "/": divide}
+
+Env = Mapping[str, float]
+
+
+class ExpressionError(ValueError):
+    """Syntax error in an expression, or a variable with no value"""
+
+
+class Expression:
+    """A compiled expression; call it with variable bindings"""
+
+    __slots__ = ("source", "variables", "_fn")
+
+    def __init__(self, source: str, fn: Callable[[Env], float], variables: FrozenSet[str]):
+        self.source = source
+        self.variables = variables
+        self._fn = fn
+
+    def __call__(self, env: Optional[Env] = None, **bindings: float) -> float:
+        if bindings:
+            env = {**env, **bindings} if env else bindings
+        try:
+            return self._fn(env or {})
+        except KeyError as e:
+            raise ExpressionError(f"no value for variable {e.args[0]!r}") from None
+
+    def map(self, rows: Iterable[Env]) -> Iterator[float]:
+        """Evaluate once per row of bindings"""
+        fn = self._fn
+        for row in rows:
+            try:
+                yield fn(row)
+            except KeyError as e:
+                raise ExpressionError(f"no value for variable {e.args[0]!r}") from None
+
+    def __repr__(self):
+        return f"Expression({self.source!r})"
+
+
+class _Parser:
+    """
+    Recursive descent over:
+        expr   := term (("+" | "-") term)*
+        term   := unary (("*" | "/") unary)*
+        unary  := ("+" | "-") unary | atom
+        atom   := NUMBER | NAME | "(" expr ")"
+    Each rule returns a closure env -> float; constant subtrees are folded.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens: List[Tuple[str, str, int]] = []   # (kind, text, offset)
+        pos = _SPACE.match(source).end()
+        while pos < len(source):
+            m = _TOKEN.match(source, pos)
+            if m is None:
+                raise ExpressionError(f"bad character at column {pos + 1}: {source!r}")
+            if m.group(1):
+                self.tokens.append(("num", m.group(1), m.start(1)))
+            elif m.group(2):
+                self.tokens.append(("name", m.group(2), m.start(2)))
+            elif m.group(3):
+                self.tokens.append(("op", m.group(3), m.start(3)))
+            pos = _SPACE.match(source, m.end()).end()
+        self.tokens.append(("end", "", len(source)))
+        self.i = 0
+        self.variables = set()
+
+    def error(self, message: str):
+        offset = self.tokens[self.i][2]
+        raise ExpressionError(f"{message} at column {offset + 1}: {self.source!r}")
+
+    def peek(self) -> Tuple[str, str, int]:
+        return self.tokens[self.i]
+
+    def take(self, text: str) -> bool:
+        kind, tok, _ = self.tokens[self.i]
+        if kind == "op" and tok == text:
+            self.i += 1
+            return True
+        return False
+
+    def parse(self):
+        if self.peek()[0] == "end":
+            self.error("empty expression")
+        node = self.expr()
+        if self.peek()[0] != "end":
+            self.error(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def binary(self, ops: str, operand):
+        left = operand()
+        while True:
+            kind, tok, _ = self.peek()
+            if kind != "op" or tok not in ops:
+                return left
+            self.i += 1
+            left = _combine(_BINARY[tok], left, operand())
+
+    def expr(self):
+        return self.binary("+-", self.term)
+
+    def term(self):
+        return self.binary("*/", self.unary)
+
+    def unary(self):
+        if self.take("+"):
+            return self.unary()
+        if self.take("-"):
+            inner = self.unary()
+            if isinstance(inner, float):
+                return -inner
+            return lambda env: -inner(env)
+        return self.atom()
+
+    def atom(self):
+        kind, tok, _ = self.peek()
+        if kind == "num":
+            self.i += 1
+            return float(tok)
+        if kind == "name":
+            self.i += 1
+            self.variables.add(tok)
+            return lambda env: env[tok]
+        if self.take("("):
+            node = self.expr()
+            if not self.take(")"):
+                self.error("expected ')'")
+            return node
+        self.error("expected a number, name or '('" if kind != "end" else "unexpected end")
+
+
+def _combine(fn, left, right):
+    """
+    Closure for `left <op> right`; constants are folded at compile time,
+    except where that fails (1/0), which then fails when evaluated
+    """
+    lconst, rconst = isinstance(left, float), isinstance(right, float)
+    if lconst and rconst:
+        try:
+            return fn(left, right)
+        except ArithmeticError:
+            return lambda env: fn(left, right)
+    if lconst:
+        return lambda env: fn(left, right(env))
+    if rconst:
+        return lambda env: fn(left(env), right)
+    return lambda env: fn(left(env), right(env))
+
+
+def _parse(source: str) -> Expression:
+    parser = _Parser(source)
+    node = parser.parse()
+    fn = (lambda env: node) if isinstance(node, float) else node
+    return Expression(source, fn, frozenset(parser.variables))
+
+
+@lru_cache(maxsize=EXPR_CACHE_SIZE)
+def compile_expression(source: str) -> Expression:
+    """Parse `source` once; repeated calls with the same text hit the cache"""
+    return _parse(source)
+
+
+def evaluate(source: str, env: Optional[Env] = None, **bindings: float) -> float:
+    return compile_expression(source)(env, **bindings)
+
+
+def bench_expressions(rows: int = 100_000, source: str = "(qty*price)*1.05-discount") -> Dict[str, float]:
+    """Seconds to evaluate `source` over `rows` bindings, compiled once vs parsed per row"""
+    import random
+    import time
+    rng = random.Random(42)
+    data = [{"qty": float(rng.randint(1, 20)), "price": rng.uniform(10, 500),
+             "discount": rng.uniform(0, 50)} for _ in range(rows)]
+    start = time.perf_counter()
+    compiled = list(compile_expression(source).map(data))
+    compiled_s = time.perf_counter() - start
+    start = time.perf_counter()
+    reparsed = [_parse(source)(row) for row in data]
+    reparse_s = time.perf_counter() - start
+    assert compiled == reparsed
+    return {"rows": rows, "compiled_s": compiled_s, "reparse_s": reparse_s,
+            "speedup": reparse_s / compiled_s}
+
+
+def run_expression(source: str, rows_path=None, out=None) -> int:
+    """Evaluate once, or once per row of a CSV file whose header names the variables"""
+    out = out or sys.stdout
+    expression = compile_expression(source)
+    if rows_path is None:
+        out.write(f"{expression()!r}\n")
+        return 0
+    import csv
+    errors = 0
+    with open(rows_path, newline="", encoding="utf-8") as f:
+        for n, row in enumerate(csv.DictReader(f), 2):   # line 1 is the header
+            try:
+                env = {k: float(row[k]) for k in expression.variables}
+                out.write(f"{expression(env)!r}\n")
+            except (KeyError, ValueError, ArithmeticError) as e:
+                errors += 1
+                out.write(f"error: line {n}: {e}\n")
+    return errors
+
+# ------------------- Interactive -------------------
 def calculator():
     print("Welcome to the CLI Calculator!")
-    
+
     while True:
         print("\nChoose an operation:")
         print("1. Addition (+)")
@@ -22,12 +405,21 @@ def calculator():
         print("3. Multiplication (*)")
         print("4. Division (/)")
         print("5. Exit")
+        print("6. Formula, e.g. (2+3)*4")
 
-        choice = input("Enter your choice (1-5): ")
+        choice = input("Enter your choice (1-6): ")
 
         if choice == '5':
             print("Exiting... Goodbye!")
             break
+        if choice == '6':
+            try:
+                print("Result:", evaluate(input("Enter formula: ")))
+            except ExpressionError as e:
+                print("Invalid formula:", e)
+            except ZeroDivisionError:
+                print("Result: Error! Division by zero.")
+            continue
 
         num1 = float(input("Enter first number: "))
         num2 = float(input("Enter second number: "))
@@ -39,9 +431,44 @@ def calculator():
         elif choice == '3':
             print("Result:", multiply(num1, num2))
         elif choice == '4':
-            print("Result:", divide(num1, num2))
+            try:
+                print("Result:", divide(num1, num2))
+            except ZeroDivisionError:
+                print("Result: Error! Division by zero.")
         else:
-            print("Invalid input. Please choose between 1-5.")
+            print("Invalid input. Please choose between 1-6.")
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="CLI calculator")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="evaluate 'op a b' lines from FILE (default: stdin)")
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument("--numpy", dest="vectorize", action="store_const", const=True,
+                        help="always use the vectorized path")
+    engine.add_argument("--no-numpy", dest="vectorize", action="store_const", const=False,
+                        help="never use the vectorized path")
+    parser.add_argument("--expr", metavar="FORMULA", help="evaluate a formula, e.g. '(qty*price)*1.05-discount'")
+    parser.add_argument("--rows", metavar="CSV", help="with --expr: evaluate once per row; the header names the variables")
+    parser.add_argument("--bench-expr", type=int, nargs="?", const=100_000, metavar="ROWS",
+                        help="time compiled vs re-parsed formula evaluation")
+    args = parser.parse_args(argv)
+    if args.bench_expr:
+        r = bench_expressions(args.bench_expr)
+        print(f"{r['rows']} rows: compiled {r['compiled_s'] * 1000:.1f} ms, "
+              f"re-parsed {r['reparse_s'] * 1000:.1f} ms ({r['speedup']:.1f}x)")
+        return 0
+    if args.expr is not None:
+        try:
+            return 1 if run_expression(args.expr, args.rows) else 0
+        except (ExpressionError, ArithmeticError) as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+    if args.batch is None:
+        calculator()
+        return 0
+    return 1 if run_batch(args.batch, vectorize=args.vectorize) else 0
 
 # Run the calculator
-calculator()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,67 @@
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox
-import csv
-import pywhatkit as kit
-import datetime
-from utils.db_utils import init_db, bootstrap_menu_from_csv, fetch_menu, save_order, sales_report
+from utils.db_utils import init_db, bootstrap_menu_from_csv, save_order, sales_report
+from utils.menu_cache import get_menu_cache
+from utils.cart import Cart
+from utils.dispatch import DispatchWorker, pywhatkit_sender, SENT, FAILED
+from utils.metrics import span
+from utils.receipts import Receipt, render
+from utils.totals_cache import get_totals_cache
 
 
 class RestaurantBillingApp:
-    def __init__(self, root):
+    def __init__(self, root, sender=pywhatkit_sender):
         self.root = root
         self.root.title("Restaurant Billing System")
 
-        # Menu dictionary {item_name: price}
-        self.menu = {}
-
-        # Initialize DB and load menu
-        init_db()
-        bootstrap_menu_from_csv()
-
-        # Try loading menu from DB first
-        rows = fetch_menu()
-        if rows:
-            for _id, name, category, price in rows:
-                self.menu[name] = price
-        else:
+        # With BILLING_SERVICE_URL set this till is a thin client of the billing
+        # service (python -m service), which owns the database and the outbox
+        service_url = os.environ.get("BILLING_SERVICE_URL")
+        self.client = None
+        if service_url:
+            from service.client import BillingClient, RemoteCart, RemoteMenu
+            self.client = BillingClient(service_url)
+            # the service owns the menu; this terminal has no database of its own
+            self.menu = RemoteMenu(self.client)
             try:
-                with open("data/menu.csv", newline="", encoding="utf-8") as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        key_map = {k.lower(): k for k in row.keys()}
-                        item_key = key_map.get("item") or key_map.get("name")
-                        price_key = key_map.get("price")
-                        if not item_key or not price_key:
-                            raise ValueError("CSV must contain 'Item/Name' and 'Price' columns")
-                        self.menu[row[item_key]] = float(row[price_key])
+                self.menu.refresh()
             except Exception as e:
-                messagebox.showerror("Error", f"Could not load menu: {e}")
-
-        # Cart storage
-        self.cart = []
+                messagebox.showerror("Error", f"Could not load menu from {service_url}: {e}")
+            # Cart with running totals; the Treeview follows it row by row
+            self.cart = RemoteCart(self.client)
+        else:
+            # Initialize DB (a no-op beyond one PRAGMA once the schema is current)
+            init_db()
+
+            # Shared menu cache: picks up price edits from other terminals.
+            # It starts from last run's snapshot; the DB is only asked for the
+            # menu when there is none (first run), or later if it changed.
+            self.menu = get_menu_cache()
+            if not self.menu.load_snapshot():
+                try:
+                    bootstrap_menu_from_csv()
+                    self.menu.refresh()
+                except Exception as e:
+                    messagebox.showerror("Error", f"Could not load menu: {e}")
+
+            # Cart with running totals; the Treeview follows it row by row.
+            # GST slabs and automatic discounts come from the pricing rules (utils/rules.py);
+            # carts that need line-by-line pricing are memoized across orders
+            self.cart = Cart(cache=get_totals_cache())
 
         # Build UI
         self.create_widgets()
 
+        # WhatsApp bills go through a persistent outbox and a background worker;
+        # status updates are marshalled back onto the Tk thread
+        self.dispatcher = None
+        if self.client is None:
+            self.dispatcher = DispatchWorker(
+                sender, on_status=lambda *status: self.root.after(0, self.on_dispatch_status, *status)
+            ).start()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
     def create_widgets(self):
         # Frame for menu
         frame1 = ttk.LabelFrame(self.root, text="Menu")
@@ -52,8 +71,10 @@ class RestaurantBillingApp:
         self.qty_var = tk.IntVar(value=1)
 
         ttk.Label(frame1, text="Item:").grid(row=0, column=0, padx=5, pady=5)
-        self.item_combo = ttk.Combobox(frame1, textvariable=self.item_var, values=list(self.menu.keys()))
+        self.item_combo = ttk.Combobox(frame1, textvariable=self.item_var, values=self.menu.names(),
+                                       postcommand=self.filter_items)
         self.item_combo.grid(row=0, column=1, padx=5, pady=5)
+        self.item_combo.bind("<KeyRelease>", self.filter_items)
 
         ttk.Label(frame1, text="Qty:").grid(row=1, column=0, padx=5, pady=5)
         self.qty_entry = ttk.Entry(frame1, textvariable=self.qty_var)
@@ -73,6 +94,16 @@ class RestaurantBillingApp:
         for col in ("Item", "Qty", "Price", "Total"):
             self.cart_tree.heading(col, text=col)
         self.cart_tree.pack()
+        self.cart.add_listener(self.on_cart_change)
+
+        cart_buttons = ttk.Frame(frame2)
+        cart_buttons.pack(fill=tk.X, pady=5)
+        ttk.Button(cart_buttons, text="Set Qty", command=self.update_qty).pack(side=tk.LEFT, padx=5)
+        ttk.Button(cart_buttons, text="Remove", command=self.remove_from_cart).pack(side=tk.LEFT, padx=5)
+
+        self.totals_var = tk.StringVar()
+        ttk.Label(frame2, textvariable=self.totals_var).pack(anchor="e")
+        self.show_totals()
 
         # Customer phone input
         frame3 = ttk.LabelFrame(self.root, text="Customer Info")
@@ -87,6 +118,13 @@ class RestaurantBillingApp:
             row=1, column=0, columnspan=2, pady=10
         )
 
+        self.status_var = tk.StringVar()
+        ttk.Label(frame3, textvariable=self.status_var).grid(row=2, column=0, columnspan=2)
+
+    def filter_items(self, _event=None):
+        # Narrow the dropdown to items starting with what has been typed
+        self.item_combo["values"] = self.menu.search(self.item_var.get().strip())
+
     def add_to_cart(self):
         item = self.item_var.get()
         qty = self.qty_var.get()
@@ -94,46 +132,92 @@ class RestaurantBillingApp:
             messagebox.showwarning("Invalid", "Please select item and quantity > 0")
             return
 
-        price = self.menu[item]
-        total = price * qty
-        self.cart.append((item, qty, price, total))
-        self.cart_tree.insert("", tk.END, values=(item, qty, price, total))
+        menu_item = self.menu.get(item)
+        if menu_item is None:
+            messagebox.showwarning("Invalid", f"'{item}' is not on the menu")
+            return
+        self.cart.add(item, qty, menu_item.price)
+
+    def selected_item(self):
+        selection = self.cart_tree.selection()
+        if not selection:
+            messagebox.showwarning("Invalid", "Select a cart line first")
+            return None
+        return selection[0]
+
+    def update_qty(self):
+        # Set the selected line's quantity from the Qty field (0 removes it)
+        item = self.selected_item()
+        if item is not None:
+            self.cart.set_qty(item, self.qty_var.get())
+
+    def remove_from_cart(self):
+        item = self.selected_item()
+        if item is not None:
+            self.cart.remove(item)
+
+    def on_cart_change(self, item, line):
+        # Cart rows use the item name as Treeview iid, so only the touched row is redrawn
+        if line is None:
+            self.cart_tree.delete(item)
+        else:
+            values = (item, line.qty, line.unit_price, line.line_total)
+            if self.cart_tree.exists(item):
+                self.cart_tree.item(item, values=values)
+            else:
+                self.cart_tree.insert("", tk.END, iid=item, values=values)
+        self.show_totals()
+
+    def show_totals(self):
+        t = self.cart.totals()
+        self.totals_var.set(f"Subtotal: {t['subtotal']}  GST: {t['gst_amount']}  "
+                            f"Discount: {t['discount_amount']}  Total: {t['total']}")
 
     def generate_bill(self):
         if not self.cart:
             messagebox.showwarning("Empty", "No items in cart")
             return
 
-        subtotal = sum(line[3] for line in self.cart)
-        gst = subtotal * 0.05
-        discount = subtotal * 0.1 if subtotal > 100 else 0
-        total = subtotal + gst - discount
+        # Timed up to the popup, which blocks until the cashier closes it
+        with span("app.generate_bill"):
+            t = self.cart.totals()
+            subtotal, gst, discount, total = t["subtotal"], t["gst_amount"], t["discount_amount"], t["total"]
+
+            bill_msg = render(Receipt.from_cart(self.cart, "Dine-In", "Cash", t), "whatsapp")
+            phone = self.phone_var.get().strip()
+
+            if self.client is not None:
+                # The service saves the order and queues the WhatsApp bill in one call
+                outbox_id = self.cart.checkout("Dine-In", "Cash", phone, bill_msg).get("outbox_id")
+            else:
+                # Save order in DB
+                save_order("Dine-In", "Cash", self.cart.order_lines(), subtotal, gst, discount, total)
 
-        # Save order in DB
-        save_order("Dine-In", "Cash", self.cart, subtotal, gst, discount, total)
+                # Send via WhatsApp (queued; the worker reports back through on_dispatch_status)
+                outbox_id = self.dispatcher.enqueue(phone, bill_msg) if phone else None
 
-        bill_msg = "🧾 *Restaurant Bill* 🧾\n\n"
-        for item, qty, price, t in self.cart:
-            bill_msg += f"{item} x{qty} = {t}\n"
-        bill_msg += f"\nSubtotal: {subtotal:.2f}\nGST: {gst:.2f}\nDiscount: {discount:.2f}\n*Total: {total:.2f}*"
+                # Reset cart (listeners clear the Treeview)
+                self.cart.clear()
+
+        if outbox_id is not None:
+            self.status_var.set(f"WhatsApp bill #{outbox_id} queued for {phone}")
 
         # Show in popup
         messagebox.showinfo("Bill", bill_msg)
 
-        # Send via WhatsApp
-        phone = self.phone_var.get().strip()
-        if phone:
-            now = datetime.datetime.now()
-            hour, minute = now.hour, now.minute + 1  # schedule 1 min later
-            try:
-                kit.sendwhatmsg(phone, bill_msg, hour, minute, wait_time=10, tab_close=True)
-                messagebox.showinfo("WhatsApp", "Bill sent successfully!")
-            except Exception as e:
-                messagebox.showerror("WhatsApp Error", f"Could not send: {e}")
+    def on_dispatch_status(self, outbox_id, status, error):
+        if status == SENT:
+            self.status_var.set(f"WhatsApp bill #{outbox_id} sent successfully!")
+        elif status == FAILED:
+            self.status_var.set(f"WhatsApp bill #{outbox_id} failed")
+            messagebox.showerror("WhatsApp Error", f"Could not send bill #{outbox_id}: {error}")
+        else:
+            self.status_var.set(f"WhatsApp bill #{outbox_id}: retrying ({error})")
 
-        # Reset cart
-        self.cart = []
-        self.cart_tree.delete(*self.cart_tree.get_children())
+    def on_close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.stop(timeout=2)
+        self.root.destroy()
 
 
 if __name__ == "__main__":
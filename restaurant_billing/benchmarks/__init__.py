@@ -0,0 +1 @@
+# benchmark scripts (run from restaurant_billing/, e.g. python -m benchmarks.bench_money)
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""
+Money vs float bill totals.
+
+Compares compute_totals on integer paise with the previous float path
+(round() per line, then on every total) over many synthetic bills.
+
+    python -m benchmarks.bench_money [--bills N] [--lines N]
+"""
+import argparse
+import random
+import time
+from typing import Dict, List, Tuple
+
+from utils.calculator import BillItem, compute_totals
+from utils.rules import DEFAULT_GST_PERCENT
+
+
+def float_totals(items: List[Tuple[int, float]], discount_pct: float = 0.0) -> Dict[str, float]:
+    # The float+round implementation compute_totals used before Money
+    subtotal = round(sum(round(q * p, 2) for q, p in items), 2)
+    gst_amount = round(subtotal * (DEFAULT_GST_PERCENT / 100.0), 2)
+    discount_amount = round(subtotal * (discount_pct / 100.0), 2) if discount_pct else 0.0
+    total = round(subtotal + gst_amount - discount_amount, 2)
+    return {"subtotal": subtotal, "gst_amount": gst_amount,
+            "discount_amount": discount_amount, "total": total}
+
+
+def make_bills(n_bills: int, n_lines: int, seed: int = 42):
+    rng = random.Random(seed)
+    prices = [round(rng.uniform(20, 600), 2) for _ in range(200)]
+    raw = [[(rng.randint(1, 5), rng.choice(prices)) for _ in range(n_lines)]
+           for _ in range(n_bills)]
+    money = [[BillItem("x", q, p) for q, p in bill] for bill in raw]
+    return raw, money
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bills", type=int, default=100_000)
+    parser.add_argument("--lines", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    raw, money = make_bills(args.bills, args.lines)
+    t_float = best_of(lambda: [float_totals(b, 10.0) for b in raw])
+    t_money = best_of(lambda: [compute_totals(b, 10.0) for b in money])
+    n = args.bills * args.lines
+    print(f"{args.bills} bills x {args.lines} lines ({n} lines)")
+    print(f"float+round : {t_float:.3f}s  ({n / t_float:,.0f} lines/s)")
+    print(f"Money paise : {t_money:.3f}s  ({n / t_money:,.0f} lines/s)")
+    print(f"speed-up    : {t_float / t_money:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Synthetic menus and order histories for the benchmarks."""
+import csv
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from utils import db_utils
+from utils.calculator import BillItem, compute_totals
+from utils.money import Money
+
+CATEGORIES = ["Starter", "Main Course", "Bread", "Beverage", "Dessert", "South Indian"]
+
+
+def make_menu(n_items: int, seed: int = 1) -> List[Tuple[str, str, Money]]:
+    """(name, category, price) for n_items synthetic dishes"""
+    rng = random.Random(seed)
+    return [(f"Dish {i:05d}", rng.choice(CATEGORIES), Money(rng.randrange(1000, 60000, 500)))
+            for i in range(n_items)]
+
+
+def write_menu_csv(path: Path, menu: List[Tuple[str, str, Money]]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["name", "category", "price"])
+        for name, category, price in menu:
+            w.writerow([name, category, str(price)])
+
+
+def make_orders(menu, n_orders: int, lines_per_order: int = 4, orders_per_day: int = 300,
+                start: datetime = datetime(2023, 1, 1, 11, 0), seed: int = 2) -> Iterator[tuple]:
+    """
+    Yields (created_at, items) with items as BillItems; orders are spread
+    over consecutive days, orders_per_day each, between 11:00 and 23:00.
+    """
+    rng = random.Random(seed)
+    for i in range(n_orders):
+        day, slot = divmod(i, orders_per_day)
+        created = start + timedelta(days=day, seconds=slot * 43200 // orders_per_day)
+        n_lines = max(1, int(rng.gauss(lines_per_order, 1.5)))
+        items = [BillItem(name, rng.randint(1, 3), price)
+                 for name, _cat, price in rng.sample(menu, min(n_lines, len(menu)))]
+        yield created.isoformat(timespec="seconds"), items
+
+
+def populate(menu, n_orders: int, lines_per_order: int = 4, orders_per_day: int = 300,
+             chunk: int = 20000):
+    """Fill the current DB_PATH with a menu and n_orders orders (fast, bulk inserts)"""
+    con = db_utils.get_conn()
+    with con:
+        con.executemany("INSERT OR IGNORE INTO menu(name, category, price_paise) VALUES (?,?,?)",
+                        [(n, c, p.paise) for n, c, p in menu])
+    menu_ids = dict(con.execute("SELECT name, id FROM menu"))
+    next_id = con.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM orders").fetchone()[0]
+    orders, items = [], []
+
+    def flush():
+        with con:
+            con.executemany("""
+                INSERT INTO orders(id, mode, payment_method, subtotal_paise, gst_paise,
+                                   discount_paise, total_paise, created_at)
+                VALUES (?,?,?,?,?,?,?,?)
+            """, orders)
+            con.executemany("""
+                INSERT INTO order_items(order_id, menu_item_id, item_name, qty,
+                                        unit_price_paise, line_total_paise)
+                VALUES (?,?,?,?,?,?)
+            """, items)
+        orders.clear()
+        items.clear()
+
+    for order_id, (created_at, bill) in enumerate(
+            make_orders(menu, n_orders, lines_per_order, orders_per_day), next_id):
+        t = compute_totals(bill)
+        orders.append((order_id, "Dine-In", "Cash", t["subtotal"].paise, t["gst_amount"].paise,
+                       t["discount_amount"].paise, t["total"].paise, created_at))
+        items.extend((order_id, menu_ids.get(i.name), i.name, i.qty, i.unit_price.paise,
+                      i.line_total.paise) for i in bill)
+        if len(orders) >= chunk:
+            flush()
+    if orders:
+        flush()
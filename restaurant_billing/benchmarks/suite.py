@@ -0,0 +1,368 @@
+"""
+Benchmark suite for the billing, persistence and reporting hot paths.
+
+    python -m benchmarks [--orders N] [--menu N] [--writers N] [--out FILE]
+                         [--baseline FILE] [--save-baseline] [--tolerance 0.20]
+
+Every case runs against a throw-away database in a temp directory.
+Results are written as JSON; with --baseline they are compared to a
+stored run and the exit status is 1 when any metric regressed by more
+than the tolerance. --save-baseline stores this run as the new baseline.
+"""
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from utils import db_utils
+from utils.calculator import compute_totals
+from utils.money import Money
+from utils.rules import CompiledRules, Rule, default_rules
+from utils.totals_cache import TotalsCache
+
+from .datagen import make_menu, make_orders, populate, write_menu_csv
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+APP_DIR = Path(__file__).resolve().parents[1]
+
+# name -> case(args) returning a metrics dict
+CASES: Dict[str, Callable] = {}
+
+
+def case(fn):
+    CASES[fn.__name__] = fn
+    return fn
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def best_of(fn: Callable[[], None], repeat: int = 5) -> float:
+    """Fastest of `repeat` timed runs, to keep noise out of the comparison"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def metric(value: float, unit: str, higher_is_better: bool, **extra) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better, **extra}
+
+
+def fresh_db(tmp: Path, name: str):
+    """Point db_utils at a new, initialised database file"""
+    db_utils.DB_PATH = tmp / f"{name}.db"
+    db_utils.init_db()
+
+
+# ------------------- Cases -------------------
+@case
+def totals_scalar(args, tmp):
+    menu = make_menu(args.menu)
+    bills = [items for _, items in make_orders(menu, args.bills, args.lines)]
+    n_lines = sum(len(b) for b in bills)
+    rules = default_rules()   # arithmetic only: no database behind the rules
+    elapsed = best_of(lambda: [compute_totals(b, 10.0, rules) for b in bills])
+    return metric(n_lines / elapsed, "lines/s", True, seconds=elapsed)
+
+
+@case
+def totals_batch(args, tmp):
+    try:
+        from utils.batch_calculator import compute_totals_batch
+    except ImportError:
+        return None   # numpy not installed
+    menu = make_menu(args.menu)
+    qty, price, oid = [], [], []
+    for order_id, (_, items) in enumerate(make_orders(menu, args.bills, args.lines)):
+        for i in items:
+            qty.append(i.qty)
+            price.append(i.unit_price.paise)
+            oid.append(order_id)
+    rules = default_rules()
+    elapsed = best_of(lambda: compute_totals_batch(qty, price, oid, 10.0, rules=rules))
+    return metric(len(qty) / elapsed, "lines/s", True, seconds=elapsed)
+
+
+@case
+def totals_cache(args, tmp):
+    # rules that price line by line (a GST slab and combos), over carts that repeat the way
+    # set meals and combos do at a till: a few hundred distinct carts rung up again and again
+    menu = make_menu(args.menu)
+    rules = CompiledRules([Rule("gst", 5.0), Rule("gst", 18.0, category="Beverage"),
+                           Rule("threshold", 10.0, above=Money.of(500))]
+                          + [Rule("combo", 15.0, items=(menu[i][0], menu[i + 1][0])) for i in range(0, 40, 2)],
+                          {name: category for name, category, _ in menu}, version=("bench",))
+    distinct = [items for _, items in make_orders(menu[:40], 300, args.lines)]
+    rng = random.Random(3)
+    bills = [rng.choice(distinct) for _ in range(args.bills)]
+    n_lines = sum(len(b) for b in bills)
+    uncached = best_of(lambda: [compute_totals(b, rules=rules, auto_discounts=True) for b in bills])
+    cache = TotalsCache()
+    cached = best_of(lambda: [compute_totals(b, rules=rules, auto_discounts=True, cache=cache) for b in bills])
+    return metric(n_lines / cached, "lines/s", True, seconds=cached,
+                  uncached_lines_per_s=n_lines / uncached, speedup=uncached / cached,
+                  hit_rate=cache.stats.hit_rate)
+
+
+@case
+def fetch_menu(args, tmp):
+    fresh_db(tmp, "fetch_menu")
+    populate(make_menu(args.menu), 0)
+    samples = []
+    for _ in range(50):
+        start = time.perf_counter()
+        db_utils.fetch_menu()
+        samples.append(time.perf_counter() - start)
+    return metric(percentile(samples, 50) * 1000, "ms", False,
+                  p99_ms=percentile(samples, 99) * 1000, items=args.menu)
+
+
+@case
+def bootstrap_menu_from_csv(args, tmp):
+    csv_path = tmp / "menu.csv"
+    write_menu_csv(csv_path, make_menu(args.menu))
+    fresh_db(tmp, "bootstrap")
+    saved, db_utils.MENU_CSV = db_utils.MENU_CSV, csv_path
+    try:
+        start = time.perf_counter()
+        db_utils.bootstrap_menu_from_csv()
+        elapsed = time.perf_counter() - start
+    finally:
+        db_utils.MENU_CSV = saved
+    return metric(args.menu / elapsed, "rows/s", True, seconds=elapsed)
+
+
+@case
+def save_order_concurrent(args, tmp):
+    fresh_db(tmp, "writers")
+    menu = make_menu(args.menu)
+    populate(menu, 0)
+    per_writer = max(1, args.write_orders // args.writers)
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def writer(seed):
+        local = []
+        for _, items in make_orders(menu, per_writer, args.lines, seed=seed):
+            t = compute_totals(items)
+            lines = [(i.name, i.qty, i.unit_price, i.line_total) for i in items]
+            start = time.perf_counter()
+            db_utils.save_order("Dine-In", "Cash", lines, t["subtotal"], t["gst_amount"],
+                                t["discount_amount"], t["total"])
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    before = db_utils.pool_stats()["lock_retries"]
+    threads = [threading.Thread(target=writer, args=(s,)) for s in range(args.writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return metric(len(latencies) / elapsed, "orders/s", True, writers=args.writers,
+                  p50_ms=percentile(latencies, 50) * 1000,
+                  p99_ms=percentile(latencies, 99) * 1000,
+                  lock_retries=db_utils.pool_stats()["lock_retries"] - before)
+
+
+@case
+def sales_report(args, tmp):
+    fresh_db(tmp, "report")
+    populate(make_menu(args.menu), args.orders, args.lines)
+    out = {}
+    for period in ("daily", "weekly", "monthly"):
+        samples = []
+        for _ in range(5):
+            start = time.perf_counter()
+            db_utils.sales_report(period)
+            samples.append(time.perf_counter() - start)
+        out[f"{period}_p50_ms"] = percentile(samples, 50) * 1000
+    start = time.perf_counter()
+    db_utils.raw_sales_report("daily")
+    out["raw_daily_ms"] = (time.perf_counter() - start) * 1000
+    return metric(max(v for k, v in out.items() if k.endswith("p50_ms")), "ms", False,
+                  orders=args.orders, **out)
+
+
+@case
+def item_aggregation(args, tmp):
+    """Units and revenue per menu item over all history: text join vs integer key"""
+    fresh_db(tmp, "items")
+    populate(make_menu(args.menu), args.orders, args.lines)
+    con = db_utils.get_conn()
+    by_name = """
+        SELECT oi.item_name, m.category, SUM(oi.qty), SUM(oi.line_total_paise)
+        FROM order_items oi LEFT JOIN menu m ON m.name = oi.item_name
+        GROUP BY oi.item_name
+    """
+    # reads only idx_order_items_menu_item, which is already in group order
+    by_id = """
+        SELECT m.name, m.category, g.units, g.paise
+        FROM (SELECT menu_item_id, SUM(qty) AS units, SUM(line_total_paise) AS paise
+              FROM order_items GROUP BY menu_item_id) g
+        LEFT JOIN menu m ON m.id = g.menu_item_id
+    """
+    assert sorted(con.execute(by_name).fetchall()) == sorted(con.execute(by_id).fetchall())
+    name_s = best_of(lambda: con.execute(by_name).fetchall(), repeat=3)
+    id_s = best_of(lambda: con.execute(by_id).fetchall(), repeat=3)
+    return metric(id_s * 1000, "ms", False, by_name_ms=name_s * 1000,
+                  speedup=name_s / id_s, orders=args.orders)
+
+
+# Run in a fresh interpreter by cold_start: argv = db path, "fast" | "legacy"
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+from utils import db_utils
+from utils.menu_cache import get_menu_cache
+imported = time.perf_counter()
+db_utils.DB_PATH = db_utils.Path(sys.argv[1])
+try:
+    import tkinter
+    root = tkinter.Tk()
+except Exception:
+    root = None   # no display: time everything up to the window itself
+if root is not None and sys.argv[2] == "fast":
+    app.RestaurantBillingApp(root, sender=lambda phone, msg: None)
+    root.update()
+else:
+    if sys.argv[2] == "fast":
+        db_utils.init_db()
+        menu = get_menu_cache()
+        if not menu.load_snapshot():
+            db_utils.bootstrap_menu_from_csv()
+            menu.refresh()
+    else:
+        # what every launch did before the fast path
+        db_utils.init_db(force=True)
+        db_utils.bootstrap_menu_from_csv()
+        menu = get_menu_cache()
+        menu.refresh()
+    menu.names()
+    if root is not None:
+        root.update()
+ready = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "ready_ms": (ready - start) * 1000,
+                  "window": root is not None}))
+"""
+
+
+@case
+def cold_start(args, tmp):
+    """Launch to first usable window, in a new process each time"""
+    fresh_db(tmp, "startup")
+    populate(make_menu(args.menu), 1000, args.lines)
+    db_path = str(db_utils.DB_PATH)
+    db_utils.get_pool().close_all()
+
+    def launch(mode: str) -> dict:
+        out = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, db_path, mode],
+                             cwd=APP_DIR, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    launch("fast")   # first launch writes the menu snapshot
+    runs = {mode: [launch(mode) for _ in range(7)] for mode in ("legacy", "fast")}
+    ready = {m: percentile([r["ready_ms"] for r in rs], 50) for m, rs in runs.items()}
+    return metric(ready["fast"], "ms", False, legacy_ms=ready["legacy"],
+                  import_ms=percentile([r["import_ms"] for r in runs["fast"]], 50),
+                  window=runs["fast"][0]["window"], menu=args.menu)
+
+
+# ------------------- Running & comparing -------------------
+def run(args) -> dict:
+    selected = args.only.split(",") if args.only else list(CASES)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_path = db_utils.DB_PATH
+        try:
+            for name in selected:
+                print(f"running {name} ...", file=sys.stderr)
+                r = CASES[name](args, Path(tmp))
+                if r is not None:
+                    results[name] = r
+        finally:
+            db_utils.configure_pool()
+            db_utils.DB_PATH = saved_path
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "params": {k: v for k, v in vars(args).items()
+                       if k in ("orders", "menu", "bills", "lines", "writers", "write_orders")},
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Human-readable regressions of current vs baseline"""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        cur = current["results"].get(name)
+        if cur is None or not base["value"]:
+            continue
+        change = (cur["value"] - base["value"]) / base["value"]
+        worse = -change if base["higher_is_better"] else change
+        status = "REGRESSION" if worse > tolerance else "ok"
+        print(f"{name:28s} {base['value']:14.2f} -> {cur['value']:14.2f} {cur['unit']:9s} "
+              f"{change:+7.1%}  {status}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Billing hot-path benchmarks")
+    parser.add_argument("--orders", type=int, default=100_000,
+                        help="orders in the reporting DB (use 1000000 for the full run)")
+    parser.add_argument("--menu", type=int, default=500, help="menu items")
+    parser.add_argument("--bills", type=int, default=50_000, help="bills for the totals cases")
+    parser.add_argument("--lines", type=int, default=4, help="average lines per order")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent save_order threads")
+    parser.add_argument("--write-orders", type=int, default=2000,
+                        help="orders written across all writers")
+    parser.add_argument("--only", help="comma-separated case names: " + ", ".join(CASES))
+    parser.add_argument("--out", type=Path, help="write results JSON here")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.20,
+                        help="allowed relative slowdown before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    current = run(args)
+    text = json.dumps(current, indent=2)
+    if args.out:
+        args.out.write_text(text)
+    else:
+        print(text)
+
+    if args.save_baseline:
+        args.baseline.write_text(text)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+    if args.baseline.exists():
+        regressions = compare(current, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
@@ -0,0 +1,338 @@
+"""
+Multi-process till simulator: several tills saving orders into one database.
+
+    python -m benchmarks.tills [--tills 4] [--rate 5] [--duration 20] [--readers 1]
+                               [--configs delete:full,wal:normal,wal:normal+batch20]
+                               [--busy-timeout MS] [--lock-retries N] [--db FILE] [--out FILE]
+
+Each till is its own process, like a real terminal. Orders arrive as a
+Poisson stream of --rate orders/s per till (a comma list gives each till
+its own rate). Lines are drawn from data/menu.csv with a few popular items
+and mostly single quantities, then priced and saved through save_order.
+Optional reader processes run the back-office sales report in a loop.
+
+A config is journal_mode[:synchronous][+batchN][+replica]. +batchN routes
+the tills through the write-behind writer (utils/order_writer.py) with
+batches of N orders. +replica points the readers at a snapshot replica
+(utils/replica.py) refreshed every --report-staleness seconds. Every config gets a fresh copy of the starting database (--db,
+or an empty one with the CSV menu), and the runs are printed side by side.
+
+Per transaction the tills record:
+    latency     save_order call time (write-behind: time until the batch committed)
+    lock wait   time until the write lock was held, including pool retries
+                (synchronous saves only; batches take the lock in the writer thread)
+    slip        how far behind the arrival schedule the till had fallen
+    failures    errors by message, e.g. "database is locked" once retries run out
+
+The database under db/ is never touched; every run works on a temp copy.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import db_utils
+from utils.calculator import BillItem, compute_totals
+from utils.importer import import_menu
+from utils.money import Money
+
+from .suite import metric, percentile
+
+DEFAULT_CONFIGS = "delete:full,wal:normal,wal:normal+batch20"
+MODES = [("Dine-In", 6), ("Takeaway", 3), ("Delivery", 1)]
+PAYMENTS = [("Cash", 5), ("UPI", 4), ("Card", 2)]
+
+
+@dataclass
+class Config:
+    name: str
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    batch: int = 0   # write-behind batch size; 0 saves each order synchronously
+    replica: bool = False   # readers use a snapshot replica
+
+    @classmethod
+    def parse(cls, spec: str) -> "Config":
+        """'wal', 'delete:full', 'wal:normal+batch20', 'delete:full+replica'"""
+        head, *extras = spec.split("+")
+        mode, _, sync = head.partition(":")
+        config = cls(spec, mode.upper(), (sync or "NORMAL").upper())
+        for extra in extras:
+            if extra.startswith("batch"):
+                config.batch = int(extra[5:])
+            elif extra == "replica":
+                config.replica = True
+            else:
+                raise ValueError(f"Unknown config option: +{extra}")
+        return config
+
+    def pool_options(self, busy_timeout_ms: int, lock_retries: int) -> dict:
+        return {"journal_mode": self.journal_mode, "synchronous": self.synchronous,
+                "busy_timeout_ms": busy_timeout_ms, "lock_retries": lock_retries}
+
+
+# ------------------- Order mix -------------------
+def load_menu(path: Path) -> List[Tuple[str, Money]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row["name"].strip(), Money(row["price"])) for row in csv.DictReader(f)
+                if row.get("name") and row.get("price")]
+
+
+class OrderMix:
+    """Random orders shaped like a restaurant's: a few popular dishes, 1-3 of each"""
+
+    def __init__(self, menu: List[Tuple[str, Money]], seed: int):
+        self.rng = random.Random(seed)
+        self.menu = menu
+        # Zipf-like popularity: the first rows of the menu sell the most
+        self.weights = [1 / (rank + 1) for rank in range(len(menu))]
+
+    def _pick(self, choices):
+        return self.rng.choices([c for c, _ in choices], [w for _, w in choices])[0]
+
+    def order(self):
+        n_lines = min(len(self.menu), 1 + int(self.rng.expovariate(1 / 2.5)))
+        picked = dict.fromkeys(self.rng.choices(self.menu, self.weights, k=n_lines))
+        items = [BillItem(name, self.rng.choice((1, 1, 1, 2, 2, 3)), price) for name, price in picked]
+        return self._pick(MODES), self._pick(PAYMENTS), items
+
+
+# ------------------- Processes -------------------
+@dataclass
+class TillResult:
+    till: int
+    orders: int = 0
+    latencies: List[float] = field(default_factory=list)
+    lock_waits: List[float] = field(default_factory=list)
+    slips: List[float] = field(default_factory=list)
+    failures: Dict[str, int] = field(default_factory=dict)
+    retries: int = 0
+
+
+def _setup(db_path: str, options: dict):
+    db_utils.DB_PATH = Path(db_path)
+    db_utils.configure_pool(**options)
+
+
+def _save(mode: str, payment: str, lines, t) -> float:
+    """save_order with the lock acquisition timed; returns seconds spent waiting for it"""
+    created_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    requested = time.perf_counter()
+    locked = requested
+
+    def write(con):
+        nonlocal locked
+        # the same write lock insert_order's first INSERT would take, made explicit to time it
+        con.execute("BEGIN IMMEDIATE")
+        locked = time.perf_counter()
+        return db_utils.insert_order(con.cursor(), mode, payment, lines, t["subtotal"], t["gst_amount"],
+                                     t["discount_amount"], t["total"], created_at)
+
+    db_utils.get_pool().run(write)
+    return locked - requested
+
+
+def run_till(till: int, db_path: str, options: dict, batch: int, batch_latency: float, menu,
+             rate: float, start_at: float, duration: float, seed: int, results):
+    _setup(db_path, options)
+    if batch:
+        db_utils.enable_write_behind(Path(db_path).with_name(f"till{till}.spool"),
+                                     batch_size=batch, max_latency=batch_latency)
+    mix = OrderMix(menu, seed)
+    result = TillResult(till)
+    pending = []
+    time.sleep(max(0.0, start_at - time.time()))
+    began = time.perf_counter()
+    due = began
+    while True:
+        due += mix.rng.expovariate(rate)
+        if due - began > duration:
+            break
+        time.sleep(max(0.0, due - time.perf_counter()))
+        mode, payment, items = mix.order()
+        t = compute_totals(items)
+        lines = [(i.name, i.qty, i.unit_price, i.line_total) for i in items]
+        started = time.perf_counter()
+        result.slips.append(started - due)
+        try:
+            if batch:
+                fut = db_utils.submit_order(mode, payment, lines, t["subtotal"], t["gst_amount"],
+                                            t["discount_amount"], t["total"])
+                fut.add_done_callback(lambda f, s=started: result.latencies.append(time.perf_counter() - s))
+                pending.append(fut)
+            else:
+                result.lock_waits.append(_save(mode, payment, lines, t))
+                result.latencies.append(time.perf_counter() - started)
+            result.orders += 1
+        except sqlite3.Error as e:
+            result.failures[str(e)] = result.failures.get(str(e), 0) + 1
+    if batch:
+        db_utils.disable_write_behind()
+        for fut in pending:
+            if fut.exception() is not None:
+                err = str(fut.exception())
+                result.failures[err] = result.failures.get(err, 0) + 1
+                result.orders -= 1
+    result.retries = db_utils.pool_stats()["lock_retries"]
+    results.put(result)
+
+
+def run_reader(reader: int, db_path: str, options: dict, staleness: Optional[float],
+               start_at: float, duration: float, results):
+    """Back office: the unaggregated sales report, over and over"""
+    _setup(db_path, options)
+    if staleness is not None:
+        db_utils.enable_replica(max_staleness=staleness, background=True)
+    result = TillResult(-1 - reader)
+    time.sleep(max(0.0, start_at - time.time()))
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        started = time.perf_counter()
+        try:
+            rows = db_utils.raw_sales_report("daily")
+            result.slips.append(rows.age)   # for readers: how stale the report was
+            result.latencies.append(time.perf_counter() - started)
+            result.orders += 1
+        except sqlite3.Error as e:
+            result.failures[str(e)] = result.failures.get(str(e), 0) + 1
+        time.sleep(0.05)
+    db_utils.disable_replica()
+    results.put(result)
+
+
+# ------------------- Runs -------------------
+def _ms(samples: List[float], pct: float) -> float:
+    return round(percentile(samples, pct) * 1000, 2)
+
+
+def summarize(config: Config, results: List[TillResult], duration: float) -> dict:
+    tills = [r for r in results if r.till >= 0]
+    readers = [r for r in results if r.till < 0]
+    lat = [x for r in tills for x in r.latencies]
+    waits = [x for r in tills for x in r.lock_waits]
+    slips = [x for r in tills for x in r.slips]
+    staleness = [x for r in readers for x in r.slips]
+    failures = Counter()
+    for r in results:
+        failures.update(r.failures)
+    orders = sum(r.orders for r in tills)
+    report = [x for r in readers for x in r.latencies]
+    return metric(orders / duration, "orders/s", True,
+                  config=config.name, orders=orders,
+                  p50_ms=_ms(lat, 50), p95_ms=_ms(lat, 95), p99_ms=_ms(lat, 99),
+                  max_ms=round(max(lat, default=0) * 1000, 2),
+                  lock_wait_p50_ms=_ms(waits, 50), lock_wait_p99_ms=_ms(waits, 99),
+                  lock_wait_max_ms=round(max(waits, default=0) * 1000, 2),
+                  slip_p99_ms=_ms(slips, 99),
+                  retries=sum(r.retries for r in tills),
+                  failures=dict(failures),
+                  reports=len(report), report_p99_ms=_ms(report, 99),
+                  report_age_max_s=round(max(staleness, default=0), 2))
+
+
+def prepare_db(path: Path, config: Config, args):
+    """Fresh database for one config: a copy of --db, or an empty one with the CSV menu"""
+    if args.db:
+        shutil.copy(args.db, path)
+    db_utils.DB_PATH = path
+    db_utils.configure_pool(**config.pool_options(args.busy_timeout, args.lock_retries))
+    db_utils.init_db()
+    import_menu(args.menu_csv, upsert=False)
+    db_utils.configure_pool()   # the parent holds no connection while the tills run
+
+
+def simulate(config: Config, args, tmp: Path) -> dict:
+    db_path = tmp / f"{config.name.replace(':', '_').replace('+', '_')}.db"
+    prepare_db(db_path, config, args)
+    options = config.pool_options(args.busy_timeout, args.lock_retries)
+    menu = load_menu(args.menu_csv)
+    rates = [float(r) for r in args.rate.split(",")]
+    # spawn, not fork: a till must not inherit the parent's SQLite handles
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    start_at = time.time() + 1.5 + 0.2 * (args.tills + args.readers)   # lets the processes import
+    procs = [ctx.Process(target=run_till,
+                         args=(i, str(db_path), options, config.batch, args.batch_latency, menu, rates[i % len(rates)],
+                               start_at, args.duration, args.seed + i, results))
+             for i in range(args.tills)]
+    staleness = args.report_staleness if config.replica else None
+    procs += [ctx.Process(target=run_reader,
+                          args=(i, str(db_path), options, staleness, start_at, args.duration, results))
+              for i in range(args.readers)]
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return summarize(config, collected, args.duration)
+
+
+def print_table(runs: List[dict]):
+    rows = [("orders/s", lambda r: f"{r['value']:.1f}"), ("orders", "orders"),
+            ("p50 ms", "p50_ms"), ("p95 ms", "p95_ms"), ("p99 ms", "p99_ms"), ("max ms", "max_ms"),
+            ("lock wait p50", "lock_wait_p50_ms"), ("lock wait p99", "lock_wait_p99_ms"),
+            ("lock wait max", "lock_wait_max_ms"), ("slip p99 ms", "slip_p99_ms"),
+            ("retries", "retries"), ("failures", lambda r: sum(r["failures"].values())),
+            ("reports", "reports"), ("report p99 ms", "report_p99_ms"),
+            ("report age max s", "report_age_max_s")]
+    width = max(22, *(len(r["config"]) + 2 for r in runs))
+    print(f"{'':16s}" + "".join(f"{r['config']:>{width}s}" for r in runs))
+    for label, key in rows:
+        cells = [key(r) if callable(key) else r[key] for r in runs]
+        print(f"{label:16s}" + "".join(f"{c!s:>{width}s}" for c in cells))
+    for r in runs:
+        for err, n in r["failures"].items():
+            print(f"{r['config']}: {n} x {err}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-process till contention simulator")
+    parser.add_argument("--tills", type=int, default=4, help="till processes")
+    parser.add_argument("--rate", default="5", help="orders/s per till, or a comma list per till")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per config")
+    parser.add_argument("--readers", type=int, default=1, help="processes running the sales report")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS,
+                        help="comma list of journal_mode[:synchronous][+batchN][+replica]")
+    parser.add_argument("--batch-latency", type=float, default=0.05,
+                        help="seconds a write-behind batch may wait to fill")
+    parser.add_argument("--report-staleness", type=float, default=2.0,
+                        help="max replica age in seconds for +replica configs")
+    parser.add_argument("--busy-timeout", type=int, default=db_utils.POOL_OPTIONS["busy_timeout_ms"],
+                        help="SQLite busy_timeout in ms")
+    parser.add_argument("--lock-retries", type=int, default=5, help="pool retries after 'database is locked'")
+    parser.add_argument("--db", type=Path, help="start from a copy of this database")
+    parser.add_argument("--menu-csv", type=Path, default=db_utils.MENU_CSV)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    configs = [Config.parse(spec) for spec in args.configs.split(",")]
+    saved_path, saved_options = db_utils.DB_PATH, dict(db_utils.POOL_OPTIONS)
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for config in configs:
+                print(f"running {config.name} ...", file=sys.stderr)
+                runs.append(simulate(config, args, Path(tmp)))
+        finally:
+            db_utils.configure_pool(**saved_options)
+            db_utils.DB_PATH = saved_path
+    print_table(runs)
+    if args.out:
+        args.out.write_text(json.dumps({"params": {k: str(v) for k, v in vars(args).items()},
+                                        "results": runs}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
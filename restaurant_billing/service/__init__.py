@@ -0,0 +1 @@
+# headless billing service (python -m service) and its client
\ No newline at end of file
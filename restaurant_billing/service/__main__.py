@@ -0,0 +1,17 @@
+import argparse
+import asyncio
+
+from .server import serve
+
+parser = argparse.ArgumentParser(description="Headless billing service (HTTP/JSON)")
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--dispatch", action="store_true",
+                    help="also run the WhatsApp outbox worker in this process")
+parser.add_argument("--report-staleness", type=float, metavar="SECONDS",
+                    help="serve reports from a replica refreshed at least this often")
+args = parser.parse_args()
+try:
+    asyncio.run(serve(args.host, args.port, args.dispatch, args.report_staleness))
+except KeyboardInterrupt:
+    pass
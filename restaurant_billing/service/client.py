@@ -0,0 +1,235 @@
+"""Thin HTTP client for the billing service, used by the Tk apps and the load test."""
+import http.client
+import json
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urlsplit
+
+from utils.cart import CartLine
+from utils.db_utils import ReportRows
+from utils.menu_cache import MenuItem
+from utils.money import Money
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+def _key() -> str:
+    """A fresh idempotency key: one per logical request, shared by its retry"""
+    return uuid.uuid4().hex
+
+
+class BillingClient:
+    """One keep-alive connection per thread to the billing service"""
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8765", timeout: float = 10.0):
+        url = urlsplit(base_url)
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port,
+                                                                 timeout=self.timeout)
+        return conn
+
+    def request(self, method: str, path: str, body: Optional[dict] = None,
+                idempotency_key: Optional[str] = None):
+        """
+        One request. A connection dropped mid-request is retried once for
+        GET/PUT/DELETE, and for a POST only with an idempotency_key, which
+        the service uses to answer a repeat with the first response.
+        """
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        if idempotency_key is not None:
+            headers["Idempotency-Key"] = idempotency_key
+        retry = method != "POST" or idempotency_key is not None
+        for attempt in (0, 1):
+            conn = self._conn()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                data = json.loads(resp.read() or b"{}")
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # server closed an idle keep-alive connection: reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt or not retry:
+                    raise
+        if resp.status >= 400:
+            raise ServiceError(resp.status, data.get("error", ""))
+        return data
+
+    # ------------------- Endpoints -------------------
+    def menu(self, prefix: str = "") -> List[MenuItem]:
+        data = self.request("GET", "/menu?" + urlencode({"prefix": prefix}))
+        return [MenuItem(i["id"], i["name"], i["category"], Money.of(i["price"]))
+                for i in data["items"]]
+
+    def menu_item(self, name: str) -> Optional[MenuItem]:
+        try:
+            i = self.request("GET", f"/menu/{quote(name, safe='')}")
+        except ServiceError as e:
+            if e.status == 404:
+                return None
+            raise
+        return MenuItem(i["id"], i["name"], i["category"], Money.of(i["price"]))
+
+    def new_cart(self, discount="auto") -> dict:
+        return self.request("POST", "/carts", {"discount": discount}, _key())
+
+    def cart(self, cart_id: int) -> dict:
+        return self.request("GET", f"/carts/{cart_id}")
+
+    def add_item(self, cart_id: int, name: str, qty: int, unit_price=None) -> dict:
+        body = {"name": name, "qty": qty}
+        if unit_price is not None:
+            body["unit_price"] = str(Money.of(unit_price))
+        return self.request("POST", f"/carts/{cart_id}/items", body, _key())
+
+    def set_qty(self, cart_id: int, name: str, qty: int, unit_price=None) -> dict:
+        body = {"qty": qty}
+        if unit_price is not None:
+            body["unit_price"] = str(Money.of(unit_price))
+        return self.request("PUT", f"/carts/{cart_id}/items/{quote(name, safe='')}", body)
+
+    def remove_item(self, cart_id: int, name: str) -> dict:
+        return self.request("DELETE", f"/carts/{cart_id}/items/{quote(name, safe='')}")
+
+    def delete_cart(self, cart_id: int) -> dict:
+        return self.request("DELETE", f"/carts/{cart_id}")
+
+    def checkout(self, cart_id: int, mode: str = "Dine-In", payment: str = "Cash",
+                 phone: str = "", bill: str = "") -> dict:
+        return self.request("POST", f"/carts/{cart_id}/checkout",
+                            {"mode": mode, "payment": payment, "phone": phone, "bill": bill}, _key())
+
+    def sales_report(self, period: str = "daily", start: str = None, end: str = None):
+        query = {"period": period, **{k: v for k, v in (("start", start), ("end", end)) if v}}
+        data = self.request("GET", "/reports/sales?" + urlencode(query))
+        return ReportRows([(r["period"], Money.of(r["total_sales"]), r["total_orders"]) for r in data["rows"]],
+                          data["source"], datetime.fromisoformat(data["as_of"]), data["age_seconds"])
+
+
+class RemoteMenu:
+    """The subset of MenuCache the Tk apps use, answered by the service"""
+
+    def __init__(self, client: BillingClient):
+        self.client = client
+        self._items: Dict[str, MenuItem] = {}
+
+    def refresh(self):
+        """Load the whole menu from the service"""
+        self._items = {i.name: i for i in self.client.menu()}
+
+    def load_snapshot(self) -> bool:
+        return False   # nothing local to start from: refresh() asks the service
+
+    def get(self, name: str) -> Optional[MenuItem]:
+        return self.client.menu_item(name)
+
+    def names(self) -> List[str]:
+        if not self._items:
+            self.refresh()
+        return list(self._items)
+
+    def search(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        names = [i.name for i in self.client.menu(prefix)]
+        return names if limit is None else names[:limit]
+
+
+class RemoteCart:
+    """
+    Drop-in for utils.cart.Cart whose state lives in the billing service.
+    Every edit is one request; the returned cart replaces the local mirror.
+    """
+
+    def __init__(self, client: BillingClient, discount="auto"):
+        self.client = client
+        self.discount = discount
+        self._listeners: List[Callable[[str, Optional[CartLine]], None]] = []
+        self._lines: Dict[str, CartLine] = {}
+        self._totals: Dict[str, Money] = {}
+        self._apply(client.new_cart(discount))
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _apply(self, data: dict):
+        self.cart_id = data["cart_id"]
+        new = {l["name"]: CartLine(l["name"], l["qty"], Money.of(l["unit_price"]))
+               for l in data["lines"]}
+        changed = [n for n, l in new.items()
+                   if n not in self._lines or self._lines[n].qty != l.qty]
+        removed = [n for n in self._lines if n not in new]
+        self._lines = new
+        self._totals = {k: Money.of(v) for k, v in data["totals"].items()}
+        for name in removed:
+            for listener in self._listeners:
+                listener(name, None)
+        for name in changed:
+            for listener in self._listeners:
+                listener(name, new[name])
+
+    # ------------------- Editing -------------------
+    def add(self, name: str, qty: int, unit_price=None):
+        self._apply(self.client.add_item(self.cart_id, name, qty, unit_price))
+        return self._lines[name]
+
+    def set_qty(self, name: str, qty: int, unit_price=None):
+        if qty <= 0 and name not in self._lines:
+            return None
+        self._apply(self.client.set_qty(self.cart_id, name, qty, unit_price))
+        return self._lines.get(name)
+
+    def remove(self, name: str):
+        self._apply(self.client.remove_item(self.cart_id, name))
+
+    def clear(self):
+        for name in list(self._lines):
+            self.remove(name)
+
+    def checkout(self, mode: str = "Dine-In", payment: str = "Cash",
+                 phone: str = "", bill: str = "") -> dict:
+        """Save the order; the service starts a fresh cart for the next customer"""
+        result = self.client.checkout(self.cart_id, mode, payment, phone, bill)
+        names = list(self._lines)
+        self._lines = {}
+        self._apply(self.client.new_cart(self.discount))
+        for name in names:
+            for listener in self._listeners:
+                listener(name, None)
+        return result
+
+    # ------------------- Reading -------------------
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return iter(list(self._lines.values()))
+
+    def __contains__(self, name: str):
+        return name in self._lines
+
+    def get(self, name: str) -> Optional[CartLine]:
+        return self._lines.get(name)
+
+    @property
+    def subtotal(self) -> Money:
+        return self._totals.get("subtotal", Money(0))
+
+    def totals(self) -> Dict[str, Money]:
+        return dict(self._totals)
+
+    def order_lines(self) -> List[Tuple[str, int, Money, Money]]:
+        return [l.as_tuple() for l in self._lines.values()]
@@ -0,0 +1,123 @@
+"""
+Load test for the billing service on localhost.
+
+    python -m service.loadtest [--url http://127.0.0.1:8765] [--tills 8] [--orders 200]
+    python -m service.loadtest --spawn      # start a private service on a temp DB first
+
+Each simulated till loops: new cart, add a few menu items, check out.
+Reports checkouts/s and p50/p99 latency per request type.
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from utils import db_utils
+
+from .client import BillingClient
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def spawn_service(port: int, **options):
+    """Run a BillingService on a temp DB in a background thread; returns a stop function"""
+    from .server import BillingService
+    db_utils.DB_PATH = Path(tempfile.mkdtemp()) / "loadtest.db"
+    loop = asyncio.new_event_loop()
+    service = BillingService(**options)
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(service.start("127.0.0.1", port))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(service.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    return stop
+
+
+def till(client: BillingClient, names: List[str], orders: int, seed: int,
+         timings: Dict[str, List[float]], lock: threading.Lock):
+    rng = random.Random(seed)
+    local: Dict[str, List[float]] = {"new_cart": [], "add_item": [], "checkout": []}
+
+    def timed(kind, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        local[kind].append(time.perf_counter() - start)
+        return result
+
+    for _ in range(orders):
+        cart_id = timed("new_cart", client.new_cart)["cart_id"]
+        for name in rng.sample(names, min(len(names), rng.randint(1, 5))):
+            timed("add_item", client.add_item, cart_id, name, rng.randint(1, 3))
+        timed("checkout", client.checkout, cart_id)
+    with lock:
+        for kind, samples in local.items():
+            timings.setdefault(kind, []).extend(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Billing service load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--tills", type=int, default=8, help="concurrent simulated tills")
+    parser.add_argument("--orders", type=int, default=200, help="orders per till")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start a private service on a temp DB (uses --url's port)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    client = BillingClient(args.url)
+    stop = spawn_service(client.port) if args.spawn else None
+    try:
+        names = [i.name for i in client.menu()]
+        if not names:
+            raise SystemExit("service has an empty menu")
+        timings: Dict[str, List[float]] = {}
+        lock = threading.Lock()
+        threads = [threading.Thread(target=till, args=(client, names, args.orders, s, timings, lock))
+                   for s in range(args.tills)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if stop is not None:
+            stop()
+
+    checkouts = len(timings.get("checkout", []))
+    result = {
+        "tills": args.tills,
+        "checkouts": checkouts,
+        "seconds": elapsed,
+        "checkouts_per_sec": checkouts / elapsed,
+        "latency_ms": {kind: {"p50": percentile(s, 50) * 1000, "p99": percentile(s, 99) * 1000}
+                       for kind, s in timings.items()},
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{checkouts} checkouts from {args.tills} tills in {elapsed:.2f}s "
+              f"({result['checkouts_per_sec']:.0f}/s)")
+        for kind, lat in result["latency_ms"].items():
+            print(f"  {kind:9s} p50 {lat['p50']:7.2f} ms   p99 {lat['p99']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Headless billing service: menu, cart, bill and report endpoints over HTTP/JSON.
+
+    python -m service [--host 127.0.0.1] [--port 8765] [--dispatch]
+
+One asyncio event loop serves every till. All database work runs on a
+single dedicated executor thread, and checkouts are group-committed
+through the write-behind OrderWriter, so concurrent bills share one
+transaction instead of queueing on SQLite's writer lock.
+
+Endpoints (money is sent as decimal strings, e.g. "12.50"):
+    GET    /health
+    GET    /menu[?prefix=Pa]
+    GET    /menu/{name}
+    POST   /carts                      {"discount": "auto" | <pct>}
+    GET    /carts/{id}
+    POST   /carts/{id}/items           {"name", "qty"[, "unit_price"]}
+    PUT    /carts/{id}/items/{name}    {"qty"[, "unit_price"]}
+    DELETE /carts/{id}/items/{name}
+    DELETE /carts/{id}
+    POST   /carts/{id}/checkout        {"mode", "payment"[, "phone", "bill"]}
+    GET    /reports/sales?period=daily[&start=YYYY-MM-DD&end=YYYY-MM-DD]
+
+Bodies are JSON objects; a missing or malformed field is a 400. 404 is kept
+for unknown carts, menu items and cart lines.
+
+A POST carrying an Idempotency-Key header is handled once: a repeat with
+the same key (a client retrying after a dropped connection) gets the first
+response, for the last IDEMPOTENCY_KEYS keys.
+"""
+import asyncio
+import itertools
+import json
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from utils import db_utils
+from utils.cart import Cart
+from utils.dispatch import DispatchWorker, enqueue_message
+from utils.menu_cache import MenuItem, get_menu_cache
+from utils.money import Money
+from utils.order_writer import OrderDeferred
+from utils.rules import CompiledRules, get_rules
+from utils.totals_cache import get_totals_cache
+
+MAX_BODY = 1 << 20
+IDEMPOTENCY_KEYS = 4096
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+_REQUIRED = object()
+
+
+def _field(data: dict, key: str, kind: type, default=_REQUIRED):
+    """data[key] checked against kind (str or int); a missing or malformed field is a 400"""
+    value = data.get(key)
+    if value is None or value == "":
+        if default is _REQUIRED:
+            raise HTTPError(400, f"missing field {key!r}")
+        return default
+    if kind is int and isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        value = int(value)
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise HTTPError(400, f"field {key!r} must be {'an integer' if kind is int else 'a string'}")
+    return value
+
+
+def _number(data: dict, key: str, parse):
+    """data[key] (a decimal string or number) through parse, e.g. Money.of or float"""
+    value = data[key]
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise HTTPError(400, f"field {key!r} must be a number")
+    try:
+        return parse(str(value))
+    except (ValueError, ArithmeticError):
+        raise HTTPError(400, f"field {key!r} must be a number, not {value!r}") from None
+
+
+def _menu_item(i: MenuItem) -> dict:
+    return {"id": i.id, "name": i.name, "category": i.category, "price": str(i.price)}
+
+
+def _cart_json(cart_id: int, cart: Cart, rules: CompiledRules) -> dict:
+    return {
+        "cart_id": cart_id,
+        "lines": [{"name": l.name, "qty": l.qty, "unit_price": str(l.unit_price),
+                   "line_total": str(l.line_total)} for l in cart],
+        "totals": {k: str(v) for k, v in cart.totals(rules=rules).items()},
+    }
+
+
+class BillingService:
+    def __init__(self, batch_size: int = 64, max_latency: float = 0.005, dispatch: bool = False,
+                 report_staleness: Optional[float] = None):
+        # every DB call goes through this one thread (and its pooled connection)
+        self.db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="billing-db")
+        # ... except reports when they are served from a replica (utils/replica.py),
+        # so a long report never queues in front of a checkout
+        self.report_staleness = report_staleness
+        self.reports = None
+        if report_staleness is not None:
+            self.reports = ThreadPoolExecutor(max_workers=1, thread_name_prefix="billing-reports")
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.dispatch = dispatch
+        self.menu = get_menu_cache()
+        self.carts: Dict[int, Cart] = {}
+        self._cart_ids = itertools.count(1)
+        self._dispatcher: Optional[DispatchWorker] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+        # Idempotency-Key -> future of the first response to it
+        self._replies: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.routes = [
+            ("GET", r"/health", self.health),
+            ("GET", r"/menu", self.list_menu),
+            ("GET", r"/menu/(?P<name>[^/]+)", self.get_menu_item),
+            ("POST", r"/carts", self.create_cart),
+            ("GET", r"/carts/(?P<cart_id>\d+)", self.get_cart),
+            ("DELETE", r"/carts/(?P<cart_id>\d+)", self.delete_cart),
+            ("POST", r"/carts/(?P<cart_id>\d+)/items", self.add_item),
+            ("PUT", r"/carts/(?P<cart_id>\d+)/items/(?P<name>[^/]+)", self.set_item_qty),
+            ("DELETE", r"/carts/(?P<cart_id>\d+)/items/(?P<name>[^/]+)", self.remove_item),
+            ("POST", r"/carts/(?P<cart_id>\d+)/checkout", self.checkout),
+            ("GET", r"/reports/sales", self.sales_report),
+        ]
+        self._compiled = [(m, re.compile(p + r"$"), h) for m, p, h in self.routes]
+
+    async def in_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.db, fn, *args)
+
+    async def in_reports(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.reports or self.db, fn, *args)
+
+    # ------------------- Lifecycle -------------------
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        def setup():
+            db_utils.init_db()
+            db_utils.bootstrap_menu_from_csv()
+            db_utils.enable_write_behind(batch_size=self.batch_size, max_latency=self.max_latency)
+            if self.report_staleness is not None:
+                db_utils.enable_replica(max_staleness=self.report_staleness, background=True)
+            self.menu.refresh()
+        await self.in_db(setup)
+        if self.dispatch:
+            self._dispatcher = DispatchWorker().start()
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # idle keep-alive connections would otherwise outlive the loop
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+        if self._dispatcher is not None:
+            self._dispatcher.stop(timeout=2)
+        await self.in_db(db_utils.disable_write_behind)
+        if self.reports is not None:
+            self.reports.shutdown()
+            await self.in_db(db_utils.disable_replica)
+        self.db.shutdown()
+
+    # ------------------- HTTP plumbing -------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {"error": "body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                key = headers.get("idempotency-key") if method == "POST" else None
+                if key:
+                    status, payload = await self._dispatch_once(key, method, target, body)
+                else:
+                    status, payload = await self._dispatch(method, target, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer, status: int, payload, close: bool = False):
+        body = json.dumps(payload).encode("utf-8")
+        reason = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+                  405: "Method Not Allowed", 413: "Payload Too Large"}.get(status, "Error")
+        head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch_once(self, key: str, method: str, target: str, body: bytes) -> Tuple[int, object]:
+        reply = self._replies.get(key)
+        if reply is not None:
+            self._replies.move_to_end(key)
+            return await asyncio.shield(reply)
+        reply = self._replies[key] = asyncio.get_running_loop().create_future()
+        if len(self._replies) > IDEMPOTENCY_KEYS:
+            self._replies.popitem(last=False)
+        try:
+            result = await self._dispatch(method, target, body)
+        except BaseException:
+            self._replies.pop(key, None)
+            reply.cancel()
+            raise
+        reply.set_result(result)
+        return result
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, object]:
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"error": "invalid JSON body"}
+        if not isinstance(data, dict):
+            return 400, {"error": "JSON body must be an object"}
+        path_matched = False
+        for m, pattern, handler in self._compiled:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            path_matched = True
+            if m != method:
+                continue
+            params = {k: unquote(v) for k, v in match.groupdict().items()}
+            try:
+                return await handler(data=data, query=query, **params)
+            except HTTPError as e:
+                return e.status, {"error": str(e)}
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                return 500, {"error": f"{type(e).__name__}: {e}"}
+        if path_matched:
+            return 405, {"error": "method not allowed"}
+        return 404, {"error": "no such endpoint"}
+
+    async def _rules(self) -> CompiledRules:
+        # the rule book may check rules_version/menu_version: keep that off the loop thread
+        return await self.in_db(get_rules)
+
+    async def _cart_response(self, cart_id, cart: Cart, status: int = 200):
+        return status, _cart_json(int(cart_id), cart, await self._rules())
+
+    def _cart(self, cart_id) -> Cart:
+        cart = self.carts.get(int(cart_id))
+        if cart is None:
+            raise HTTPError(404, f"no cart {cart_id}")
+        return cart
+
+    # ------------------- Handlers -------------------
+    async def health(self, data, query):
+        stats = await self.in_db(db_utils.pool_stats)
+        return 200, {"status": "ok", "carts": len(self.carts), "pool": stats,
+                     "totals_cache": get_totals_cache().stats_dict()}
+
+    async def list_menu(self, data, query):
+        def read():
+            prefix = query.get("prefix", "")
+            return [_menu_item(self.menu.get(n)) for n in self.menu.search(prefix)], self.menu.version
+        items, version = await self.in_db(read)
+        return 200, {"version": version, "items": items}
+
+    async def get_menu_item(self, data, query, name):
+        item = await self.in_db(self.menu.get, name)
+        if item is None:
+            raise HTTPError(404, f"'{name}' is not on the menu")
+        return 200, _menu_item(item)
+
+    async def create_cart(self, data, query):
+        # "auto" (or the older "bulk"): discounts from the pricing rules
+        discount = data.get("discount", "auto")
+        cart = Cart(discount=None if discount in ("auto", "bulk") else _number(data, "discount", float),
+                    cache=get_totals_cache())
+        cart_id = next(self._cart_ids)
+        self.carts[cart_id] = cart
+        return await self._cart_response(cart_id, cart, 201)
+
+    async def get_cart(self, data, query, cart_id):
+        return await self._cart_response(cart_id, self._cart(cart_id))
+
+    async def delete_cart(self, data, query, cart_id):
+        self._cart(cart_id)
+        del self.carts[int(cart_id)]
+        return 200, {"cart_id": int(cart_id), "deleted": True}
+
+    async def _price(self, name: str, data) -> Money:
+        # open items (not on the menu) must carry their own unit_price
+        if data.get("unit_price") is not None:
+            return _number(data, "unit_price", Money.of)
+        item = await self.in_db(self.menu.get, name)
+        if item is None:
+            raise HTTPError(404, f"'{name}' is not on the menu")
+        return item.price
+
+    async def add_item(self, data, query, cart_id):
+        cart = self._cart(cart_id)
+        name, qty = _field(data, "name", str), _field(data, "qty", int, 1)
+        price = cart.get(name).unit_price if name in cart else await self._price(name, data)
+        cart.add(name, qty, price)
+        return await self._cart_response(cart_id, cart)
+
+    async def set_item_qty(self, data, query, cart_id, name):
+        cart = self._cart(cart_id)
+        qty = _field(data, "qty", int)
+        price = None if name in cart or qty <= 0 else await self._price(name, data)
+        cart.set_qty(name, qty, price)
+        return await self._cart_response(cart_id, cart)
+
+    async def remove_item(self, data, query, cart_id, name):
+        cart = self._cart(cart_id)
+        if name not in cart:
+            raise HTTPError(404, f"'{name}' is not in cart {cart_id}")
+        cart.remove(name)
+        return await self._cart_response(cart_id, cart)
+
+    async def checkout(self, data, query, cart_id):
+        cart = self._cart(cart_id)
+        if not cart:
+            raise HTTPError(400, "cart is empty")
+        mode, payment = _field(data, "mode", str, "Dine-In"), _field(data, "payment", str, "Cash")
+        phone, bill = _field(data, "phone", str, "").strip(), _field(data, "bill", str, "")
+        # taken out before the first await, so a second checkout of the cart gets a 404
+        del self.carts[int(cart_id)]
+        try:
+            rules = await self._rules()
+            t = cart.totals(rules=rules)
+            lines = cart.order_lines()
+            # queued on the write-behind writer: concurrent checkouts share a transaction
+            fut = await self.in_db(db_utils.submit_order, mode, payment, lines, t["subtotal"],
+                                   t["gst_amount"], t["discount_amount"], t["total"])
+            order_id = await asyncio.wrap_future(fut)
+        except OrderDeferred:
+            raise   # still spooled, and written on the next start: the cart must not be billed again
+        except BaseException:
+            self.carts.setdefault(int(cart_id), cart)   # not billed: the till can try again
+            raise
+        result = {"order_id": order_id, **_cart_json(int(cart_id), cart, rules)}
+        if phone and bill:
+            result["outbox_id"] = await self.in_db(enqueue_message, phone, bill)
+        return 200, result
+
+    async def sales_report(self, data, query):
+        rows = await self.in_reports(db_utils.sales_report, query.get("period", "daily"),
+                                query.get("start"), query.get("end"))
+        return 200, {"rows": [{"period": k, "total_sales": str(v), "total_orders": n}
+                              for k, v, n in rows],
+                     "source": rows.source, "as_of": rows.as_of.isoformat(timespec="seconds"),
+                     "age_seconds": round(rows.age, 1)}
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8765, dispatch: bool = False,
+                report_staleness: Optional[float] = None):
+    service = BillingService(dispatch=dispatch, report_staleness=report_staleness)
+    server = await service.start(host, port)
+    print(f"Billing service on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
@@ -0,0 +1,58 @@
+"""
+Shared fixtures for the unit tests.
+
+    cd restaurant_billing && python -m unittest discover -s tests -t .
+
+Every test gets a fresh database in a temp directory; db/restaurant.db is
+never touched.
+"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from utils import db_utils, menu_cache, rules
+from utils.calculator import BillItem, compute_totals
+
+BILLING_DIR = Path(__file__).resolve().parents[1]
+
+
+class TempDBTestCase(unittest.TestCase):
+    """Points db_utils at an empty, initialised database for each test"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self._db_path = db_utils.DB_PATH
+        db_utils.DB_PATH = self.tmp / "restaurant.db"
+        # process-wide caches would otherwise carry menus and rules across databases
+        menu_cache._cache = rules._book = None
+        db_utils.init_db()
+
+    def tearDown(self):
+        db_utils.disable_write_behind()
+        db_utils.get_pool().close_all()
+        db_utils.DB_PATH = self._db_path
+        menu_cache._cache = rules._book = None
+        self._tmp.cleanup()
+
+    def query(self, sql, params=()):
+        return db_utils.get_conn().execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with db_utils.get_conn() as con:
+            con.execute(sql, params)
+
+    def add_menu(self, items):
+        """items: (name, category, price in rupees)"""
+        with db_utils.get_conn() as con:
+            con.executemany("INSERT INTO menu(name, category, price_paise) VALUES (?, ?, ?)",
+                            [(n, c, round(p * 100)) for n, c, p in items])
+
+    def add_order(self, created_at, lines, mode="Dine-In", payment="Cash"):
+        """Save an order of (name, qty, unit price in rupees) lines billed at created_at; returns its id"""
+        bill = [BillItem(name, qty, unit) for name, qty, unit in lines]
+        t = compute_totals(bill)
+        items = [(i.name, i.qty, i.unit_price, i.line_total) for i in bill]
+        with db_utils.get_conn() as con:
+            return db_utils.insert_order(con.cursor(), mode, payment, items, t["subtotal"],
+                                         t["gst_amount"], t["discount_amount"], t["total"], created_at)
@@ -0,0 +1,104 @@
+import random
+import unittest
+from datetime import date
+
+from utils import db_utils
+from utils.analytics import WEEKDAYS, month_partitions, run_analytics
+from utils.archive import archive_orders
+
+from .support import TempDBTestCase
+
+
+class ReplicaArchiveTest(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_menu([("Tea", "Beverages", 20), ("Thali", "Mains", 150)])
+        self.add_order("2024-01-08T09:15:00", [("Tea", 2, 20)])
+        self.add_order("2024-01-20T13:40:00", [("Thali", 1, 150), ("Tea", 1, 20)])
+        self.add_order("2024-02-05T19:05:00", [("Thali", 2, 150)])
+        archive_orders("2024-02-01")
+        self.assertEqual(self.query("SELECT COUNT(*) FROM orders")[0][0], 1)
+
+    def tearDown(self):
+        db_utils.disable_replica()
+        super().tearDown()
+
+    def test_archived_months_are_read_with_the_replica_on(self):
+        live = run_analytics(workers=1)
+        self.assertEqual(live.start, "2024-01-08")
+        self.assertEqual(live.basket()["orders"], 3)
+        db_utils.enable_replica()
+        replica = run_analytics(workers=1)
+        self.assertTrue(str(db_utils.report_db_path()).endswith(".replica.db"))
+        self.assertEqual(replica.to_dict(), live.to_dict())
+        self.assertEqual({name: units for name, units, _ in replica.top_items()}, {"Thali": 3, "Tea": 3})
+
+
+class PartitionTest(TempDBTestCase):
+    """Month-by-month scans merged together must equal one query over the whole range"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_menu([("Tea", "Beverages", 20), ("Thali", "Mains", 150), ("Samosa", "Snacks", 15),
+                       ("Lassi", "Beverages", 60)])
+        rand = random.Random(13)
+        names = ["Tea", "Thali", "Samosa", "Lassi", "Chef's special"]   # the last is an open item
+        for _ in range(120):
+            month, day, hour = rand.randint(1, 5), rand.randint(1, 28), rand.randint(8, 22)
+            created_at = f"2024-{month:02d}-{day:02d}T{hour:02d}:{rand.randint(0, 59):02d}:00"
+            lines = [(name, rand.randint(1, 3), rand.choice([15, 20, 60, 150]))
+                     for name in rand.sample(names, rand.randint(1, 3))]
+            self.add_order(created_at, lines)
+        self.execute("UPDATE menu SET name = 'Masala Tea' WHERE name = 'Tea'")   # reported as renamed
+        self.execute("DELETE FROM menu WHERE name = 'Lassi'")                     # reported as billed
+
+    def single_query(self, lo, hi):
+        con = db_utils.get_conn()
+        orders, revenue = con.execute("SELECT COUNT(*), SUM(total_paise) FROM orders "
+                                      "WHERE created_at >= ? AND created_at < ?", (lo, hi)).fetchone()
+        items = con.execute("""
+            SELECT COALESCE(m.name, oi.item_name), SUM(oi.qty), SUM(oi.line_total_paise)
+            FROM orders o JOIN order_items oi ON oi.order_id = o.id
+            LEFT JOIN menu m ON m.id = oi.menu_item_id
+            WHERE o.created_at >= ? AND o.created_at < ?
+            GROUP BY 1
+        """, (lo, hi)).fetchall()
+        grid = [[0] * 24 for _ in WEEKDAYS]
+        for weekday, hour, n in con.execute("""
+            SELECT (CAST(strftime('%w', created_at) AS INTEGER) + 6) % 7,
+                   CAST(substr(created_at, 12, 2) AS INTEGER), COUNT(*)
+            FROM orders WHERE created_at >= ? AND created_at < ? GROUP BY 1, 2
+        """, (lo, hi)):
+            grid[weekday][hour] = n
+        return orders, revenue, {name: (units, paise) for name, units, paise in items}, grid
+
+    def assertMatchesSingleQuery(self, report, lo, hi):
+        orders, revenue, items, grid = self.single_query(lo, hi)
+        self.assertEqual((report.data.orders, report.data.revenue), (orders, revenue))
+        self.assertEqual({name: (units, r.paise) for name, units, r in report.top_items(None)}, items)
+        self.assertEqual(report.heatmap(), grid)
+
+    def test_month_partitions_cover_the_range_once(self):
+        self.assertEqual(month_partitions(date(2024, 1, 15), date(2024, 3, 10)),
+                         [("2024-01-15", "2024-02-01"), ("2024-02-01", "2024-03-01"),
+                          ("2024-03-01", "2024-03-11")])
+        self.assertEqual(month_partitions(date(2024, 12, 5), date(2025, 1, 1)),
+                         [("2024-12-05", "2025-01-01"), ("2025-01-01", "2025-01-02")])
+
+    def test_merged_months_equal_one_query(self):
+        report = run_analytics(workers=1)
+        self.assertEqual((report.start[:7], report.end[:7]), ("2024-01", "2024-05"))
+        self.assertMatchesSingleQuery(report, "0000", "9999")
+        self.assertIn("Masala Tea", dict((n, u) for n, u, _ in report.top_items(None)))
+        self.assertIn("Lassi", dict((n, u) for n, u, _ in report.top_items(None)))
+
+    def test_date_range_cuts_months(self):
+        report = run_analytics("2024-02-10", "2024-04-20", workers=1)
+        self.assertMatchesSingleQuery(report, "2024-02-10", "2024-04-21")
+
+    def test_worker_processes_give_the_same_result(self):
+        self.assertEqual(run_analytics(workers=3).to_dict(top=None), run_analytics(workers=1).to_dict(top=None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import random
+import unittest
+import zlib
+from datetime import datetime, timedelta
+from unittest import mock
+
+from utils import archive, db_utils
+from utils.analytics import run_analytics
+
+from .support import TempDBTestCase
+
+MENU = [("Tea", "Beverages", 20), ("Coffee", "Beverages", 35), ("Thali", "Mains", 150),
+        ("Samosa", "Sides", 15)]
+ORDERS_SQL = """
+    SELECT id, mode, payment_method, subtotal_paise, gst_paise, discount_paise, total_paise, created_at
+    FROM orders ORDER BY id
+"""
+ITEMS_SQL = """
+    SELECT order_id, item_name, qty, unit_price_paise, line_total_paise, menu_item_id
+    FROM order_items ORDER BY id
+"""
+
+
+class ArchiveTestCase(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_menu(MENU)
+        rng = random.Random(14)
+        at = datetime(2024, 1, 1, 9, 0)
+        while at < datetime(2024, 3, 20):
+            lines = [(name, rng.randint(1, 3), price) for name, _, price in rng.sample(MENU, rng.randint(1, 3))]
+            if rng.random() < 0.1:
+                lines.append(("Chef special", 1, 99.5))   # open item, not on the menu
+            self.add_order(at.isoformat(timespec="seconds"), lines, payment=rng.choice(["Cash", "UPI"]))
+            at += timedelta(hours=rng.randint(3, 30), minutes=rng.randint(0, 59))
+
+    def reports(self):
+        return ({p: list(db_utils.raw_sales_report(p)) for p in db_utils.ROLLUPS},
+                {p: list(db_utils.sales_report(p)) for p in db_utils.ROLLUPS},
+                run_analytics(workers=1).to_dict())
+
+
+class RoundTripTest(ArchiveTestCase):
+    def test_rows_come_back_from_the_archive(self):
+        orders, items = self.query(ORDERS_SQL), self.query(ITEMS_SQL)
+        stats = archive.archive_orders("2024-03-01")
+        self.assertEqual([s.month for s in stats], ["2024-01", "2024-02"])
+        self.assertTrue(all(o[7] >= "2024-03" for o in self.query(ORDERS_SQL)))
+
+        archived_orders, archived_items = [], []
+        for month in archive.archived_months():
+            with archive.open_partition(month) as part:
+                self.assertEqual(part.meta["compression"], "zlib")
+                archived_orders += part.orders()
+                archived_items += part.items()
+        live = self.query(ORDERS_SQL)
+        self.assertEqual(sorted(archived_orders + live), sorted(orders))
+        live_ids = {o[0] for o in live}
+        self.assertEqual(sorted(archived_items + [i for i in items if i[0] in live_ids]),
+                         sorted(items))
+
+    def test_columns_are_compressed(self):
+        archive.archive_orders("2024-03-01")
+        with archive.open_partition("2024-01") as part:
+            raw = stored = 0
+            for name in part.meta["columns"]:
+                col = part.column(name)
+                self.assertEqual(len(col), part.n_orders if name.startswith("orders.") else part.n_lines)
+                raw += len(col) * col.itemsize
+                stored += (part.path / name).stat().st_size
+        self.assertLess(stored, raw)
+
+    def test_uncompressed_partitions_still_read(self):
+        archive.archive_orders("2024-03-01")
+        before = self.reports()
+        path = archive.archive_dir() / "2024-01"
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        for name in meta["columns"]:
+            (path / name).write_bytes(zlib.decompress((path / name).read_bytes()))
+        meta["format"] = 2
+        del meta["compression"]
+        (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        self.assertEqual(self.reports(), before)
+
+    def test_totals_match_before_and_after_archiving(self):
+        before = self.reports()
+        archive.archive_orders("2024-03-01")
+        self.assertEqual(self.reports(), before)
+        self.assertEqual(db_utils.check_rollups(), [])
+
+    def test_late_orders_merge_into_an_archived_month(self):
+        archive.archive_orders("2024-02-01")
+        late = self.add_order("2024-01-31T23:30:00", [("Tea", 4, 20)])
+        before = self.reports()
+        archive.archive_orders("2024-02-01")
+        self.assertEqual(self.reports(), before)
+        with archive.open_partition("2024-01") as part:
+            self.assertEqual(list(part.orders())[-1][0], late)
+
+
+class RecoverTest(ArchiveTestCase):
+    def test_crash_after_commit_promotes_the_new_partition(self):
+        before = self.reports()
+        with mock.patch.object(archive, "_swap", side_effect=OSError("crash")):
+            with self.assertRaises(OSError):
+                archive.archive_orders("2024-02-01")
+        self.assertEqual(archive.archived_months(), [])
+        archive.recover()
+        self.assertEqual(archive.archived_months(), ["2024-01"])
+        self.assertEqual(self.reports(), before)
+
+    def test_crash_before_commit_discards_the_copy(self):
+        before = self.reports()
+        pool = db_utils.get_pool()
+        with mock.patch.object(pool, "run", side_effect=OSError("crash")):
+            with self.assertRaises(OSError):
+                archive.archive_orders("2024-02-01")
+        self.assertTrue((archive.archive_dir() / "2024-01.tmp").exists())
+        archive.recover()
+        self.assertEqual(list(archive.archive_dir().iterdir()), [])
+        self.assertEqual(self.reports(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
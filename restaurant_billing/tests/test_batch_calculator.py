@@ -0,0 +1,108 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils import batch_calculator
+from utils.batch_calculator import compute_totals_batch
+from utils.calculator import BillItem, compute_totals
+from utils.money import Money, percent_of
+from utils.rules import CompiledRules, Rule, default_rules
+
+from .support import TempDBTestCase
+
+KEYS = ("subtotal", "gst_amount", "discount_amount", "total")
+NAMES = ["Tea", "Coffee", "Cola", "Burger", "Fries", "Thali", "Lassi", "Samosa"]
+CATEGORIES = {"Tea": "Beverages", "Coffee": "Beverages", "Cola": "Beverages", "Lassi": "Beverages",
+              "Burger": "Mains", "Thali": "Mains", "Fries": "Sides", "Samosa": "Sides"}
+# amounts whose 5%, 12.5% or 18% land exactly on half a paisa
+HALF_PAISA_PRICES = [10, 30, 50, 70, 90, 110, 4, 12, 36]
+
+SLAB_RULES = CompiledRules([
+    Rule("gst", 5.0),
+    Rule("gst", 18.0, category="Beverages"),
+    Rule("threshold", 10.0, above=Money.of(100)),
+    Rule("threshold", 12.5, above=Money.of(500)),
+    Rule("happy_hour", 20.0, category="Beverages", days=(0, 1, 2, 3), start="16:00", end="19:00"),
+    Rule("happy_hour", 5.0, start="22:00", end="01:00"),
+    Rule("combo", 15.0, items=("Burger", "Cola")),
+], CATEGORIES)
+
+
+class BatchParityTest(TempDBTestCase):
+    def carts(self, n, seed):
+        """n random carts of (name, qty, unit paise), with half-paisa edge prices mixed in"""
+        rng = random.Random(seed)
+        carts = []
+        for _ in range(n):
+            names = rng.sample(NAMES, rng.randint(1, 5))
+            carts.append([(name, rng.randint(1, 4),
+                           rng.choice(HALF_PAISA_PRICES) if rng.random() < 0.3 else rng.randint(1, 60000))
+                          for name in names])
+        return carts
+
+    def columns(self, carts):
+        rows = [(order_id, name, qty, price) for order_id, cart in enumerate(carts)
+                for name, qty, price in cart]
+        order_id, names, qty, price = zip(*rows)
+        return dict(qty=qty, unit_price_paise=price, order_id=order_id, item_name=names)
+
+    def assert_parity(self, carts, scalar, batch):
+        for key in KEYS:
+            expected = [scalar[i][key].paise for i in range(len(carts))]
+            self.assertEqual(batch[key].tolist(), expected, key)
+
+    def scalar(self, cart, *args, **kwargs):
+        return compute_totals([BillItem(n, q, Money(p)) for n, q, p in cart], *args, **kwargs)
+
+    def test_default_rules(self):
+        carts = self.carts(500, 1)
+        scalar = [self.scalar(c) for c in carts]
+        self.assert_parity(carts, scalar, compute_totals_batch(**self.columns(carts)))
+
+    def test_discount_per_order(self):
+        carts = self.carts(500, 2)
+        pcts = [random.Random(i).choice([0.0, 2.5, 5.0, 10.0, 12.5, 33.33]) for i in range(len(carts))]
+        scalar = [self.scalar(c, pct) for c, pct in zip(carts, pcts)]
+        self.assert_parity(carts, scalar, compute_totals_batch(discount_pct=pcts, **self.columns(carts)))
+
+    def test_gst_slabs_and_automatic_discounts(self):
+        carts = self.carts(1000, 3)
+        start = datetime(2024, 1, 1, 0, 0)   # a Monday
+        times = [start + timedelta(minutes=37 * i) for i in range(len(carts))]
+        scalar = [self.scalar(c, rules=SLAB_RULES, at=t, auto_discounts=True) for c, t in zip(carts, times)]
+        columns = self.columns(carts)
+        created_at = [times[i].isoformat() for i in columns["order_id"]]
+        batch = compute_totals_batch(rules=SLAB_RULES, created_at=created_at, auto_discounts=True, **columns)
+        self.assert_parity(carts, scalar, batch)
+
+    def test_manual_discount_on_top_of_automatic(self):
+        carts = self.carts(500, 4)
+        at = datetime(2024, 1, 1, 17, 0)   # a Monday, inside the Beverages happy hour
+        scalar = [self.scalar(c, 7.5, rules=SLAB_RULES, at=at, auto_discounts=True) for c in carts]
+        columns = self.columns(carts)
+        batch = compute_totals_batch(discount_pct=7.5, rules=SLAB_RULES, auto_discounts=True,
+                                     created_at=[at.isoformat()] * len(columns["qty"]), **columns)
+        self.assert_parity(carts, scalar, batch)
+
+    def test_half_up_rounding(self):
+        paise = np.array(HALF_PAISA_PRICES + [-10, -30, 0, 1, 99999])
+        for pct in (5.0, 12.5, 18.0, 0.5, 33.33):
+            with self.subTest(pct=pct):
+                self.assertEqual(batch_calculator.percent_of(paise, pct).tolist(),
+                                 [percent_of(int(p), pct) for p in paise])
+        self.assertEqual(percent_of(10, 5.0), 1)   # 0.5 paisa rounds up
+        self.assertEqual(percent_of(-10, 5.0), -1)  # ... and away from zero
+
+    def test_unsorted_order_ids(self):
+        carts = self.carts(50, 4)
+        columns = self.columns(carts)
+        perm = np.random.default_rng(5).permutation(len(columns["qty"]))
+        shuffled = {k: [v[i] for i in perm] for k, v in columns.items()}
+        scalar = [self.scalar(c, rules=default_rules()) for c in carts]
+        self.assert_parity(carts, scalar, compute_totals_batch(**shuffled))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from utils.calculator import BillItem, compute_totals
+from utils.money import Money
+from utils.rules import CompiledRules, Rule, get_rule_book
+
+from .support import TempDBTestCase
+
+BIG_BILL = [BillItem("Thali", 2, "150")]   # above the 100 threshold of the default rules
+
+
+class ComputeTotalsTest(TempDBTestCase):
+    """The seeded rules: 5% GST, 10% off bills above 100"""
+
+    def test_default_is_session_gst_without_automatic_discounts(self):
+        t = compute_totals(BIG_BILL)
+        self.assertEqual(compute_totals(BIG_BILL, None), t)
+        self.assertEqual(t, {"subtotal": Money.of(300), "gst_amount": Money.of(15),
+                             "discount_amount": Money(0), "total": Money.of(315)})
+
+    def test_explicit_discount(self):
+        t = compute_totals(BIG_BILL, 10.0)
+        self.assertEqual((t["discount_amount"], t["total"]), (Money.of(30), Money.of(285)))
+
+    def test_gst_follows_the_configured_slab(self):
+        self.execute("UPDATE pricing_rules SET percent = 12 WHERE kind = 'gst' AND category IS NULL")
+        get_rule_book().invalidate()
+        self.assertEqual(compute_totals(BIG_BILL)["gst_amount"], Money.of(36))
+
+    def test_rules_give_gst_slabs_without_discounts(self):
+        rules = CompiledRules([Rule("gst", 5.0), Rule("gst", 18.0, category="Drinks"),
+                               Rule("threshold", 10.0, above=Money.of(100))], {"Cola": "Drinks"})
+        t = compute_totals([BillItem("Cola", 1, "100"), BillItem("Bun", 1, "20")], rules=rules)
+        self.assertEqual((t["gst_amount"], t["discount_amount"]), (Money.of(19), Money(0)))
+
+
+class AutoDiscountTest(TempDBTestCase):
+    def test_auto_discounts_use_the_session_rules(self):
+        t = compute_totals(BIG_BILL, auto_discounts=True)
+        self.assertEqual((t["discount_amount"], t["total"]), (Money.of(30), Money.of(285)))
+
+    def test_auto_discounts_add_to_the_manual_discount(self):
+        t = compute_totals(BIG_BILL, 5.0, auto_discounts=True)
+        self.assertEqual(t["discount_amount"], Money.of(45))
+        self.assertEqual(compute_totals(BIG_BILL, 95.0, auto_discounts=True)["discount_amount"],
+                         Money.of(300))
+
+if __name__ == "__main__":
+    unittest.main()
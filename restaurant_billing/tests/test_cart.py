@@ -0,0 +1,100 @@
+import random
+import unittest
+
+from utils.cart import Cart
+from utils.money import Money
+from utils.rules import CompiledRules, Rule
+
+from .support import TempDBTestCase
+
+# 5% GST everywhere, 10% off above 100: every line is priced alike
+UNIFORM = CompiledRules([Rule("gst", 5.0), Rule("threshold", 10.0, above=Money.of(100))], {})
+# Drinks carry 18%, so the cart has to be priced line by line
+SLABS = CompiledRules([Rule("gst", 5.0), Rule("gst", 18.0, category="Drinks")], {"Cola": "Drinks"})
+
+
+class EditingTest(unittest.TestCase):
+    def setUp(self):
+        self.cart = Cart(rules=UNIFORM)
+        self.events = []
+        self.cart.add_listener(lambda name, line: self.events.append((name, line and line.qty)))
+
+    def test_add_merges_into_the_existing_line(self):
+        self.cart.add("Tea", 2, "20")
+        line = self.cart.add("Tea", 1, "25")   # keeps the price it was first added at
+        self.assertEqual((line.qty, line.unit_price, line.line_total), (3, Money.of(20), Money.of(60)))
+        self.assertEqual(len(self.cart), 1)
+        self.assertEqual(self.cart.subtotal, Money.of(60))
+        self.assertEqual(self.events, [("Tea", 2), ("Tea", 3)])
+        with self.assertRaises(ValueError):
+            self.cart.add("Tea", 0, "20")
+
+    def test_set_qty(self):
+        self.cart.set_qty("Tea", 2, "20")   # new items need a price
+        self.cart.set_qty("Tea", 5)
+        self.assertEqual(self.cart.subtotal, Money.of(100))
+        with self.assertRaises(KeyError):
+            self.cart.set_qty("Coffee", 1)
+        self.assertIsNone(self.cart.set_qty("Tea", 0))
+        self.assertNotIn("Tea", self.cart)
+        self.assertIsNone(self.cart.set_qty("Tea", 0))   # already gone: no event
+        self.assertEqual(self.events, [("Tea", 2), ("Tea", 5), ("Tea", None)])
+
+    def test_remove_and_clear(self):
+        self.cart.add("Tea", 2, "20")
+        self.cart.add("Samosa", 3, "15")
+        self.cart.remove("Tea")
+        self.assertEqual(self.cart.subtotal, Money.of(45))
+        with self.assertRaises(KeyError):
+            self.cart.remove("Tea")
+        self.cart.add("Coffee", 1, "30")
+        self.cart.clear()
+        self.assertEqual((len(self.cart), self.cart.subtotal), (0, Money(0)))
+        self.assertEqual(self.events, [("Tea", 2), ("Samosa", 3), ("Tea", None), ("Coffee", 1),
+                                       ("Samosa", None), ("Coffee", None)])
+        self.assertEqual(self.cart.totals()["total"], Money(0))
+
+    def test_order_lines(self):
+        self.cart.add("Tea", 2, "20")
+        self.assertEqual(self.cart.order_lines(), [("Tea", 2, Money.of(20), Money.of(40))])
+        self.assertEqual([(i.name, i.qty) for i in self.cart.items()], [("Tea", 2)])
+
+
+class IncrementalTotalsTest(unittest.TestCase):
+    def recomputed(self, cart, rules, discount):
+        lines = [(l.name, l.qty, l.unit_price.paise) for l in cart]
+        self.assertEqual(cart.subtotal.paise, sum(qty * unit for _, qty, unit in lines))
+        return rules.totals(lines, None, discount)
+
+    def test_running_totals_match_a_full_recompute(self):
+        rand = random.Random(9)
+        names = ["Tea", "Cola", "Samosa", "Thali", "Coffee"]
+        for rules in (UNIFORM, SLABS):
+            for discount in (None, 0.0, 12.5):
+                cart = Cart(discount=discount, rules=rules)
+                for step in range(300):
+                    name = rand.choice(names)
+                    op = rand.random()
+                    if op < 0.5:
+                        cart.add(name, rand.randint(1, 4), rand.choice(["20", "15.50", "149.99"]))
+                    elif op < 0.8:
+                        cart.set_qty(name, rand.randint(0, 6), "35")
+                    elif op < 0.95 and name in cart:
+                        cart.remove(name)
+                    else:
+                        cart.clear()
+                    with self.subTest(uniform=rules.uniform, discount=discount, step=step):
+                        self.assertEqual(cart.totals(), self.recomputed(cart, rules, discount))
+
+
+class SessionRulesTest(TempDBTestCase):
+    def test_cart_follows_the_database_rules(self):
+        cart = Cart()
+        cart.add("Tea", 6, "20")   # 120: 5% GST and 10% off above 100
+        t = cart.totals()
+        self.assertEqual((t["gst_amount"], t["discount_amount"], t["total"]),
+                         (Money.of(6), Money.of(12), Money.of(114)))
+
+
+if __name__ == "__main__":
+    unittest.main()
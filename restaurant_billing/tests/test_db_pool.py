@@ -0,0 +1,154 @@
+import gc
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from utils.db_pool import ConnectionPool
+
+
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close_all()
+        self._tmp.cleanup()
+
+    def pool(self, **options):
+        pool = ConnectionPool(Path(self._tmp.name) / "pool.db", **options)
+        self.pools.append(pool)
+        return pool
+
+    def in_thread(self, fn):
+        result = []
+        t = threading.Thread(target=lambda: result.append(fn()))
+        t.start()
+        t.join(10)
+        return result[0]
+
+
+class ReuseTest(PoolTestCase):
+    def test_one_connection_per_thread(self):
+        pool = self.pool()
+        con = pool.get()
+        self.assertTrue(all(pool.get() is con for _ in range(50)))
+        self.assertEqual(con.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        other = self.in_thread(pool.get)
+        self.assertIsNot(other, con)
+        stats = pool.stats_dict()
+        self.assertEqual((stats["checkouts"], stats["connections_opened"]), (52, 2))
+
+    def test_release_closes_and_the_next_get_reopens(self):
+        pool = self.pool()
+        con = pool.get()
+        pool.release()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            con.execute("SELECT 1")
+        self.assertIsNot(pool.get(), con)
+        self.assertEqual(pool.stats.connections_opened, 2)
+
+    def test_thread_exit_frees_its_slot(self):
+        pool = self.pool(max_connections=1, acquire_timeout=0.5)
+        self.in_thread(lambda: pool.get().execute("SELECT 1").fetchone())
+        gc.collect()
+        self.assertEqual(pool.stats_dict()["open_connections"], 0)
+        pool.get()   # the slot came back
+
+
+class CapTest(PoolTestCase):
+    def test_threads_beyond_max_connections_wait(self):
+        pool = self.pool(max_connections=2, acquire_timeout=0.2)
+        holding, done = threading.Barrier(3), threading.Event()
+
+        def hold():
+            pool.get()
+            holding.wait(10)
+            done.wait(10)
+            pool.release()
+
+        holders = [threading.Thread(target=hold) for _ in range(2)]
+        for t in holders:
+            t.start()
+        holding.wait(10)
+        try:
+            with self.assertRaisesRegex(sqlite3.OperationalError, "pool exhausted"):
+                pool.get()
+            self.assertEqual(pool.stats_dict()["open_connections"], 2)
+        finally:
+            done.set()
+            for t in holders:
+                t.join(10)
+        pool.acquire_timeout = 10
+        pool.get().execute("SELECT 1")
+        self.assertEqual(pool.stats.connections_opened, 3)
+
+    def test_waiter_gets_the_slot_a_thread_gives_back(self):
+        pool = self.pool(max_connections=1, acquire_timeout=10)
+        holding, done = threading.Event(), threading.Event()
+
+        def hold():
+            pool.get()
+            holding.set()
+            done.wait(10)
+            pool.release()
+
+        t = threading.Thread(target=hold)
+        t.start()
+        holding.wait(10)
+        threading.Timer(0.05, done.set).start()
+        pool.get()
+        t.join(10)
+        self.assertEqual(pool.stats.waits, 1)
+        self.assertGreater(pool.stats.wait_seconds, 0)
+
+
+class RunTest(PoolTestCase):
+    def test_lock_errors_are_retried(self):
+        pool = self.pool(retry_backoff=0.001)
+        calls = []
+
+        def write(con):
+            calls.append(1)
+            if len(calls) < 3:
+                raise sqlite3.OperationalError("database is locked")
+            con.execute("CREATE TABLE t(x)")
+            return "ok"
+
+        self.assertEqual(pool.run(write), "ok")
+        self.assertEqual((len(calls), pool.stats.lock_retries), (3, 2))
+
+    def test_other_errors_are_not_retried(self):
+        pool = self.pool(retry_backoff=0.001)
+        calls = []
+
+        def write(con):
+            calls.append(1)
+            raise sqlite3.OperationalError("no such table: t")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.run(write)
+        self.assertEqual((len(calls), pool.stats.lock_retries), (1, 0))
+
+    def test_lock_retries_give_up(self):
+        pool = self.pool(retry_backoff=0.001, lock_retries=2)
+
+        def write(con):
+            raise sqlite3.OperationalError("database is locked")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.run(write)
+        self.assertEqual(pool.stats.lock_retries, 2)
+
+    def test_bad_settings_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.pool(journal_mode="SIDEWAYS")
+        with self.assertRaises(ValueError):
+            self.pool(synchronous="SOMETIMES")
+
+
+if __name__ == "__main__":
+    unittest.main()
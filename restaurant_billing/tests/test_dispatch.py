@@ -0,0 +1,95 @@
+import sqlite3
+import time
+import unittest
+from unittest import mock
+
+from utils import dispatch
+from utils.dispatch import SENDING, SENT, DispatchWorker, FileSender, enqueue_message, outbox_status
+
+from .support import TempDBTestCase
+
+
+class DispatchWorkerTest(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender = FileSender(self.tmp / "sent.txt")
+        self.worker = DispatchWorker(self.sender, min_interval=0, base_backoff=0.01, max_backoff=0.05,
+                                     poll_interval=0.01)
+
+    def tearDown(self):
+        self.worker.stop(5)
+        super().tearDown()
+
+    def wait_for(self, outbox_id, status, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            row = outbox_status(outbox_id)
+            if row and row[0] == status:
+                return row
+            time.sleep(0.01)
+        self.fail(f"message {outbox_id} is {outbox_status(outbox_id)}, expected {status}")
+
+    def flaky(self, fn, failures):
+        calls = []
+
+        def wrapper(*args):
+            calls.append(args)
+            if len(calls) <= failures:
+                raise sqlite3.OperationalError("database is locked")
+            return fn(*args)
+        return wrapper, calls
+
+    def test_locked_database_does_not_kill_the_worker(self):
+        claim, calls = self.flaky(self.worker._claim, 3)
+        with mock.patch.object(self.worker, "_claim", claim), self.assertLogs(dispatch.__name__, "WARNING"):
+            self.worker.start()
+            outbox_id = self.worker.enqueue("+911234567890", "bill")
+            self.wait_for(outbox_id, SENT)
+        self.assertGreater(len(calls), 3)
+        self.assertTrue(self.worker._thread.is_alive())
+
+    def test_failed_status_update_is_retried(self):
+        finish, calls = self.flaky(self.worker._finish, 2)
+        with mock.patch.object(self.worker, "_finish", finish), self.assertLogs(dispatch.__name__, "WARNING"):
+            self.worker.start()
+            outbox_id = self.worker.enqueue("+911234567890", "bill")
+            self.wait_for(outbox_id, SENT)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.sender.calls, 1)   # recorded, not sent again
+
+    def test_failing_status_callback_is_logged(self):
+        def on_status(outbox_id, status, error):
+            raise RuntimeError("window closed")
+
+        self.worker.on_status = on_status
+        with self.assertLogs(dispatch.__name__, "WARNING") as logs:
+            self.worker.start()
+            first = self.worker.enqueue("+911234567890", "bill 1")
+            second = self.worker.enqueue("+911234567890", "bill 2")
+            self.wait_for(first, SENT)
+            self.wait_for(second, SENT)
+        self.assertIn("status callback: RuntimeError: window closed", logs.output[0])
+        self.assertTrue(self.worker._thread.is_alive())
+
+    def test_expired_claim_is_taken_over_while_running(self):
+        self.worker.start()
+        # as left by a worker that died mid-send, once its lease ran out
+        self.execute("""
+            INSERT INTO whatsapp_outbox(phone, message, status, attempts, next_attempt_at, created_at)
+            VALUES ('+911234567890', 'bill', ?, 1, ?, '2024-01-01T10:00:00')
+        """, (SENDING, time.time() - 1))
+        outbox_id = self.query("SELECT MAX(id) FROM whatsapp_outbox")[0][0]
+        _status, attempts, _error = self.wait_for(outbox_id, SENT)
+        self.assertEqual(attempts, 2)
+
+    def test_live_claim_is_left_alone(self):
+        outbox_id = enqueue_message("+911234567890", "bill")
+        self.execute("UPDATE whatsapp_outbox SET status = ?, next_attempt_at = ? WHERE id = ?",
+                     (SENDING, time.time() + 60, outbox_id))
+        self.worker.start()
+        time.sleep(0.1)
+        self.assertEqual(outbox_status(outbox_id)[0], SENDING)
+        self.assertEqual(self.sender.calls, 0)
+
+if __name__ == "__main__":
+    unittest.main()
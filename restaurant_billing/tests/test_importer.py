@@ -0,0 +1,121 @@
+import csv
+import unittest
+
+from utils import archive
+from utils.importer import import_orders
+
+from .support import TempDBTestCase
+
+FIELDS = ["order_ref", "created_at", "mode", "payment_method", "item_name", "qty", "unit_price"]
+
+
+class ImportOrdersTest(TempDBTestCase):
+    def write_csv(self, name, orders):
+        """orders: (ref, created_at, lines) with lines as (item, qty, unit_price)"""
+        path = self.tmp / name
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(FIELDS)
+            for ref, created_at, lines in orders:
+                for item, qty, price in lines:
+                    w.writerow([ref, created_at, "Dine-In", "Cash", item, qty, price])
+        return path
+
+    def test_ids_are_not_reused_after_archiving(self):
+        jan = self.write_csv("jan.csv", [(f"J{i}", f"2024-01-{i + 10}T12:00:00", [("Tea", 1, "10")])
+                                         for i in range(5)])
+        import_orders(jan)
+        archive.archive_orders("2024-02-01")
+        self.assertEqual(self.query("SELECT COUNT(*) FROM orders"), [(0,)])
+
+        feb = self.write_csv("feb.csv", [(f"F{i}", f"2024-02-{i + 10}T12:00:00",
+                                          [("Tea", 1, "10"), ("Coffee", 2, "25")]) for i in range(3)])
+        import_orders(feb)
+        self.assertEqual([r[0] for r in self.query("SELECT id FROM orders ORDER BY id")], [6, 7, 8])
+        self.assertEqual(self.query("SELECT COUNT(DISTINCT order_id) FROM order_events WHERE order_id <= 5"),
+                         [(5,)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM order_events WHERE order_id > 5"), [(6,)])
+
+        archive.archive_orders("2024-03-01")
+        with archive.open_partition("2024-02") as part:
+            self.assertEqual([o[0] for o in part.orders()], [6, 7, 8])
+            self.assertEqual(sorted(i[0] for i in part.items()), [6, 6, 7, 7, 8, 8])
+
+    def test_reimport_skips_orders_already_loaded(self):
+        path = self.write_csv("orders.csv", [("A1", "2024-03-01T09:00:00", [("Tea", 2, "10")]),
+                                             ("A2", "2024-03-01T10:00:00", [("Tea", 1, "10"),
+                                                                            ("Bun", 1, "15")])])
+        first = import_orders(path)
+        self.assertEqual((first.loaded, first.skipped), (3, 0))
+        again = import_orders(path, chunk_size=1)
+        self.assertEqual((again.loaded, again.skipped), (0, 3))
+        self.assertEqual(self.query("SELECT COUNT(*), SUM(total_paise) FROM orders"), [(2, 4725)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM order_items"), [(3,)])
+
+    def write_rows(self, name, fields, rows):
+        path = self.tmp / name
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            w.writerows(rows)
+        return path
+
+    def read_rejects(self, path):
+        return list(csv.DictReader(path.read_text(encoding="utf-8").splitlines()))
+
+    def stored(self):
+        return self.query("""
+            SELECT subtotal_paise, gst_paise, discount_paise, total_paise FROM orders ORDER BY id
+        """)
+
+    def test_charged_totals_are_stored_as_given(self):
+        fields = FIELDS + ["gst", "discount", "total"]
+        line = {"mode": "Dine-In", "payment_method": "Cash", "item_name": "Thali", "qty": 2,
+                "unit_price": "150"}
+        path = self.write_rows("charged.csv", fields, [
+            {**line, "order_ref": "H1", "created_at": "2019-06-01T13:00:00",
+             "gst": "36", "discount": "0", "total": "336"},
+            {**line, "order_ref": "H2", "created_at": "2019-06-01T14:00:00",
+             "gst": "15", "discount": "0", "total": "999"},
+        ])
+        stats = import_orders(path, rejects_path=self.tmp / "rejects.csv")
+        self.assertEqual((stats.loaded, stats.rejected), (1, 1))
+        self.assertEqual(self.stored(), [(30000, 3600, 0, 33600)])
+        rejects = self.read_rejects(self.tmp / "rejects.csv")
+        self.assertIn("does not match", rejects[0]["error"])
+
+    def test_without_totals_the_configured_rules_price_the_order(self):
+        self.execute("UPDATE pricing_rules SET percent = 12 WHERE kind = 'gst' AND category IS NULL")
+        path = self.write_rows("priced.csv", FIELDS + ["discount_pct"], [
+            {"order_ref": "P1", "created_at": "2024-03-01T09:00:00", "item_name": "Thali", "qty": 2,
+             "unit_price": "150"},
+            {"order_ref": "P2", "created_at": "2024-03-01T10:00:00", "item_name": "Thali", "qty": 2,
+             "unit_price": "150", "discount_pct": "5"},
+        ])
+        import_orders(path)
+        # 12% GST; the automatic 10% above 100, or the given 5% in its place
+        self.assertEqual(self.stored(), [(30000, 3600, 3000, 30600), (30000, 3600, 1500, 32100)])
+
+    def test_repeated_ref_further_down_the_file_is_rejected(self):
+        orders = [("A1", "2024-03-01T09:00:00", [("Tea", 2, "10")]),
+                  ("A2", "2024-03-01T10:00:00", [("Bun", 1, "15")]),
+                  ("A1", "2024-03-01T09:00:00", [("Coffee", 1, "25")])]
+        for chunk in (100, 1):
+            with self.subTest(chunk=chunk):
+                self.execute("DELETE FROM order_imports")
+                path = self.write_csv("split.csv", orders)
+                rejects = self.tmp / f"rejects-{chunk}.csv"
+                stats = import_orders(path, chunk_size=chunk, rejects_path=rejects)
+                self.assertEqual((stats.loaded, stats.skipped, stats.rejected), (2, 0, 1))
+                rows = self.read_rejects(rejects)
+                self.assertEqual([(r["order_ref"], r["item_name"]) for r in rows], [("A1", "Coffee")])
+                self.assertIn("repeated", rows[0]["error"])
+
+    def test_order_without_ref_is_rejected(self):
+        path = self.write_csv("noref.csv", [("", "2024-03-01T09:00:00", [("Tea", 1, "10")])])
+        stats = import_orders(path)
+        self.assertEqual((stats.loaded, stats.rejected), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
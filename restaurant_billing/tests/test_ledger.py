@@ -0,0 +1,108 @@
+import unittest
+from datetime import date
+from unittest import mock
+
+from utils import ledger
+from utils.ledger import LedgerError, LedgerView
+from utils.money import Money
+
+from .support import TempDBTestCase
+
+TODAY = date.today().isoformat()
+
+
+class LedgerTestCase(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        # Thali 2 x 150 = 300 + 5% GST: 315.00 paid
+        self.big = self.add_order(f"{TODAY}T09:30:00", [("Thali", 2, 150)], payment="Card")
+        # Tea 2 x 20 = 40 + 5% GST: 42.00 paid
+        self.small = self.add_order(f"{TODAY}T13:10:00", [("Tea", 2, 20)], payment="Cash")
+
+    def state(self):
+        return ledger.load_state(snapshot=False)
+
+
+class ReplayTest(LedgerTestCase):
+    def test_snapshot_plus_tail_equals_replay(self):
+        with mock.patch.object(ledger, "SNAPSHOT_EVERY", 3):
+            self.assertEqual(ledger.load_state()["seq"], 4)   # 4 events: a snapshot is written
+            self.assertEqual(self.query("SELECT seq FROM ledger_snapshots"), [(4,)])
+            ledger.void_order(self.small, "wrong table")
+            ledger.refund_order(self.big, "50")
+            ledger.add_item(self.big, "Lassi", 1, "40", paid="40", method="Cash")
+            self.add_order(f"{TODAY}T18:45:00", [("Samosa", 3, 15)])
+            self.assertEqual(ledger.load_state(), ledger.replay())
+            self.assertEqual(len(self.query("SELECT seq FROM ledger_snapshots")), 2)
+        self.assertEqual(self.state(), ledger.replay())
+        self.assertEqual(ledger.replay(until=4), ledger.replay(4))
+        self.assertEqual(ledger.verify(), [])
+
+    def test_view_applies_only_new_events(self):
+        view = LedgerView()
+        self.assertEqual(view.seq, 4)
+        ledger.void_order(self.small)
+        self.assertEqual(view.day(TODAY), ledger.day_totals(TODAY))
+        self.assertEqual(view.seq, 6)   # voided + refunded
+
+
+class PostSaleTest(LedgerTestCase):
+    def test_void_writes_off_the_bill_and_refunds_it(self):
+        before = ledger.day_totals(TODAY, self.state())
+        self.assertEqual((before["orders"], before["net_sales"], before["collected"]),
+                         (2, Money.of(357), Money.of(357)))
+        ledger.void_order(self.small, "wrong table")
+        after = ledger.day_totals(TODAY, self.state())
+        self.assertEqual((after["orders"], after["voided"], after["voids"]), (2, 1, Money.of(42)))
+        self.assertEqual((after["net_sales"], after["refunds"], after["collected"]),
+                         (Money.of(315), Money.of(42), Money.of(315)))
+        self.assertEqual(after["methods"], {"Card": Money.of(315), "Cash": Money(0)})
+        self.assertEqual(ledger.open_orders(self.state()), {})
+        with self.assertRaises(LedgerError):
+            ledger.void_order(self.small)
+
+    def test_partial_refund_leaves_the_sale_and_reduces_collections(self):
+        ledger.refund_order(self.big, "85")
+        totals = ledger.day_totals(TODAY, self.state())
+        self.assertEqual((totals["net_sales"], totals["collected"]), (Money.of(357), Money.of(272)))
+        self.assertEqual(totals["methods"]["Card"], Money.of(230))
+        self.assertEqual(ledger.open_orders(self.state()), {self.big: Money.of(85)})
+        with self.assertRaises(LedgerError):
+            ledger.refund_order(self.big, "500")
+
+    def test_added_item_raises_the_bill(self):
+        ledger.add_item(self.small, "Samosa", 2, "15")
+        self.assertEqual(ledger.open_orders(self.state()), {self.small: Money.of(30)})
+        ledger.void_order(self.small, refund=False)
+        totals = ledger.day_totals(TODAY, self.state())
+        self.assertEqual(totals["voids"], Money.of(72))
+        self.assertEqual(ledger.open_orders(self.state()), {self.small: Money.of(-42)})
+
+    def test_shift_totals(self):
+        ledger.void_order(self.small)
+        shifts = ledger.shift_totals(TODAY, self.state())
+        self.assertEqual(shifts["morning"]["sales"], Money.of(315))
+        self.assertEqual(shifts["afternoon"]["sales"], Money.of(42))
+        self.assertEqual(sum((s["voids"] for s in shifts.values()), Money(0)), Money.of(42))
+
+    def test_unknown_order(self):
+        with self.assertRaises(LedgerError):
+            ledger.void_order(999)
+
+
+class VerifyTest(LedgerTestCase):
+    def test_tampered_event_is_detected(self):
+        ledger.take_snapshot()
+        self.assertEqual(ledger.verify(), [])
+        self.execute("UPDATE order_events SET amount_paise = amount_paise + 100 WHERE seq = 3")
+        problems = ledger.verify()
+        self.assertTrue(any("snapshot at seq 4" in p for p in problems), problems)
+        self.assertTrue(any(p.startswith(TODAY) for p in problems), problems)
+
+    def test_event_missing_from_the_orders_table_is_detected(self):
+        self.execute("DELETE FROM order_events WHERE seq = 1")
+        self.assertTrue(any(p.startswith(TODAY) for p in ledger.verify()))
+
+
+if __name__ == "__main__":
+    unittest.main()
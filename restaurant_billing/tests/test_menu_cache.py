@@ -0,0 +1,90 @@
+import unittest
+from unittest import mock
+
+from utils import db_utils
+from utils.menu_cache import MenuCache
+from utils.money import Money
+
+from .support import TempDBTestCase
+
+MENU = [("Paneer Tikka", "Starters", 220), ("Pav Bhaji", "Mains", 140), ("paratha", "Breads", 40),
+        ("Masala Dosa", "Mains", 80), ("Tea", "Drinks", 20), ("Pasta", "Mains", 150)]
+
+
+class MenuCacheTestCase(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_menu(MENU)
+        self.cache = MenuCache(check_interval=0)
+
+
+class VersionTest(MenuCacheTestCase):
+    def test_every_menu_change_bumps_the_version(self):
+        version = db_utils.menu_version()
+        self.execute("INSERT INTO menu(name, category, price_paise) VALUES ('Coffee', 'Drinks', 3000)")
+        self.assertEqual(db_utils.menu_version(), version + 1)
+        self.execute("UPDATE menu SET price_paise = 2500 WHERE name = 'Tea'")
+        self.assertEqual(db_utils.menu_version(), version + 2)
+        self.execute("DELETE FROM menu WHERE name = 'Pasta'")
+        self.assertEqual(db_utils.menu_version(), version + 3)
+        self.execute("UPDATE menu SET price_paise = 2500 WHERE name = 'Nothing'")   # no row changed
+        self.assertEqual(db_utils.menu_version(), version + 3)
+
+    def test_cache_reloads_only_when_the_version_moves(self):
+        self.assertEqual(self.cache.price("Tea"), Money.of(20))
+        with mock.patch.object(db_utils, "fetch_menu", wraps=db_utils.fetch_menu) as fetch:
+            self.cache.price("Tea")
+            self.cache.search("pa")
+            fetch.assert_not_called()
+
+            self.execute("UPDATE menu SET price_paise = 2500 WHERE name = 'Tea'")
+            self.assertEqual(self.cache.price("Tea"), Money.of(25))
+            self.execute("INSERT INTO menu(name, category, price_paise) VALUES ('Coffee', 'Drinks', 3000)")
+            self.assertEqual(self.cache.by_category("Drinks")[0].name, "Coffee")
+            self.execute("DELETE FROM menu WHERE name = 'Pasta'")
+            self.assertIsNone(self.cache.get("Pasta"))
+            self.assertEqual(fetch.call_count, 3)
+        self.assertEqual(self.cache.version, db_utils.menu_version())
+
+    def test_version_is_checked_once_per_interval(self):
+        cache = MenuCache(check_interval=3600)
+        self.assertEqual(cache.price("Tea"), Money.of(20))
+        self.execute("UPDATE menu SET price_paise = 2500 WHERE name = 'Tea'")
+        self.assertEqual(cache.price("Tea"), Money.of(20))   # inside the interval
+        cache.invalidate()
+        self.assertEqual(cache.price("Tea"), Money.of(25))
+
+    def test_snapshot_starts_without_the_database(self):
+        path = self.tmp / "menu.json"
+        MenuCache(snapshot_path=path).refresh()
+        cache = MenuCache(check_interval=3600, snapshot_path=path)
+        with mock.patch.object(db_utils, "get_conn", side_effect=AssertionError("database used")):
+            self.assertTrue(cache.load_snapshot())
+            self.assertEqual(cache.price("Paneer Tikka"), Money.of(220))
+        self.assertFalse(MenuCache(snapshot_path=self.tmp / "missing.json").load_snapshot())
+
+
+class SearchTest(MenuCacheTestCase):
+    def test_prefix_search_is_case_insensitive_and_in_name_order(self):
+        self.assertEqual(self.cache.search("pa"), ["Paneer Tikka", "paratha", "Pasta", "Pav Bhaji"])
+        self.assertEqual(self.cache.search("PAV"), ["Pav Bhaji"])
+        self.assertEqual(self.cache.search("pa", limit=2), ["Paneer Tikka", "paratha"])
+        self.assertEqual(self.cache.search("x"), [])
+        self.assertEqual(len(self.cache.search("")), len(MENU))
+
+    def test_search_follows_menu_changes(self):
+        self.cache.search("pa")
+        self.execute("UPDATE menu SET name = 'Tandoori Paneer' WHERE name = 'Paneer Tikka'")
+        self.assertEqual(self.cache.search("pa"), ["paratha", "Pasta", "Pav Bhaji"])
+        self.assertEqual(self.cache.search("tan"), ["Tandoori Paneer"])
+
+    def test_lookups(self):
+        self.assertEqual(self.cache.categories(), ["Breads", "Drinks", "Mains", "Starters"])
+        self.assertEqual([i.name for i in self.cache.by_category("Mains")], ["Masala Dosa", "Pasta", "Pav Bhaji"])
+        self.assertEqual(self.cache.names()[:2], ["Masala Dosa", "Paneer Tikka"])
+        with self.assertRaises(KeyError):
+            self.cache.price("Pizza")
+
+
+if __name__ == "__main__":
+    unittest.main()
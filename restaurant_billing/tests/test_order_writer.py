@@ -0,0 +1,171 @@
+import json
+import sqlite3
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from utils import db_utils
+from utils.order_writer import OrderStalled, OrderWriter
+
+from .support import BILLING_DIR, TempDBTestCase
+
+# Queues orders tagged ref-0..ref-29 (payment_method) and waits to be killed:
+# ref-0..9 are committed, ref-10..29 go out in batches of 7, so at least the
+# last 6 are still queued when the parent kills it.
+CHILD = """
+import sys
+from pathlib import Path
+from utils import db_utils
+
+db_utils.DB_PATH = Path(sys.argv[1])
+
+def submit(i):
+    return db_utils.submit_order("Dine-In", f"ref-{i}", [("Tea", 1, "10", "10")],
+                                 "10", "0.50", "0", "10.50")
+
+db_utils.enable_write_behind(sys.argv[2], batch_size=50, max_latency=0.01)
+for i in range(10):
+    submit(i)
+db_utils.disable_write_behind()
+db_utils.enable_write_behind(sys.argv[2], batch_size=7, max_latency=60)
+for i in range(10, 30):
+    submit(i)
+print("queued", flush=True)
+sys.stdin.read()
+"""
+
+
+def order(ref, mode="Dine-In"):
+    return (mode, ref, [("Tea", 1, "10", "10")], "10", "0.50", "0", "10.50")
+
+
+class OrderWriterTest(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.spool = self.tmp / "orders.spool"
+
+    def open_writer(self, **options):
+        options.setdefault("max_latency", 0.01)
+        return db_utils.enable_write_behind(self.spool, **options)
+
+    def refs(self):
+        return dict(self.query("SELECT payment_method, COUNT(*) FROM orders GROUP BY payment_method"))
+
+    def crash_mid_queue(self):
+        proc = subprocess.Popen([sys.executable, "-c", CHILD, str(db_utils.DB_PATH), str(self.spool)],
+                                cwd=BILLING_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertEqual(proc.stdout.readline().strip(), "queued")
+        finally:
+            proc.kill()
+            proc.wait()
+            proc.stdin.close()
+            proc.stdout.close()
+
+    def test_crash_recovery_writes_every_order_once(self):
+        self.crash_mid_queue()
+        writer = self.open_writer()
+        self.assertGreaterEqual(writer.recovered, 6)
+        writer.flush()
+        expected = {f"ref-{i}": 1 for i in range(30)}
+        self.assertEqual(self.refs(), expected)
+
+        db_utils.disable_write_behind()
+        self.assertEqual(self.open_writer().recovered, 0)
+        self.assertEqual(self.refs(), expected)
+
+    def test_torn_spool_tail_does_not_hide_later_orders(self):
+        self.crash_mid_queue()
+        with open(self.spool, "a", encoding="utf-8") as f:
+            f.write('{"seq": 999, "mode": "Dine')   # crash mid-append
+        writer = self.open_writer()
+        later = writer.submit(*order("after-crash"))
+        writer.flush()
+        self.assertIsInstance(later.result(), int)
+        db_utils.disable_write_behind()
+        self.open_writer().flush()
+        self.assertEqual(self.refs(), {**{f"ref-{i}": 1 for i in range(30)}, "after-crash": 1})
+
+    def test_rejected_order_is_quarantined_and_not_replayed(self):
+        writer = self.open_writer(max_latency=0.5)
+        good = [writer.submit(*order(f"ok-{i}")) for i in range(3)]
+        bad = writer.submit(*order("bad", mode=None))   # orders.mode is NOT NULL
+        more = writer.submit(*order("ok-3"))
+        writer.flush()
+        self.assertTrue(all(isinstance(f.result(), int) for f in good + [more]))
+        with self.assertRaises(Exception):
+            bad.result()
+        self.assertEqual(writer.rejected, 1)
+        rejects = [json.loads(line) for line in writer.reject_path.read_text(encoding="utf-8").splitlines()]
+        self.assertEqual([r["entry"]["payment"] for r in rejects], ["bad"])
+        self.assertIn("IntegrityError", rejects[0]["error"])
+
+        db_utils.disable_write_behind()
+        self.assertEqual(self.open_writer().recovered, 0)
+        self.assertEqual(self.refs(), {f"ok-{i}": 1 for i in range(4)})
+
+    def fail_advance(self, writer, times):
+        """Make recording the committed seq fail `times` times with a non-lock error"""
+        real, calls = writer._advance, []
+
+        def advance(seq):
+            calls.append(seq)
+            if len(calls) <= times:
+                raise sqlite3.OperationalError("disk I/O error")
+            return real(seq)
+        return mock.patch.object(writer, "_advance", advance)
+
+    def test_stall_clears_once_the_rejected_order_is_passed_over(self):
+        writer = self.open_writer()
+        with self.fail_advance(writer, 1):
+            bad = writer.submit(*order("bad", mode=None))
+            writer.flush()
+            with self.assertRaises(sqlite3.IntegrityError):
+                bad.result()
+            later = writer.submit(*order("later"))
+            writer.flush()
+        self.assertIsInstance(later.result(), int)
+        self.assertIsNone(writer._stalled)
+        self.assertEqual(self.refs(), {"later": 1})
+
+    def test_orders_held_by_a_stall_are_written_when_it_clears(self):
+        writer = self.open_writer()
+        with self.fail_advance(writer, 2):
+            writer.submit(*order("bad", mode=None))
+            writer.flush()
+            held = writer.submit(*order("held"))
+            writer.flush()
+            with self.assertRaises(OrderStalled) as raised:
+                held.result()
+            self.assertIn("disk I/O error", str(raised.exception))
+            self.assertNotIn("at close", str(raised.exception))
+            self.assertEqual(self.refs(), {})
+            later = writer.submit(*order("later"))
+            writer.flush()
+        self.assertIsInstance(later.result(), int)
+        self.assertEqual(self.refs(), {"held": 1, "later": 1})
+
+        db_utils.disable_write_behind()
+        self.assertEqual(self.open_writer().recovered, 0)
+        self.assertEqual(self.refs(), {"held": 1, "later": 1})
+
+    def test_poisoned_spool_does_not_break_startup(self):
+        entry = {"seq": 1, "mode": None, "payment": "bad", "items": [], "subtotal": "0",
+                 "gst_amount": "0", "discount": "0", "total": "0", "created_at": "2024-01-01T10:00:00"}
+        self.spool.write_text(json.dumps(entry) + "\n", encoding="utf-8")
+        writer = OrderWriter(self.spool, max_latency=0.01)
+        try:
+            self.assertEqual(writer.recovered, 1)
+            writer.flush()
+            self.assertEqual(writer.rejected, 1)
+        finally:
+            writer.close()
+        writer = OrderWriter(self.spool, max_latency=0.01)
+        writer.close()
+        self.assertEqual(writer.recovered, 0)
+        self.assertEqual(self.refs(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
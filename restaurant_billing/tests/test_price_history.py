@@ -0,0 +1,80 @@
+import unittest
+
+from utils import db_utils
+from utils.money import Money
+
+from .support import TempDBTestCase
+
+
+class PriceHistoryTest(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_menu([("Tea", "Drinks", 20), ("Thali", "Mains", 150)])
+        self.tea = self.query("SELECT id FROM menu WHERE name = 'Tea'")[0][0]
+
+    def test_price_changes_close_the_previous_price(self):
+        self.execute("UPDATE menu SET price_paise = 2500 WHERE id = ?", (self.tea,))
+        self.execute("UPDATE menu SET category = 'Hot drinks' WHERE id = ?", (self.tea,))   # price unchanged
+        history = db_utils.price_history(self.tea)
+        self.assertEqual([price for price, _, _ in history], [Money.of(20), Money.of(25)])
+        (_, _, closed), (_, opened, still_open) = history
+        self.assertEqual(closed, opened)
+        self.assertIsNone(still_open)
+        self.execute("DELETE FROM menu WHERE id = ?", (self.tea,))
+        self.assertIsNotNone(db_utils.price_history(self.tea)[-1][2])
+
+    def test_fetch_menu_as_of_returns_the_price_at_that_time(self):
+        self.execute("UPDATE menu SET price_paise = 2500 WHERE id = ?", (self.tea,))
+        self.execute("UPDATE menu SET price_paise = 3000 WHERE id = ?", (self.tea,))
+        # pin the history to known times: 20.00 in January, 25.00 in February, 30.00 since March
+        rows = [r[0] for r in self.query("SELECT id FROM menu_price_history WHERE menu_item_id = ? ORDER BY id",
+                                         (self.tea,))]
+        for row, (lo, hi) in zip(rows, [("2025-01-01T00:00:00", "2025-02-01T00:00:00"),
+                                        ("2025-02-01T00:00:00", "2025-03-01T00:00:00"),
+                                        ("2025-03-01T00:00:00", None)]):
+            self.execute("UPDATE menu_price_history SET valid_from = ?, valid_to = ? WHERE id = ?", (lo, hi, row))
+        self.execute("UPDATE menu_price_history SET valid_from = '2024-06-01T00:00:00' "
+                     "WHERE menu_item_id != ?", (self.tea,))
+
+        def tea_price(as_of):
+            return {name: price for _, name, _, price in db_utils.fetch_menu(as_of)}.get("Tea")
+
+        self.assertEqual(tea_price("2025-01-15T12:00:00"), Money.of(20))
+        self.assertEqual(tea_price("2025-02-01T00:00:00"), Money.of(25))   # valid_from is inclusive
+        self.assertEqual(tea_price("2025-02-28T23:59:59"), Money.of(25))
+        self.assertEqual(tea_price("2025-06-01T00:00:00"), Money.of(30))
+        self.assertIsNone(tea_price("2024-12-31T23:59:59"))                # not on the menu yet
+        self.assertEqual(db_utils.fetch_menu("2025-01-15T12:00:00")[1][1:], ("Thali", "Mains", Money.of(150)))
+        self.assertEqual(tea_price(None), Money.of(30))
+
+    def test_prices_from_before_the_history_count_since_forever(self):
+        self.execute("DELETE FROM menu_price_history")
+        with db_utils.get_conn() as con:
+            db_utils.create_price_history(con.cursor())
+        self.assertEqual(db_utils.price_history(self.tea), [(Money.of(20), "0001-01-01T00:00:00", None)])
+        self.assertEqual(len(db_utils.fetch_menu("1999-01-01T00:00:00")), 2)
+
+
+class MenuItemIdTest(TempDBTestCase):
+    def test_order_lines_point_at_the_menu_item(self):
+        self.add_menu([("Tea", "Drinks", 20)])
+        tea = self.query("SELECT id FROM menu WHERE name = 'Tea'")[0][0]
+        order_id = self.add_order("2025-03-01T10:00:00", [("Tea", 2, 20), ("Chef's special", 1, 99)])
+        self.assertEqual(self.query("SELECT item_name, menu_item_id FROM order_items WHERE order_id = ? "
+                                    "ORDER BY id", (order_id,)),
+                         [("Tea", tea), ("Chef's special", None)])
+
+        # a rename keeps the link; the line keeps the name it was billed under
+        self.execute("UPDATE menu SET name = 'Masala Tea' WHERE id = ?", (tea,))
+        self.assertEqual(self.query("SELECT item_name, menu_item_id FROM order_items WHERE menu_item_id = ?",
+                                    (tea,)), [("Tea", tea)])
+        later = self.add_order("2025-03-02T10:00:00", [("Masala Tea", 1, 20)])
+        self.assertEqual(self.query("SELECT menu_item_id FROM order_items WHERE order_id = ?", (later,)),
+                         [(tea,)])
+        saved = db_utils.save_order("Takeaway", "Cash", [("Masala Tea", 1, "20", "20")], "20", "1", "0", "21")
+        self.assertEqual(self.query("SELECT menu_item_id FROM order_items WHERE order_id = ?", (saved,)),
+                         [(tea,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import json
+import unittest
+import zipfile
+
+from utils.cart import Cart
+from utils.money import Money
+from utils.receipts import (Receipt, THERMAL_WIDTHS, export_receipt, export_receipts, load_receipt,
+                            render)
+from utils.rules import CompiledRules, Rule
+
+from .support import TempDBTestCase
+
+# Tea 2 x 20 + Samosa 1 x 15.50 = 55.50 + 5% GST 2.78 = 58.28
+RECEIPT = Receipt([("Tea", 2, 2000, 4000), ("Samosa", 1, 1550, 1550)], 5550, 278, 0, 5828,
+                  created_at="2025-03-01T12:30:00", order_id=7)
+
+
+class TemplateTest(unittest.TestCase):
+    def test_whatsapp_matches_the_message_customers_get(self):
+        self.assertEqual(render(RECEIPT, "whatsapp"),
+                         "🧾 *Restaurant Bill* 🧾\n\nTea x2 = 40.00\nSamosa x1 = 15.50\n\n"
+                         "Subtotal: 55.50\nGST: 2.78\nDiscount: 0.00\n*Total: 58.28*")
+
+    def test_text_columns(self):
+        lines = render(RECEIPT, "text").splitlines()
+        self.assertEqual(lines[:2], ["Restaurant Bill #7", "2025-03-01 12:30:00"])
+        self.assertEqual(lines[4], f"{'Tea':<20}{2:>5}{'20.00':>10}{'40.00':>11}")
+        self.assertEqual(lines[-4:], [f"{'Subtotal:':<35}{'55.50':>11}", f"{'GST:':<35}{'2.78':>11}",
+                                      f"{'Discount:':<35}{'0.00':>11}", f"{'Total:':<35}{'58.28':>11}"])
+
+    def test_negative_amounts_keep_their_sign(self):
+        refund = Receipt([("Tea", -1, 2000, -2000)], -2000, -100, 0, -2100)
+        self.assertIn("-21.00", render(refund, "text"))
+
+    def test_thermal_fits_the_paper_and_wraps_long_names(self):
+        long = Receipt([("Paneer Butter Masala with Extra Gravy", 3, 18000, 54000)],
+                       54000, 2700, 0, 56700, created_at="2025-03-01T12:30:00", order_id=8)
+        for width in THERMAL_WIDTHS:
+            with self.subTest(width=width):
+                lines = render(long, "thermal", width).splitlines()
+                self.assertTrue(all(len(l) <= width for l in lines))
+                self.assertIn("-" * width, lines)
+                rules = [i for i, l in enumerate(lines) if l == "-" * width]
+                item = lines[rules[0] + 1:rules[1]]   # the name wraps above its amount
+                self.assertTrue(len(item) > 1 and item[0].startswith("Paneer Butter Masala"))
+                self.assertTrue(item[-1].startswith("  ") and item[-1].endswith(" 540.00"))
+                self.assertEqual(lines[rules[1] + 1], f"{'Subtotal':<{width - 11}}{'540.00':>11}")
+                self.assertTrue(lines[-2].startswith("TOTAL") and lines[-2].endswith("567.00"))
+
+    def test_thermal_rejects_narrow_paper(self):
+        with self.assertRaises(ValueError):
+            render(RECEIPT, "thermal", 20)
+
+    def test_json_amounts_are_exact_strings(self):
+        data = json.loads(render(Receipt(RECEIPT.lines, RECEIPT.subtotal, RECEIPT.gst, 0, RECEIPT.total,
+                                         order_id=7, extra={"table": 4}), "json"))
+        self.assertEqual(data["items"][1], {"name": "Samosa", "qty": 1, "unit_price": "15.50",
+                                            "line_total": "15.50"})
+        self.assertEqual(data["totals"], {"subtotal": "55.50", "gst_amount": "2.78",
+                                          "discount_amount": "0.00", "total": "58.28"})
+        self.assertEqual((data["order_id"], data["table"]), (7, 4))
+
+    def test_unknown_template(self):
+        with self.assertRaises(ValueError):
+            render(RECEIPT, "fax")
+
+
+class FromCartTest(TempDBTestCase):
+    def test_bill_shows_the_gst_rate_from_the_rules(self):
+        cart = Cart(discount=0)
+        cart.add("Tea", 2, "20")
+        receipt = Receipt.from_cart(cart)
+        self.assertEqual(receipt.gst_percent, 5.0)
+        self.assertIn(f"{'GST (5.0%):':<35}{'2.00':>11}", render(receipt, "text"))
+        self.assertIn("\nGST: 2.00\n", render(receipt, "whatsapp"))
+
+    def test_mixed_slabs_show_no_single_rate(self):
+        rules = CompiledRules([Rule("gst", 5.0), Rule("gst", 18.0, category="Drinks")], {"Cola": "Drinks"})
+        cart = Cart(rules=rules)
+        cart.add("Cola", 1, "100")
+        self.assertEqual(Receipt.from_cart(cart).gst_percent, 18.0)
+        cart.add("Bun", 1, "20")
+        receipt = Receipt.from_cart(cart)
+        self.assertIsNone(receipt.gst_percent)
+        self.assertIn(f"{'GST:':<35}{'19.00':>11}", render(receipt, "text"))
+
+
+class ExportTest(TempDBTestCase):
+    def test_export_receipt_never_overwrites(self):
+        paths = [export_receipt(RECEIPT, self.tmp / "bills") for _ in range(3)]
+        self.assertEqual([p.name for p in paths], ["bill-7.json", "bill-7-2.json", "bill-7-3.json"])
+        text = export_receipt(RECEIPT, self.tmp / "bills", "text")
+        self.assertEqual(text.name, "bill-7.txt")
+        self.assertEqual(json.loads(paths[0].read_text(encoding="utf-8"))["totals"]["total"], "58.28")
+
+    def add_days(self):
+        first = self.add_order("2025-03-01T10:00:00", [("Tea", 2, 20)])
+        second = self.add_order("2025-03-01T19:00:00", [("Thali", 1, 150)])
+        third = self.add_order("2025-03-02T09:00:00", [("Coffee", 1, 30)])
+        self.add_order("2025-03-03T09:00:00", [("Tea", 1, 20)])   # outside [start, end)
+        return first, second, third
+
+    def test_ndjson_one_file_per_day(self):
+        first, second, third = self.add_days()
+        stats = export_receipts(self.tmp / "out", "2025-03-01", "2025-03-03")
+        self.assertEqual(stats.orders, 3)
+        self.assertEqual([p.name for p in stats.files],
+                         ["receipts-2025-03-01.ndjson", "receipts-2025-03-02.ndjson"])
+        day1 = [json.loads(l) for l in stats.files[0].read_text(encoding="utf-8").splitlines()]
+        self.assertEqual([r["order_id"] for r in day1], [first, second])
+        self.assertEqual(day1[0]["totals"]["total"], "42.00")
+        self.assertEqual(day1[0]["items"], [{"name": "Tea", "qty": 2, "unit_price": "20.00",
+                                             "line_total": "40.00"}])
+
+    def test_zip_holds_one_rendered_receipt_per_order(self):
+        first, second, third = self.add_days()
+        stats = export_receipts(self.tmp / "out", "2025-03-01", "2025-03-03", fmt="zip")
+        self.assertEqual([p.name for p in stats.files],
+                         ["receipts-2025-03-01.zip", "receipts-2025-03-02.zip"])
+        with zipfile.ZipFile(stats.files[0]) as z:
+            self.assertEqual(z.namelist(), [f"order-{first}.txt", f"order-{second}.txt"])
+            body = z.read(f"order-{second}.txt").decode("utf-8")
+        self.assertEqual(body, render(load_receipt(second), "thermal") + "\n")
+        self.assertIn("157.50", body)
+
+    def test_ndjson_needs_the_json_template(self):
+        with self.assertRaises(ValueError):
+            export_receipts(self.tmp / "out", fmt="ndjson", template="thermal")
+
+
+if __name__ == "__main__":
+    unittest.main()
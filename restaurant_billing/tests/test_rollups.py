@@ -0,0 +1,68 @@
+import unittest
+
+from utils import db_utils
+from utils.money import Money
+
+from .support import TempDBTestCase
+
+# Sunday 2025-03-02 ends week W08; the month turns over on the 1st
+ORDERS = [
+    ("2025-02-27T12:00:00", [("Thali", 1, 150)]),
+    ("2025-02-28T20:30:00", [("Tea", 3, 20)]),
+    ("2025-03-01T09:15:00", [("Coffee", 2, 30), ("Samosa", 4, 15)]),
+    ("2025-03-02T13:00:00", [("Thali", 2, 150)]),
+    ("2025-03-02T21:45:00", [("Tea", 1, 20)]),
+    ("2025-03-03T08:00:00", [("Coffee", 1, 30)]),
+    ("2025-04-10T19:00:00", [("Thali", 3, 150)]),
+]
+
+
+class RollupTest(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        for created_at, lines in ORDERS:
+            self.add_order(created_at, lines)
+
+    def test_trigger_maintained_rollups_match_the_raw_report(self):
+        for period in db_utils.ROLLUPS:
+            with self.subTest(period=period):
+                self.assertEqual(list(db_utils.sales_report(period)), list(db_utils.raw_sales_report(period)))
+        self.assertEqual(db_utils.check_rollups(), [])
+
+    def test_rollup_rows(self):
+        self.assertEqual(db_utils.sales_report("monthly"),
+                         [("2025-02", Money.of(220.50), 2), ("2025-03", Money.of(493.50), 4),
+                          ("2025-04", Money.of(472.50), 1)])
+        self.assertEqual([k for k, _, _ in db_utils.sales_report("weekly")],
+                         ["2025-W08", "2025-W09", "2025-W14"])
+        daily = dict((k, n) for k, _, n in db_utils.sales_report("daily"))
+        self.assertEqual(daily["2025-03-02"], 2)
+
+    def test_date_ranges_match_the_raw_report(self):
+        for period in db_utils.ROLLUPS:
+            for start, end in (("2025-02-28", "2025-03-02"), ("2025-03-02", None), (None, "2025-03-01"),
+                               ("2025-03-04", "2025-04-09")):
+                with self.subTest(period=period, start=start, end=end):
+                    self.assertEqual(list(db_utils.sales_report(period, start, end)),
+                                     list(db_utils.raw_sales_report(period, start, end)))
+
+    def test_check_rollups_finds_drift(self):
+        # a rollup edited by hand, and an order deleted behind the trigger's back
+        self.execute("UPDATE sales_daily SET total_orders = total_orders + 1 WHERE period_key = '2025-03-01'")
+        self.execute("DELETE FROM orders WHERE created_at LIKE '2025-04-10%'")
+        drift = {(p, k): (a, b) for p, k, a, b in db_utils.check_rollups()}
+        self.assertEqual(set(drift), {("daily", "2025-03-01"), ("daily", "2025-04-10"),
+                                      ("weekly", "2025-W14"), ("monthly", "2025-04")})
+        self.assertEqual(drift[("daily", "2025-03-01")],
+                         (("2025-03-01", Money.of(126), 2), ("2025-03-01", Money.of(126), 1)))
+        self.assertIsNone(drift[("monthly", "2025-04")][1])
+        self.assertEqual(db_utils.check_rollups("weekly"), [("weekly", "2025-W14",
+                                                             ("2025-W14", Money.of(472.50), 1), None)])
+
+        db_utils.rebuild_rollups()
+        self.assertEqual(db_utils.check_rollups(), [])
+        self.assertEqual(db_utils.sales_report("monthly")[-1], ("2025-03", Money.of(493.50), 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
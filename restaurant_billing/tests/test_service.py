@@ -0,0 +1,245 @@
+import asyncio
+import http.client
+import socket
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from service.client import BillingClient, RemoteMenu, ServiceError
+from service.server import BillingService
+from utils import db_utils, rules
+
+from .support import TempDBTestCase
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServiceTestCase(TempDBTestCase):
+    """A BillingService on the test database, served from a background event loop"""
+    service_options = {"max_latency": 0.001}
+
+    def setUp(self):
+        super().setUp()
+        self.port = free_port()
+        self.loop = asyncio.new_event_loop()
+        self.service = BillingService(**self.service_options)
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.service.start("127.0.0.1", self.port))
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait(10)
+        self.client = BillingClient(f"http://127.0.0.1:{self.port}")
+
+    def tearDown(self):
+        conn = getattr(self.client._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        asyncio.run_coroutine_threadsafe(self.service.stop(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(10)
+        self.loop.close()
+        super().tearDown()
+
+
+class RemoteMenuTest(ServiceTestCase):
+    def test_menu_comes_from_the_service(self):
+        expected = [name for _, name, _, _ in db_utils.fetch_menu()]
+        self.assertTrue(expected)
+        menu = RemoteMenu(self.client)
+        menu.refresh()
+        self.assertEqual(menu.names(), expected)
+        self.assertEqual(menu.get(expected[0]).name, expected[0])
+
+
+class DatabaseThreadTest(ServiceTestCase):
+    def test_cart_requests_touch_the_database_only_on_the_db_thread(self):
+        rules._book = rules.RuleBook(check_interval=0)   # look up rules_version on every request
+        name = db_utils.fetch_menu()[0][1]
+        threads = set()
+        get_pool = db_utils.get_pool
+
+        def recording_get_pool():
+            threads.add(threading.current_thread().name)
+            return get_pool()
+
+        with mock.patch.object(db_utils, "get_pool", recording_get_pool):
+            cart_id = self.client.new_cart()["cart_id"]
+            self.client.add_item(cart_id, name, 3)
+            self.client.set_qty(cart_id, name, 2)
+            self.client.cart(cart_id)
+            order = self.client.checkout(cart_id)
+        self.assertIsInstance(order["order_id"], int)
+        # the executor and the write-behind writer, never the event loop
+        self.assertIn("billing-db_0", threads)
+        self.assertNotIn(self.thread.name, threads)
+
+    def test_cart_totals_follow_the_pricing_rules(self):
+        with db_utils.get_conn() as con:
+            con.execute("UPDATE pricing_rules SET percent = 12 WHERE kind = 'gst'")
+        rules.get_rule_book().invalidate()
+        cart_id = self.client.new_cart()["cart_id"]
+        cart = self.client.add_item(cart_id, "Open item", 1, "50")
+        self.assertEqual(cart["totals"]["gst_amount"], "6.00")
+
+
+class ValidationTest(ServiceTestCase):
+    def status(self, method, path, body=None):
+        try:
+            self.client.request(method, path, body)
+        except ServiceError as e:
+            return e.status
+        return 200
+
+    def raw_status(self, method, path, body: bytes):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        try:
+            conn.request(method, path, body, {"Content-Type": "application/json"})
+            return conn.getresponse().status
+        finally:
+            conn.close()
+
+    def test_malformed_bodies_are_bad_requests(self):
+        cart_id = self.client.new_cart()["cart_id"]
+        items = f"/carts/{cart_id}/items"
+        for body in ({}, {"name": ""}, {"name": 7}, {"name": "Open item", "qty": "two"},
+                     {"name": "Open item", "qty": 1.5}, {"name": "Open item", "unit_price": "abc"},
+                     {"name": "Open item", "unit_price": [1]}, {"name": "Open item", "qty": 0, "unit_price": "5"}):
+            with self.subTest(body=body):
+                self.assertEqual(self.status("POST", items, body), 400)
+        self.assertEqual(self.status("PUT", f"{items}/Tea", {}), 400)
+        self.assertEqual(self.status("PUT", f"{items}/Tea", {"qty": None}), 400)
+        self.assertEqual(self.status("POST", "/carts", {"discount": "lots"}), 400)
+        self.client.add_item(cart_id, "Open item", 1, "5")
+        self.assertEqual(self.status("POST", f"/carts/{cart_id}/checkout", {"mode": ["Dine-In"]}), 400)
+        self.assertEqual(self.status("POST", f"/carts/{cart_id}/checkout", {"phone": 98765}), 400)
+        self.assertEqual(self.client.cart(cart_id)["lines"][0]["qty"], 1)   # still open
+
+    def test_body_must_be_a_json_object(self):
+        cart_id = self.client.new_cart()["cart_id"]
+        for body in (b"[1, 2]", b'"Tea"', b"null", b"3"):
+            with self.subTest(body=body):
+                self.assertEqual(self.raw_status("POST", "/carts", body), 400)
+                self.assertEqual(self.raw_status("POST", f"/carts/{cart_id}/items", body), 400)
+        self.assertEqual(self.raw_status("POST", f"/carts/{cart_id}/items", b"{"), 400)
+
+    def test_unknown_carts_and_items_are_not_found(self):
+        cart_id = self.client.new_cart()["cart_id"]
+        self.assertEqual(self.status("GET", "/carts/999"), 404)
+        self.assertEqual(self.status("POST", "/carts/999/items", {"name": "Open item", "unit_price": "5"}), 404)
+        self.assertEqual(self.status("POST", f"/carts/{cart_id}/items", {"name": "No such dish"}), 404)
+        self.assertEqual(self.status("PUT", f"/carts/{cart_id}/items/No%20such%20dish", {"qty": 2}), 404)
+        self.assertEqual(self.status("DELETE", f"/carts/{cart_id}/items/Open%20item"), 404)
+        self.assertEqual(self.status("GET", "/menu/No%20such%20dish"), 404)
+
+    def test_valid_requests_still_work(self):
+        cart_id = self.client.new_cart(discount="10")["cart_id"]
+        self.client.request("POST", f"/carts/{cart_id}/items", {"name": "Open item", "qty": "2", "unit_price": 50})
+        cart = self.client.set_qty(cart_id, "Open item", 3)
+        self.assertEqual((cart["lines"][0]["qty"], cart["totals"]["discount_amount"]), (3, "15.00"))
+        self.assertIsInstance(self.client.checkout(cart_id, phone="", bill="")["order_id"], int)
+
+
+class CheckoutTest(ServiceTestCase):
+    # batches wait for company, so a checkout stays in flight long enough to race
+    service_options = {"max_latency": 0.3}
+
+    def orders(self):
+        return self.query("SELECT COUNT(*) FROM orders")[0][0]
+
+    def test_concurrent_checkouts_of_one_cart_bill_it_once(self):
+        cart_id = self.client.new_cart()["cart_id"]
+        self.client.add_item(cart_id, "Open item", 2, "50")
+
+        def checkout(_):
+            try:
+                return self.client.checkout(cart_id)["order_id"]
+            except ServiceError as e:
+                return f"HTTP {e.status}"
+            finally:
+                self.client._local.conn.close()
+
+        with ThreadPoolExecutor(2) as pool:
+            results = list(pool.map(checkout, range(2)))
+        self.assertIn("HTTP 404", results)
+        self.assertEqual(len([r for r in results if isinstance(r, int)]), 1)
+        self.assertEqual(self.orders(), 1)
+
+    def test_repeated_idempotency_key_gets_the_first_response(self):
+        cart_id = self.client.new_cart()["cart_id"]
+
+        def add():
+            return self.client.request("POST", f"/carts/{cart_id}/items",
+                                       {"name": "Open item", "qty": 2, "unit_price": "50"}, "add-1")
+
+        self.assertEqual(add(), add())
+        self.assertEqual(self.client.cart(cart_id)["lines"][0]["qty"], 2)
+
+        def pay():
+            return self.client.request("POST", f"/carts/{cart_id}/checkout", {}, "pay-1")
+
+        first = pay()
+        self.assertEqual(pay(), first)
+        self.assertEqual(self.orders(), 1)
+
+
+class ClientRetryTest(unittest.TestCase):
+    def client_with_dropped_connection(self):
+        """A client whose first request dies with RemoteDisconnected; later ones answer {}"""
+        client = BillingClient("http://127.0.0.1:1")
+        sent = []
+
+        class Conn:
+            def request(self, method, path, body=None, headers=None):
+                sent.append((method, path, dict(headers or {})))
+
+            def getresponse(self):
+                if len(sent) == 1:
+                    raise http.client.RemoteDisconnected("closed")
+                resp = mock.Mock(status=200)
+                resp.read.return_value = b"{}"
+                return resp
+
+            def close(self):
+                pass
+
+        client._conn = Conn
+        return client, sent
+
+    def test_post_without_key_is_not_retried(self):
+        client, sent = self.client_with_dropped_connection()
+        with self.assertRaises(http.client.RemoteDisconnected):
+            client.request("POST", "/carts/1/checkout", {})
+        self.assertEqual(len(sent), 1)
+
+    def test_post_with_key_is_retried_with_the_same_key(self):
+        client, sent = self.client_with_dropped_connection()
+        client.request("POST", "/carts/1/checkout", {}, "k1")
+        self.assertEqual([h["Idempotency-Key"] for _, _, h in sent], ["k1", "k1"])
+
+    def test_get_is_retried(self):
+        client, sent = self.client_with_dropped_connection()
+        self.assertEqual(client.request("GET", "/health"), {})
+        self.assertEqual(len(sent), 2)
+
+    def test_client_posts_carry_one_key_across_the_retry(self):
+        client, sent = self.client_with_dropped_connection()
+        client.checkout(7)
+        keys = [h.get("Idempotency-Key") for _, _, h in sent]
+        self.assertEqual(len(keys), 2)
+        self.assertIsNotNone(keys[0])
+        self.assertEqual(keys[0], keys[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import contextlib
+import io
+import unittest
+from datetime import datetime
+
+from utils import totals_cache
+from utils.money import Money
+from utils.rules import CompiledRules, Rule, default_rules
+from utils.totals_cache import TotalsCache
+
+from .support import TempDBTestCase
+
+COMBO = [Rule("gst", 5.0), Rule("combo", 10.0, items=("Burger", "Cola")),
+         Rule("happy_hour", 20.0, category="Drinks", start="16:00", end="19:00")]
+CATEGORIES = {"Cola": "Drinks"}
+
+
+def combo_rules(version=("db", 1, 1)):
+    return CompiledRules(COMBO, CATEGORIES, version)
+
+
+def cart(n):
+    return [("Burger", n, 15000), ("Cola", 1, 5000)]
+
+
+class TotalsCacheTest(unittest.TestCase):
+    def test_hits_match_the_rules(self):
+        cache, rules = TotalsCache(), combo_rules()
+        at = datetime(2024, 1, 1, 12, 0)
+        first = cache.totals(rules, cart(1), at)
+        self.assertEqual(first, rules.totals(cart(1), at))
+        self.assertEqual(cache.totals(rules, list(reversed(cart(1))), at), first)
+        self.assertEqual(cache.stats_dict(), {"hits": 1, "misses": 1, "evictions": 0, "invalidations": 0,
+                                              "hit_rate": 0.5, "size": 1})
+
+    def test_happy_hour_is_part_of_the_key(self):
+        cache, rules = TotalsCache(), combo_rules()
+        noon, five, six = (datetime(2024, 1, 1, h, 0) for h in (12, 17, 18))
+        self.assertNotEqual(cache.price(rules, cart(1), noon), cache.price(rules, cart(1), five))
+        cache.price(rules, cart(1), six)   # the same happy hour as five o'clock
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 2))
+
+    def test_discount_is_part_of_the_key(self):
+        cache, rules = TotalsCache(), combo_rules()
+        at = datetime(2024, 1, 1, 12, 0)
+        self.assertEqual(cache.price(rules, cart(1), at, 50.0), rules.price_lines(cart(1), at, 50.0))
+        self.assertEqual(cache.price(rules, cart(1), at), rules.price_lines(cart(1), at))
+        self.assertEqual(cache.stats.misses, 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache, rules = TotalsCache(maxsize=2), combo_rules()
+        at = datetime(2024, 1, 1, 12, 0)
+        for n in (1, 2):
+            cache.price(rules, cart(n), at)
+        cache.price(rules, cart(1), at)   # 2 is now the oldest
+        cache.price(rules, cart(3), at)
+        self.assertEqual((len(cache), cache.stats.evictions), (2, 1))
+        cache.price(rules, cart(1), at)
+        cache.price(rules, cart(2), at)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (2, 4))
+
+    def test_new_rules_version_drops_the_old_entries(self):
+        cache, at = TotalsCache(), datetime(2024, 1, 1, 12, 0)
+        old = combo_rules(("db", 1, 1))
+        for n in (1, 2):
+            cache.price(old, cart(n), at)
+        new = combo_rules(("db", 2, 1))
+        cache.price(new, cart(1), at)
+        self.assertEqual((len(cache), cache.stats.invalidations, cache.stats.hits), (1, 2, 0))
+        cache.invalidate()
+        self.assertEqual((len(cache), cache.stats.invalidations), (0, 3))
+
+    def test_rules_without_a_version_never_share_entries(self):
+        cache, at = TotalsCache(), datetime(2024, 1, 1, 12, 0)
+        cache.price(combo_rules(None), cart(1), at)
+        cache.price(combo_rules(None), cart(1), at)
+        self.assertEqual((cache.stats.hits, len(cache)), (0, 2))
+
+    def test_uniform_rules_bypass_the_cache(self):
+        cache, rules = TotalsCache(), default_rules()
+        self.assertTrue(rules.uniform)
+        self.assertEqual(cache.totals(rules, cart(1)), rules.totals(cart(1)))
+        self.assertEqual((len(cache), cache.stats.hits, cache.stats.misses), (0, 0, 0))
+
+
+class RepriceCliTest(TempDBTestCase):
+    def test_end_day_is_inclusive(self):
+        for day in ("2024-03-01", "2024-03-02", "2024-03-03"):
+            self.add_order(f"{day}T20:00:00", [("Tea", 2, 20)])
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            totals_cache.main(["reprice", "--start", "2024-03-01", "--end", "2024-03-02"])
+        self.assertIn(f"2 orders re-priced, 0 would change, net {Money(0)}", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,34 +1,20 @@
+import sys
 import tkinter as tk
 from tkinter import ttk, messagebox
-import json
-from dataclasses import dataclass
-from typing import List, Dict
-
-# GST configuration
-GST_PERCENT = 5.0
-
-# ------------------- Data Model -------------------
-@dataclass
-class BillItem:
-    name: str
-    qty: int
-    unit_price: float
-
-    @property
-    def line_total(self) -> float:
-        return round(self.qty * self.unit_price, 2)
-
-def compute_totals(items: List[BillItem], discount_pct: float = 0.0) -> Dict[str, float]:
-    subtotal = round(sum(i.line_total for i in items), 2)
-    gst_amount = round(subtotal * (GST_PERCENT / 100.0), 2)
-    discount_amount = round(subtotal * (discount_pct / 100.0), 2) if discount_pct else 0.0
-    total = round(subtotal + gst_amount - discount_amount, 2)
-    return {
-        "subtotal": subtotal,
-        "gst_amount": gst_amount,
-        "discount_amount": discount_amount,
-        "total": total
-    }
+from pathlib import Path
+
+if __package__ in (None, ""):
+    # allow `python ui/main_ui.py` as well as `python -m ui.main_ui`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Billing model and pricing rules are shared with the rest of the app
+from utils.cart import Cart
+from utils.db_utils import init_db
+from utils.metrics import span
+from utils.receipts import Receipt, export_receipt, render
+
+# Exported bills, one file each
+BILLS_DIR = Path(__file__).resolve().parents[1] / "bills"
 
 # ------------------- GUI App -------------------
 class RestaurantBillingApp:
@@ -37,8 +23,15 @@ class RestaurantBillingApp:
         self.root.title("🍴 Restaurant Billing System")
         self.root.geometry("950x650")
         
-        self.items: List[BillItem] = []
+        # Cart totals read the pricing rules from the database
+        init_db()
+
         self.discount_pct = 0.0
+        # Current order; running totals are kept up to date as quantities change
+        # GST slabs come from the session's pricing rules (DB or BILLING_RULES file)
+        self.cart = Cart(discount=self.discount_pct)
+        self.cart.add_listener(self.on_cart_change)
+        self.cart_tree = None
         self.order_mode = tk.StringVar(value="Dine-in")
         self.payment_method = tk.StringVar(value="Cash")
 
@@ -70,6 +63,10 @@ class RestaurantBillingApp:
 
         tk.Label(self.main_frame, text="🍽️ Select Items", font=("Arial", 16, "bold")).pack(pady=10)
 
+        # New order
+        self.cart_tree = None
+        self.cart.clear()
+
         # Items (example menu)
         self.menu_items = [
             ("Pizza", 200),
@@ -85,69 +82,79 @@ class RestaurantBillingApp:
             tk.Label(frame, text=f"{name} - ₹{price}", font=("Arial", 14)).pack(side=tk.LEFT, padx=10)
             qty_var = tk.IntVar(value=0)
             self.item_vars[name] = (qty_var, price)
+            qty_var.trace_add("write", lambda *_, n=name: self.on_qty_change(n))
             spin = tk.Spinbox(frame, from_=0, to=10, textvariable=qty_var, width=5)
             spin.pack(side=tk.LEFT)
 
+        # Live cart: rows are updated in place as quantities change
+        self.cart_tree = ttk.Treeview(self.main_frame, columns=("Item", "Qty", "Price", "Total"),
+                                      show="headings", height=6)
+        for col in ("Item", "Qty", "Price", "Total"):
+            self.cart_tree.heading(col, text=col)
+        self.cart_tree.pack(fill=tk.X, pady=5)
+        self.totals_var = tk.StringVar()
+        tk.Label(self.main_frame, textvariable=self.totals_var, font=("Arial", 12)).pack(anchor="e")
+        self.show_totals()
+
         tk.Button(self.main_frame, text="✅ Generate Bill", font=("Arial", 14), command=self.generate_bill).pack(pady=20)
 
-    # ------------------- Billing -------------------
-    def generate_bill(self):
-        self.items.clear()
-        for name, (qty_var, price) in self.item_vars.items():
+    def on_qty_change(self, name: str):
+        qty_var, price = self.item_vars[name]
+        try:
             qty = qty_var.get()
-            if qty > 0:
-                self.items.append(BillItem(name, qty, price))
+        except tk.TclError:
+            # Spinbox is being edited and holds no number yet
+            return
+        self.cart.set_qty(name, qty, price)
+
+    def on_cart_change(self, name: str, line):
+        if self.cart_tree is None:
+            return
+        if line is None:
+            if self.cart_tree.exists(name):
+                self.cart_tree.delete(name)
+        else:
+            values = (name, line.qty, line.unit_price, line.line_total)
+            if self.cart_tree.exists(name):
+                self.cart_tree.item(name, values=values)
+            else:
+                self.cart_tree.insert("", tk.END, iid=name, values=values)
+        self.show_totals()
+
+    def show_totals(self):
+        t = self.cart.totals()
+        self.totals_var.set(f"Subtotal: ₹{t['subtotal']}   Total: ₹{t['total']}")
 
-        if not self.items:
+    # ------------------- Billing -------------------
+    def generate_bill(self):
+        if not self.cart:
             messagebox.showwarning("No Items", "Please select at least one item!")
             return
 
-        totals = compute_totals(self.items, self.discount_pct)
+        with span("ui.generate_bill"):
+            receipt = Receipt.from_cart(self.cart, self.order_mode.get(), self.payment_method.get())
+            self.cart_tree = None
 
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
+            for widget in self.main_frame.winfo_children():
+                widget.destroy()
 
-        tk.Label(self.main_frame, text="🧾 Bill Summary", font=("Arial", 16, "bold")).pack(pady=10)
+            tk.Label(self.main_frame, text="🧾 Bill Summary", font=("Arial", 16, "bold")).pack(pady=10)
 
-        bill_text = tk.Text(self.main_frame, width=60, height=20, font=("Courier New", 12))
-        bill_text.pack(pady=10)
+            bill_text = tk.Text(self.main_frame, width=60, height=20, font=("Courier New", 12))
+            bill_text.pack(pady=10)
 
-        bill_text.insert(tk.END, "Item\tQty\tPrice\tTotal\n")
-        bill_text.insert(tk.END, "-"*40 + "\n")
-        for item in self.items:
-            bill_text.insert(tk.END, f"{item.name}\t{item.qty}\t{item.unit_price}\t{item.line_total}\n")
-        bill_text.insert(tk.END, "-"*40 + "\n")
-        bill_text.insert(tk.END, f"Subtotal:\t\t\t{totals['subtotal']}\n")
-        bill_text.insert(tk.END, f"GST ({GST_PERCENT}%):\t\t\t{totals['gst_amount']}\n")
-        bill_text.insert(tk.END, f"Discount:\t\t\t{totals['discount_amount']}\n")
-        bill_text.insert(tk.END, f"Total:\t\t\t{totals['total']}\n")
+            bill_text.insert(tk.END, render(receipt, "text"))
 
-        bill_text.config(state="disabled")
+            bill_text.config(state="disabled")
 
-        tk.Button(self.main_frame, text="💾 Export Bill", font=("Arial", 14), command=lambda: self.export_bill(totals)).pack(pady=10)
+        tk.Button(self.main_frame, text="💾 Export Bill", font=("Arial", 14), command=lambda: self.export_bill(receipt)).pack(pady=10)
         tk.Button(self.main_frame, text="🔄 New Order", font=("Arial", 14), command=self.show_start_screen).pack(pady=10)
 
     # ------------------- Export -------------------
-    def export_bill(self, totals: Dict[str, float]):
-        data = {
-            "mode": self.order_mode.get(),
-            "payment": self.payment_method.get(),
-            "items": [
-                {
-                    "name": i.name,
-                    "qty": i.qty,
-                    "unit_price": i.unit_price,
-                    "line_total": i.line_total
-                }
-                for i in self.items
-            ],
-            "totals": totals
-        }
-
-        with open("bill.json", "w") as f:
-            json.dump(data, f, indent=2)
-
-        messagebox.showinfo("Exported", "Bill exported to bill.json ✅")
+    def export_bill(self, receipt: Receipt):
+        # a new file per bill; earlier exports are never overwritten
+        path = export_receipt(receipt, BILLS_DIR, "json")
+        messagebox.showinfo("Exported", f"Bill exported to {path.name} ✅")
 
 # ------------------- Main -------------------
 if __name__ == "__main__":
@@ -0,0 +1,328 @@
+"""
+Menu-engineering analytics over the full order history.
+
+    python -m utils.analytics [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+                              [--workers N] [--top 20] [--format json|csv] [--out PATH]
+
+The date range is split into calendar months. Each month is scanned by a
+worker process on its own read-only connection (`mode=ro`), and the small
+per-month aggregates are merged here. With the database in WAL mode these
+readers never take the write lock, so billing keeps running during a scan.
+
+Archived months (utils/archive.py) are read from their columnar files and
+merged the same way. The archive always sits next to the live database,
+also when the SQL side is read from the reporting replica.
+
+Reports: top items (units and revenue), category mix, weekday x hour
+heatmap, and basket statistics (bill value, lines and units per order).
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import db_utils
+from .archive import archived_months, open_partition
+from .metrics import timed
+from .money import Money
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+UNCATEGORIZED = "Uncategorized"
+
+
+@dataclass
+class Partial:
+    """Aggregates for one partition; merged with +"""
+    orders: int = 0
+    revenue: int = 0      # paise, order totals
+    lines: int = 0
+    units: int = 0
+    items: Dict[str, List[int]] = field(default_factory=dict)                 # name -> [units, paise]
+    heatmap: Dict[Tuple[int, int], List[int]] = field(default_factory=dict)   # (weekday, hour) -> [orders, paise]
+
+    def __add__(self, other: "Partial") -> "Partial":
+        out = Partial(self.orders + other.orders, self.revenue + other.revenue,
+                      self.lines + other.lines, self.units + other.units,
+                      {k: list(v) for k, v in self.items.items()},
+                      {k: list(v) for k, v in self.heatmap.items()})
+        for table, add in ((out.items, other.items), (out.heatmap, other.heatmap)):
+            for k, (a, b) in add.items():
+                cell = table.setdefault(k, [0, 0])
+                cell[0] += a
+                cell[1] += b
+        return out
+
+
+# ------------------- Partitions -------------------
+def month_partitions(start: date, end: date) -> List[Tuple[str, str]]:
+    """[lo, hi) created_at bounds for each calendar month touching start..end"""
+    parts = []
+    lo = start
+    while lo <= end:
+        nxt = date(lo.year + lo.month // 12, lo.month % 12 + 1, 1)
+        hi = min(nxt, end + timedelta(days=1))
+        parts.append((lo.isoformat(), hi.isoformat()))
+        lo = nxt
+    return parts
+
+
+def _open_ro(db_path) -> sqlite3.Connection:
+    con = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    con.execute("PRAGMA query_only = 1")
+    return con
+
+
+def _billed_name(con, menu_item_id: int) -> str:
+    # the item has since been deleted from the menu
+    row = con.execute("SELECT item_name FROM order_items WHERE menu_item_id = ? LIMIT 1",
+                      (menu_item_id,)).fetchone()
+    return row[0] if row else f"#{menu_item_id}"
+
+
+def scan_partition(db_path: str, lo: str, hi: str, archive_db: Optional[str] = None) -> Partial:
+    """
+    Aggregate orders with lo <= created_at < hi (runs in a worker process);
+    archived orders come from archive_db's archive (default: db_path's)
+    """
+    con = _open_ro(db_path)
+    try:
+        p = Partial()
+        for weekday, hour, n, paise in con.execute("""
+            SELECT CAST(strftime('%w', created_at) AS INTEGER),
+                   CAST(substr(created_at, 12, 2) AS INTEGER),
+                   COUNT(*), SUM(total_paise)
+            FROM orders WHERE created_at >= ? AND created_at < ?
+            GROUP BY 1, 2
+        """, (lo, hi)):
+            # %w counts from Sunday; report Monday-first
+            p.heatmap[((weekday + 6) % 7, hour)] = [n, paise]
+            p.orders += n
+            p.revenue += paise
+        # grouped on the integer menu id (covering index), named after the current menu;
+        # open items that are not on the menu are grouped by the name they were billed under
+        id_names = dict(con.execute("SELECT id, name FROM menu"))
+        for menu_item_id, name, lines, units, paise in con.execute("""
+            SELECT oi.menu_item_id, NULL, COUNT(*), SUM(oi.qty), SUM(oi.line_total_paise)
+            FROM orders o JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.created_at >= ? AND o.created_at < ? AND oi.menu_item_id IS NOT NULL
+            GROUP BY oi.menu_item_id
+            UNION ALL
+            SELECT NULL, oi.item_name, COUNT(*), SUM(oi.qty), SUM(oi.line_total_paise)
+            FROM orders o JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.created_at >= ? AND o.created_at < ? AND oi.menu_item_id IS NULL
+            GROUP BY oi.item_name
+        """, (lo, hi, lo, hi)):
+            if menu_item_id is not None:
+                name = id_names.get(menu_item_id) or _billed_name(con, menu_item_id)
+            cell = p.items.setdefault(name, [0, 0])
+            cell[0] += units
+            cell[1] += paise
+            p.lines += lines
+            p.units += units
+    finally:
+        con.close()
+    return p + scan_archive(archive_db or db_path, lo, hi, id_names)
+
+
+def scan_archive(db_path: str, lo: str, hi: str, id_names: Dict[int, str]) -> Partial:
+    """scan_partition for the archived part of the month starting at lo"""
+    p = Partial()
+    if lo[:7] not in archived_months(db_path):
+        return p
+    with open_partition(lo[:7], db_path) as part:
+        rows = part.order_rows(lo, hi)
+        created, total = part.column("orders.created_at"), part.column("orders.total")
+        for row in rows:
+            seconds = created[row]
+            # epoch day 0 (1970-01-01) was a Thursday; Monday is 0
+            key = ((seconds // 86400 + 3) % 7, seconds % 86400 // 3600)
+            cell = p.heatmap.setdefault(key, [0, 0])
+            cell[0] += 1
+            cell[1] += total[row]
+        p.orders = len(rows)
+        p.revenue = sum(total[rows.start:rows.stop])
+
+        whole = len(rows) == part.n_orders
+        by_code: Dict[Tuple[int, int], List[int]] = {}
+        for row, item, qty, line, menu_item in zip(
+                part.column("items.order_row"), part.column("items.item"), part.column("items.qty"),
+                part.column("items.line_total"), part.menu_item_ids()):
+            if whole or row in rows:
+                cell = by_code.setdefault((menu_item, item), [0, 0])
+                cell[0] += qty
+                cell[1] += line
+                p.lines += 1
+                p.units += qty
+        for (menu_item, code), (units, paise) in by_code.items():
+            cell = p.items.setdefault(id_names.get(menu_item) or part.names[code], [0, 0])
+            cell[0] += units
+            cell[1] += paise
+    return p
+
+
+# ------------------- Report -------------------
+class SalesAnalytics:
+    def __init__(self, partial: Partial, categories: Dict[str, str], start: str, end: str):
+        self.data = partial
+        self.categories = categories
+        self.start = start
+        self.end = end
+
+    def top_items(self, n: Optional[int] = 20, by: str = "revenue") -> List[Tuple[str, int, Money]]:
+        """(item, units, revenue), best first; by is "revenue" or "units" """
+        key = 1 if by == "revenue" else 0
+        rows = sorted(self.data.items.items(), key=lambda kv: (-kv[1][key], kv[0]))
+        return [(name, units, Money(paise)) for name, (units, paise) in rows[:n]]
+
+    def category_mix(self) -> List[Tuple[str, int, Money, float]]:
+        """(category, units, revenue, share of item revenue in %), largest first"""
+        mix: Dict[str, List[int]] = {}
+        for name, (units, paise) in self.data.items.items():
+            cell = mix.setdefault(self.categories.get(name) or UNCATEGORIZED, [0, 0])
+            cell[0] += units
+            cell[1] += paise
+        total = sum(paise for _u, paise in mix.values()) or 1
+        return [(cat, units, Money(paise), round(100.0 * paise / total, 2))
+                for cat, (units, paise) in sorted(mix.items(), key=lambda kv: -kv[1][1])]
+
+    def heatmap(self) -> List[List[int]]:
+        """7 x 24 order counts, rows Monday..Sunday, columns hour 0..23"""
+        grid = [[0] * 24 for _ in WEEKDAYS]
+        for (weekday, hour), (n, _paise) in self.data.heatmap.items():
+            grid[weekday][hour] = n
+        return grid
+
+    def basket(self) -> Dict[str, object]:
+        d = self.data
+        orders = d.orders or 1
+        return {
+            "orders": d.orders,
+            "revenue": Money(d.revenue),
+            "avg_bill": Money(round(d.revenue / orders)),
+            "avg_lines": round(d.lines / orders, 2),
+            "avg_units": round(d.units / orders, 2),
+        }
+
+    def to_dict(self, top: Optional[int] = 20) -> dict:
+        return {
+            "start": self.start,
+            "end": self.end,
+            "basket": {k: str(v) if isinstance(v, Money) else v for k, v in self.basket().items()},
+            "top_items": [{"item": n, "units": u, "revenue": str(r)} for n, u, r in self.top_items(top)],
+            "category_mix": [{"category": c, "units": u, "revenue": str(r), "share_pct": s}
+                             for c, u, r, s in self.category_mix()],
+            "heatmap": {"weekdays": WEEKDAYS, "hours": list(range(24)), "orders": self.heatmap()},
+        }
+
+    def write_json(self, path, top: Optional[int] = 20):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(top), f, indent=2)
+
+    def write_csv(self, directory, top: Optional[int] = None) -> List[Path]:
+        """One CSV per report (summary, items, categories, heatmap) in directory"""
+        out = Path(directory)
+        out.mkdir(parents=True, exist_ok=True)
+        tables = {
+            "summary.csv": (["metric", "value"], [(k, v) for k, v in self.basket().items()]),
+            "items.csv": (["item", "units", "revenue"], self.top_items(top)),
+            "categories.csv": (["category", "units", "revenue", "share_pct"], self.category_mix()),
+            "heatmap.csv": (["weekday"] + [f"{h:02d}" for h in range(24)],
+                            [[day] + row for day, row in zip(WEEKDAYS, self.heatmap())]),
+        }
+        paths = []
+        for name, (header, rows) in tables.items():
+            paths.append(out / name)
+            with open(out / name, "w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                w.writerows(rows)
+        return paths
+
+
+def _history_bounds(con, archive_db: str) -> Optional[Tuple[date, date]]:
+    ends = [t for t in con.execute("SELECT MIN(created_at), MAX(created_at) FROM orders").fetchone() if t]
+    months = archived_months(archive_db)
+    if months:
+        with open_partition(months[0], archive_db) as part:
+            ends.append(part.first_last()[0])
+        with open_partition(months[-1], archive_db) as part:
+            ends.append(part.first_last()[1])
+    if not ends:
+        return None
+    return date.fromisoformat(min(ends)[:10]), date.fromisoformat(max(ends)[:10])
+
+
+@timed("analytics.run")
+def run_analytics(start: Optional[str] = None, end: Optional[str] = None,
+                  workers: Optional[int] = None, db_path=None) -> SalesAnalytics:
+    """
+    Scan start..end (inclusive dates, default: all history) one month per
+    task; workers=1 scans in this process.
+    """
+    # SQL reads go to the reporting replica when one is enabled (db_utils.enable_replica);
+    # the replica is a copy of the database file only, the archive stays with DB_PATH
+    archive_db = str(db_path or db_utils.DB_PATH)
+    db_path = str(db_path or db_utils.report_db_path())
+    con = _open_ro(db_path)
+    try:
+        bounds = _history_bounds(con, archive_db)
+        categories = dict(con.execute("SELECT name, category FROM menu"))
+    finally:
+        con.close()
+    if bounds is None:
+        return SalesAnalytics(Partial(), categories, start or "", end or "")
+
+    lo = date.fromisoformat(start) if start else bounds[0]
+    hi = date.fromisoformat(end) if end else bounds[1]
+    parts = month_partitions(lo, hi)
+    workers = min(workers or os.cpu_count() or 1, len(parts))
+
+    total = Partial()
+    if workers <= 1:
+        for a, b in parts:
+            total = total + scan_partition(db_path, a, b, archive_db)
+    else:
+        # spawn, not fork: a fork taken while another thread is inside SQLite
+        # can leave the child blocked on a lock nobody will release
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            for partial in pool.map(scan_partition, [db_path] * len(parts), *zip(*parts),
+                                    [archive_db] * len(parts)):
+                total = total + partial
+    return SalesAnalytics(total, categories, lo.isoformat(), hi.isoformat())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Item, category, hourly and basket analytics")
+    parser.add_argument("--start", help="first day, YYYY-MM-DD (default: first order)")
+    parser.add_argument("--end", help="last day, YYYY-MM-DD (default: last order)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--top", type=int, default=20, help="items to list (default %(default)s)")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("--out", type=Path,
+                        help="JSON file, or directory for CSV files (default: stdout / ./analytics)")
+    args = parser.parse_args(argv)
+
+    db_utils.init_db()
+    report = run_analytics(args.start, args.end, args.workers)
+    if args.format == "csv":
+        for path in report.write_csv(args.out or Path("analytics"), args.top):
+            print(path)
+    elif args.out:
+        report.write_json(args.out, args.top)
+    else:
+        json.dump(report.to_dict(args.top), sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
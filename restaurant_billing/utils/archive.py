@@ -0,0 +1,423 @@
+"""
+Columnar archive for closed-out months of orders.
+
+    python -m utils.archive run --before YYYY-MM-DD [--vacuum]
+    python -m utils.archive list
+
+Complete months before the cutoff are moved out of SQLite into
+<db name>.archive/YYYY-MM/ next to the database file:
+
+    meta.json            row counts, column types, dictionaries
+    orders.<column>      id, created_at (epoch seconds), mode, payment_method,
+                         subtotal, gst, discount, total
+    items.<column>       order_row, item, qty, unit_price, line_total,
+                         menu_item (menu id, 0 for open items)
+
+Every column is a flat native-endian integer array of the narrowest type
+that holds its values, zlib-compressed on disk. Opening a column inflates
+it once into an anonymous mmap, read through memoryview casts without
+parsing; partitions written before format 3 are uncompressed and mapped
+straight from the file. Item names, order modes and payment methods are
+dictionary-encoded (small integer codes into lists in meta.json); items
+point at their order by row number.
+
+The archive belongs to the live database (db_utils.DB_PATH): writing and
+recovery run on its connection pool. Readers may name another database
+file to read that file's archive.
+
+Rollups have no delete trigger, so sales_report() keeps covering archived
+months. raw_sales_report(), rebuild_rollups() and utils.analytics read the
+archive alongside the live tables.
+"""
+import argparse
+import itertools
+import json
+import mmap
+import os
+import shutil
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import db_utils
+from .metrics import timed
+
+FORMAT = 3   # 2 added items.menu_item, 3 zlib-compressed columns
+EPOCH = datetime(1970, 1, 1)
+ORDER_COLUMNS = ["id", "created_at", "mode", "payment", "subtotal", "gst", "discount", "total"]
+ITEM_COLUMNS = ["order_row", "item", "qty", "unit_price", "line_total", "menu_item"]
+
+
+def archive_dir(db_path=None) -> Path:
+    return Path(db_path or db_utils.DB_PATH).with_suffix(".archive")
+
+
+def _seconds(created_at: str) -> int:
+    return int((datetime.fromisoformat(created_at) - EPOCH).total_seconds())
+
+
+def _iso(seconds: int) -> str:
+    return (EPOCH + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+
+
+def _typecode(values, unsigned: bool = False) -> str:
+    lo, hi = (min(values), max(values)) if len(values) else (0, 0)
+    for code in ("BHIQ" if unsigned and lo >= 0 else "bhiq"):
+        bits = array(code).itemsize * 8
+        lo_ok = lo >= (0 if code.isupper() else -(1 << (bits - 1)))
+        hi_ok = hi < (1 << bits if code.isupper() else 1 << (bits - 1))
+        if lo_ok and hi_ok:
+            return code
+    raise OverflowError("value does not fit in 64 bits")
+
+
+class _Encoder:
+    """Value -> small integer code, in first-seen order"""
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values = list(values or [])
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def __call__(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+# ------------------- Reading -------------------
+class ArchivePartition:
+    """One archived month, memory-mapped; columns are read-only memoryviews"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.month: str = self.meta["month"]
+        self.names: List[str] = self.meta["names"]
+        self.modes: List[str] = self.meta["modes"]
+        self.payments: List[str] = self.meta["payments"]
+        self._maps: List[Tuple[mmap.mmap, memoryview]] = []
+        self._columns: Dict[str, memoryview] = {}
+
+    def column(self, name: str):
+        """e.g. column("orders.total"); memoryview over the mapped column"""
+        col = self._columns.get(name)
+        if col is None:
+            code = self.meta["columns"][name]
+            rows = self.n_orders if name.startswith("orders.") else self.n_lines
+            with open(self.path / name, "rb") as f:
+                if rows == 0:
+                    col = memoryview(array(code))
+                else:
+                    if self.meta.get("compression") == "zlib":
+                        mm = _inflate(f, rows * array(code).itemsize)
+                    else:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    raw = memoryview(mm)
+                    self._maps.append((mm, raw))
+                    col = raw.cast(code)
+            if self.meta["byteorder"] != sys.byteorder:
+                swapped = array(code, col)
+                swapped.byteswap()
+                col = memoryview(swapped)
+            self._columns[name] = col
+        return col
+
+    @property
+    def n_orders(self) -> int:
+        return self.meta["orders"]
+
+    @property
+    def n_lines(self) -> int:
+        return self.meta["lines"]
+
+    def first_last(self) -> Tuple[str, str]:
+        """created_at of the earliest and latest archived order"""
+        created = self.column("orders.created_at")
+        return _iso(created[0]), _iso(created[-1])
+
+    def order_rows(self, lo: Optional[str] = None, hi: Optional[str] = None) -> range:
+        """Row numbers of orders with lo <= created_at < hi (rows are in time order)"""
+        created = self.column("orders.created_at")
+        first = 0 if lo is None else _bisect(created, _seconds(lo))
+        last = len(created) if hi is None else _bisect(created, _seconds(hi))
+        return range(first, last)
+
+    def daily_totals(self, lo: Optional[str] = None, hi: Optional[str] = None) -> Dict[str, List[int]]:
+        """day -> [total_paise, orders] for orders in [lo, hi)"""
+        created, total = self.column("orders.created_at"), self.column("orders.total")
+        out: Dict[str, List[int]] = {}
+        for row in self.order_rows(lo, hi):
+            day = (EPOCH + timedelta(seconds=created[row])).date().isoformat()
+            cell = out.get(day)
+            if cell is None:
+                cell = out[day] = [0, 0]
+            cell[0] += total[row]
+            cell[1] += 1
+        return out
+
+    def orders(self) -> Iterator[tuple]:
+        """(id, mode, payment_method, subtotal, gst, discount, total, created_at) in paise"""
+        cols = [self.column("orders." + c) for c in ORDER_COLUMNS]
+        for i, created, mode, pay, sub, gst, disc, tot in zip(*cols):
+            yield (i, self.modes[mode], self.payments[pay], sub, gst, disc, tot, _iso(created))
+
+    def menu_item_ids(self):
+        """items.menu_item, or zeros for partitions written before format 2"""
+        if "items.menu_item" in self.meta["columns"]:
+            return self.column("items.menu_item")
+        return itertools.repeat(0, self.n_lines)
+
+    def items(self) -> Iterator[tuple]:
+        """(order_id, item_name, qty, unit_price, line_total, menu_item_id or None) in paise"""
+        ids = self.column("orders.id")
+        cols = [self.column("items." + c) for c in ITEM_COLUMNS[:-1]] + [self.menu_item_ids()]
+        for row, item, qty, unit, line, menu_item in zip(*cols):
+            yield (ids[row], self.names[item], qty, unit, line, menu_item or None)
+
+    def close(self):
+        for col in self._columns.values():
+            col.release()
+        self._columns.clear()
+        for mm, raw in self._maps:
+            raw.release()
+            mm.close()
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _inflate(f, size: int) -> mmap.mmap:
+    """Decompress a column file into an anonymous mapping of `size` bytes"""
+    mm = mmap.mmap(-1, size)
+    d = zlib.decompressobj()
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        mm.write(d.decompress(chunk))
+    mm.write(d.flush())
+    if mm.tell() != size:
+        mm.close()
+        raise ValueError(f"{f.name}: {size} bytes expected")
+    mm.seek(0)
+    return mm
+
+
+def _bisect(col, value: int) -> int:
+    lo, hi = 0, len(col)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if col[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def archived_months(db_path=None) -> List[str]:
+    root = archive_dir(db_path)
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir()
+                  if len(p.name) == 7 and (p / "meta.json").exists())
+
+
+def open_partition(month: str, db_path=None) -> ArchivePartition:
+    return ArchivePartition(archive_dir(db_path) / month)
+
+
+def daily_totals(start: Optional[str] = None, end: Optional[str] = None,
+                 db_path=None) -> Dict[str, List[int]]:
+    """Archived sales per day: day -> [total_paise, orders]; start/end inclusive dates"""
+    lo = start
+    hi = (date.fromisoformat(end) + timedelta(days=1)).isoformat() if end else None
+    out: Dict[str, List[int]] = {}
+    for month in archived_months(db_path):
+        if (lo and month < lo[:7]) or (hi and month > hi[:7]):
+            continue
+        with open_partition(month, db_path) as part:
+            out.update(part.daily_totals(lo, hi))
+    return out
+
+
+# ------------------- Writing -------------------
+@dataclass
+class ArchiveStats:
+    month: str
+    orders: int
+    lines: int
+    bytes: int
+
+    def __str__(self):
+        return f"{self.month}: {self.orders} orders, {self.lines} lines, {self.bytes / 1024:.0f} KiB"
+
+
+def _write_partition(path: Path, month: str, orders: List[tuple], items: List[tuple],
+                     names: _Encoder, modes: _Encoder, payments: _Encoder) -> int:
+    """orders/items as from SQLite (paise); items' order_id is mapped to row numbers"""
+    orders.sort(key=lambda o: (o[7], o[0]))
+    row_of = {o[0]: row for row, o in enumerate(orders)}
+    columns = {
+        "orders.id": [o[0] for o in orders],
+        "orders.created_at": [_seconds(o[7]) for o in orders],
+        "orders.mode": [modes(o[1]) for o in orders],
+        "orders.payment": [payments(o[2]) for o in orders],
+        "orders.subtotal": [o[3] for o in orders],
+        "orders.gst": [o[4] for o in orders],
+        "orders.discount": [o[5] for o in orders],
+        "orders.total": [o[6] for o in orders],
+        "items.order_row": [row_of[i[0]] for i in items],
+        "items.item": [names(i[1]) for i in items],
+        "items.qty": [i[2] for i in items],
+        "items.unit_price": [i[3] for i in items],
+        "items.line_total": [i[4] for i in items],
+        "items.menu_item": [i[5] or 0 for i in items],
+    }
+    codes = {"orders.mode", "orders.payment", "items.order_row", "items.item", "items.menu_item"}
+    path.mkdir(parents=True)
+    meta = {"format": FORMAT, "month": month, "orders": len(orders), "lines": len(items),
+            "byteorder": sys.byteorder, "compression": "zlib", "names": names.values,
+            "modes": modes.values, "payments": payments.values, "columns": {}}
+    size = 0
+    for name, values in columns.items():
+        code = _typecode(values, unsigned=name in codes)
+        meta["columns"][name] = code
+        with open(path / name, "wb") as f:
+            f.write(zlib.compress(array(code, values).tobytes(), 6))
+            f.flush()
+            os.fsync(f.fileno())
+            size += f.tell()
+    (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    return size
+
+
+def recover():
+    """Finish or discard a partition rewrite interrupted by a crash"""
+    root = archive_dir()
+    if not root.is_dir():
+        return
+    with db_utils.get_conn() as con:
+        committed = dict(con.execute("SELECT month, orders FROM archive_months"))
+    for tmp in root.glob("*.tmp"):
+        month = tmp.name[:-4]
+        try:
+            done = json.loads((tmp / "meta.json").read_text(encoding="utf-8"))["orders"]
+        except (OSError, ValueError):
+            done = None
+        if done is not None and committed.get(month) == done:
+            # the rows left SQLite: this copy is the only one
+            _swap(root, month)
+        else:
+            shutil.rmtree(tmp)
+    for old in root.glob("*.old"):
+        if (root / old.name[:-4]).exists():
+            shutil.rmtree(old)
+        else:
+            old.rename(root / old.name[:-4])
+
+
+def _swap(root: Path, month: str):
+    final, tmp, old = root / month, root / f"{month}.tmp", root / f"{month}.old"
+    if final.exists():
+        final.rename(old)
+    tmp.rename(final)
+    if old.exists():
+        shutil.rmtree(old)
+
+
+@timed("archive.run")
+def archive_orders(before: str, *, vacuum: bool = False) -> List[ArchiveStats]:
+    """
+    Move every complete month before `before` (YYYY-MM-DD) of the live
+    database into its archive. A month archived earlier is merged with any
+    orders that arrived since.
+    """
+    cutoff = date.fromisoformat(before).replace(day=1).isoformat()
+    root = archive_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    recover()
+    con = db_utils.get_conn()
+    months = [m for (m,) in con.execute("""
+        SELECT DISTINCT substr(created_at, 1, 7) FROM orders WHERE created_at < ? ORDER BY 1
+    """, (cutoff,))]
+
+    done = []
+    for month in months:
+        lo = month + "-01"
+        hi = date.fromisoformat(lo).replace(day=28) + timedelta(days=4)
+        hi = hi.replace(day=1).isoformat()
+        orders = con.execute("""
+            SELECT id, mode, payment_method, subtotal_paise, gst_paise, discount_paise,
+                   total_paise, created_at
+            FROM orders WHERE created_at >= ? AND created_at < ? ORDER BY id
+        """, (lo, hi)).fetchall()
+        items = con.execute("""
+            SELECT oi.order_id, oi.item_name, oi.qty, oi.unit_price_paise, oi.line_total_paise,
+                   oi.menu_item_id
+            FROM orders o JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.created_at >= ? AND o.created_at < ? ORDER BY oi.id
+        """, (lo, hi)).fetchall()
+        live_ids = [(o[0],) for o in orders]
+
+        names, modes, payments = _Encoder(), _Encoder(), _Encoder()
+        if (root / month / "meta.json").exists():
+            with ArchivePartition(root / month) as old:
+                names, modes, payments = _Encoder(old.names), _Encoder(old.modes), _Encoder(old.payments)
+                orders = list(old.orders()) + orders
+                items = list(old.items()) + items
+
+        tmp = root / f"{month}.tmp"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        size = _write_partition(tmp, month, orders, items, names, modes, payments)
+
+        def move(con):
+            con.executemany("DELETE FROM order_items WHERE order_id = ?", live_ids)
+            con.executemany("DELETE FROM orders WHERE id = ?", live_ids)
+            con.execute("""
+                INSERT INTO archive_months(month, orders, lines, archived_at) VALUES (?,?,?,?)
+                ON CONFLICT(month) DO UPDATE SET
+                    orders = excluded.orders, lines = excluded.lines, archived_at = excluded.archived_at
+            """, (month, len(orders), len(items), datetime.now().isoformat(timespec="seconds")))
+        db_utils.get_pool().run(move)
+        _swap(root, month)
+        done.append(ArchiveStats(month, len(orders), len(items), size))
+
+    if vacuum and done:
+        # gives the freed pages back to the filesystem; blocks writers while it runs
+        con.execute("VACUUM")
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive closed-out months of orders")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run", help="archive complete months before a date")
+    run.add_argument("--before", required=True, help="YYYY-MM-DD; months ending by then are archived")
+    run.add_argument("--vacuum", action="store_true", help="shrink the database file afterwards")
+    sub.add_parser("list", help="show archived months")
+    args = parser.parse_args(argv)
+
+    db_utils.init_db()
+    if args.cmd == "run":
+        stats = archive_orders(args.before, vacuum=args.vacuum)
+        for s in stats:
+            print(s)
+        print(f"{len(stats)} month(s) archived to {archive_dir()}")
+    else:
+        for month in archived_months():
+            with open_partition(month) as part:
+                print(f"{month}: {part.n_orders} orders, {part.n_lines} lines, "
+                      f"{len(part.names)} distinct items")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Columnar (NumPy) counterpart of utils.calculator.compute_totals.
+
+Used for re-pricing historical orders and GST/discount what-if runs over
+millions of lines. Amounts are integer paise, and percentages are rounded
+exactly like utils.money.percent_of. Pricing rules are applied with the
+same per-order roundings as utils.rules, so results match the scalar path.
+"""
+from datetime import datetime
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from .money import BASIS_POINTS
+from .rules import MINUTES_PER_DAY, CompiledRules, get_rules
+
+ArrayLike = Union[np.ndarray, list, tuple]
+
+
+def percent_of(paise: np.ndarray, pct: Union[float, np.ndarray]) -> np.ndarray:
+    """Element-wise utils.money.percent_of"""
+    bp = np.rint(np.asarray(pct, dtype=np.float64) * 100).astype(np.int64)
+    q = (np.abs(paise) * bp * 2 + BASIS_POINTS) // (2 * BASIS_POINTS)
+    return np.where(paise < 0, -q, q)
+
+
+def _per_order(values: np.ndarray, order_index: np.ndarray, orders: int) -> np.ndarray:
+    out = np.zeros(orders, dtype=np.int64)
+    np.add.at(out, order_index, values)
+    return out
+
+
+def _rules_gst(rules: CompiledRules, line_total, order_index, orders, names) -> np.ndarray:
+    """GST per order, one rounding per (order, rate) as CompiledRules.price_lines does"""
+    unique_names, name_index = np.unique(names, return_inverse=True)
+    rates, rate_index = np.unique(np.array([rules.gst_rate(n) for n in unique_names])[name_index],
+                                  return_inverse=True)
+    buckets = np.zeros(orders * len(rates), dtype=np.int64)
+    np.add.at(buckets, order_index * len(rates) + rate_index, line_total)
+    buckets = buckets.reshape(orders, len(rates))
+    return sum(percent_of(buckets[:, j], rate) for j, rate in enumerate(rates.tolist()))
+
+
+def _rules_discount(rules: CompiledRules, subtotal, line_total, order_index, names, times) -> np.ndarray:
+    """Automatic discounts per order, matching CompiledRules.price_lines"""
+    orders = subtotal.size
+    tier = np.searchsorted(np.asarray(rules.threshold_paise, dtype=np.int64), subtotal, side="left")
+    discount = percent_of(subtotal, np.concatenate(([0.0], rules.threshold_pct))[tier])
+
+    if rules.happy_hour_table:
+        minutes = times.astype("datetime64[m]").astype(np.int64)
+        days = minutes // MINUTES_PER_DAY
+        weekday = (days + 3) % 7   # 1970-01-01 was a Thursday
+        minute = minutes - days * MINUTES_PER_DAY
+        by_category = {}
+        for day, (bounds, segments) in rules.happy_hour_table.items():
+            for lo, hi, active in zip(bounds, bounds[1:], segments):
+                if not active:
+                    continue
+                hit = (weekday == day) & (minute >= lo) & (minute < hi)
+                if not hit.any():
+                    continue
+                for category, pct in active:
+                    if category is None:
+                        base = subtotal
+                    else:
+                        if category not in by_category:
+                            in_cat = np.array([rules.categories.get(n) == category for n in names.tolist()], dtype=bool)
+                            by_category[category] = _per_order(np.where(in_cat, line_total, 0), order_index, orders)
+                        base = by_category[category]
+                    discount = discount + np.where(hit, percent_of(base, pct), 0)
+
+    for items, pct in rules.combos:
+        complete = np.ones(orders, dtype=bool)
+        base = np.zeros(orders, dtype=np.int64)
+        for name in items:
+            is_item = names == name
+            complete &= _per_order(is_item.astype(np.int64), order_index, orders) > 0
+            base += _per_order(np.where(is_item, line_total, 0), order_index, orders)
+        discount = discount + np.where(complete, percent_of(base, pct), 0)
+    return np.minimum(discount, subtotal)
+
+
+def compute_totals_batch(qty: ArrayLike, unit_price_paise: ArrayLike, order_id: ArrayLike,
+                         discount_pct: Union[None, float, ArrayLike] = 0.0,
+                         gst_percent: Optional[float] = None,
+                         rules: Optional[CompiledRules] = None,
+                         item_name: Optional[ArrayLike] = None,
+                         created_at: Optional[ArrayLike] = None,
+                         auto_discounts: bool = False) -> Dict[str, np.ndarray]:
+    """
+    qty, unit_price_paise, order_id: one entry per bill line
+    discount_pct: a single percentage or one per order (in order_id order);
+        None means no discount
+    gst_percent: a flat GST rate for what-if runs; None uses the rules' slabs
+    rules: compiled pricing rules (default: the session's, see utils/rules.py)
+    auto_discounts: add the rules' automatic discounts on top of discount_pct
+    item_name: one per line; needed when the rules have GST slabs, combos
+        or category happy hours
+    created_at: one per line (datetime64 or ISO strings; an order's first
+        line counts); happy hours use now when it is not given
+    Returns dict of arrays, one entry per distinct order_id (sorted);
+    amounts are int64 paise:
+      - order_id
+      - subtotal
+      - gst_amount
+      - discount_amount
+      - total
+    """
+    qty = np.asarray(qty, dtype=np.int64)
+    unit_price_paise = np.asarray(unit_price_paise, dtype=np.int64)
+    order_id = np.asarray(order_id)
+    if not (qty.shape == unit_price_paise.shape == order_id.shape):
+        raise ValueError("qty, unit_price_paise and order_id must have the same length")
+    if gst_percent is None or auto_discounts:
+        rules = rules or get_rules()
+        if not rules.uniform and item_name is None:
+            raise ValueError("these pricing rules need item_name for every line")
+    names = None if item_name is None else np.asarray(item_name)
+    times = None if created_at is None else np.asarray(created_at, dtype="datetime64[s]")
+
+    if order_id.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return {"order_id": order_id, "subtotal": empty, "gst_amount": empty,
+                "discount_amount": empty, "total": empty}
+
+    # Group lines of the same order together
+    if np.any(order_id[1:] < order_id[:-1]):
+        perm = np.argsort(order_id, kind="stable")
+        qty, unit_price_paise, order_id = qty[perm], unit_price_paise[perm], order_id[perm]
+        names = None if names is None else names[perm]
+        times = None if times is None else times[perm]
+    starts = np.concatenate(([0], np.flatnonzero(order_id[1:] != order_id[:-1]) + 1))
+    orders = starts.size
+    order_index = np.repeat(np.arange(orders), np.diff(np.append(starts, order_id.size)))
+
+    line_total = qty * unit_price_paise
+    subtotal = np.add.reduceat(line_total, starts)
+    if gst_percent is not None:
+        gst_amount = percent_of(subtotal, gst_percent)
+    elif rules.gst_by_item:
+        gst_amount = _rules_gst(rules, line_total, order_index, orders, names)
+    else:
+        gst_amount = percent_of(subtotal, rules.default_gst)
+    pct = 0.0 if discount_pct is None else discount_pct
+    discount_amount = percent_of(subtotal, np.broadcast_to(pct, subtotal.shape))
+    if auto_discounts:
+        order_times = (np.full(orders, np.datetime64(datetime.now(), "s")) if times is None
+                       else times[starts])
+        automatic = _rules_discount(rules, subtotal, line_total, order_index,
+                                    names if names is not None else np.full(order_id.size, ""),
+                                    order_times)
+        discount_amount = np.minimum(discount_amount + automatic, subtotal)
+    total = subtotal + gst_amount - discount_amount
+    return {
+        "order_id": order_id[starts],
+        "subtotal": subtotal,
+        "gst_amount": gst_amount,
+        "discount_amount": discount_amount,
+        "total": total,
+    }
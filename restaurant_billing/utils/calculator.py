@@ -1,36 +1,67 @@
 from dataclasses import dataclass
-from typing import List, Dict
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Dict, Optional
 
-# Configure GST here (percent)
-GST_PERCENT = 5.0
+from .metrics import timed
+from .money import Money, percent_of
+from .rules import CompiledRules, get_rules
+
+if TYPE_CHECKING:
+    from .totals_cache import TotalsCache
 
 @dataclass
 class BillItem:
     name: str
     qty: int
-    unit_price: float
+    unit_price: Money
+
+    def __post_init__(self):
+        # accept plain rupee values (10, 9.5, "12.50") for convenience
+        if not isinstance(self.unit_price, Money):
+            self.unit_price = Money.of(self.unit_price)
 
     @property
-    def line_total(self) -> float:
-        # Calculate line total exactly and round to 2 decimals
-        return round(self.qty * self.unit_price, 2)
+    def line_total(self) -> Money:
+        # Exact: integer paise times quantity, no rounding needed
+        return Money(self.qty * self.unit_price.paise)
 
-def compute_totals(items: List[BillItem], discount_pct: float = 0.0) -> Dict[str, float]:
+@timed("calc.compute_totals")
+def compute_totals(items: List[BillItem], discount_pct: Optional[float] = 0.0,
+                   rules: Optional[CompiledRules] = None, at: Optional[datetime] = None,
+                   cache: Optional["TotalsCache"] = None,
+                   auto_discounts: bool = False) -> Dict[str, Money]:
     """
-    Returns dict with keys:
+    Returns dict with Money values for keys:
       - subtotal
       - gst_amount
       - discount_amount
       - total
+    discount_pct is taken off the subtotal (None means no discount).
+    GST follows `rules` (default: the session's, see utils/rules.py).
+    auto_discounts adds the automatic discounts of the rules at time `at`
+    (default: now) on top of discount_pct; the total discount never
+    exceeds the subtotal.
+    With a cache (utils/totals_cache.py) repeated carts are priced once
+    when the rules price them line by line.
     """
-    # subtotal: sum of line totals
-    subtotal = round(sum(i.line_total for i in items), 2)
-    gst_amount = round(subtotal * (GST_PERCENT / 100.0), 2)
-    discount_amount = round(subtotal * (discount_pct / 100.0), 2) if discount_pct else 0.0
-    total = round(subtotal + gst_amount - discount_amount, 2)
+    rules = rules or get_rules()
+    discount_pct = discount_pct or 0.0
+    # None asks the rules for their automatic discounts
+    priced_pct = None if auto_discounts else discount_pct
+    if rules.uniform:
+        # subtotal: sum of line totals, in paise
+        subtotal = sum(i.qty * i.unit_price.paise for i in items)
+        gst_amount, discount_amount = rules.price_subtotal(subtotal, at, priced_pct)
+    else:
+        lines = [(i.name, i.qty, i.unit_price.paise) for i in items]
+        subtotal, gst_amount, discount_amount = (
+            cache.price(rules, lines, at, priced_pct) if cache is not None
+            else rules.price_lines(lines, at, priced_pct))
+    if auto_discounts and discount_pct:
+        discount_amount = min(discount_amount + percent_of(subtotal, discount_pct), subtotal)
     return {
-        "subtotal": subtotal,
-        "gst_amount": gst_amount,
-        "discount_amount": discount_amount,
-        "total": total
-    }
\ No newline at end of file
+        "subtotal": Money(subtotal),
+        "gst_amount": Money(gst_amount),
+        "discount_amount": Money(discount_amount),
+        "total": Money(subtotal + gst_amount - discount_amount)
+    }
@@ -0,0 +1,151 @@
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .calculator import BillItem
+from .money import Money
+from .rules import CompiledRules, get_rules
+
+if TYPE_CHECKING:
+    from .totals_cache import TotalsCache
+
+# on_change(name, line) -- line is None when the item left the cart
+ChangeListener = Callable[[str, Optional["CartLine"]], None]
+
+
+class CartLine:
+    __slots__ = ("name", "qty", "unit_price")
+
+    def __init__(self, name: str, qty: int, unit_price: Money):
+        self.name = name
+        self.qty = qty
+        self.unit_price = unit_price
+
+    @property
+    def line_total(self) -> Money:
+        return Money(self.qty * self.unit_price.paise)
+
+    def as_tuple(self) -> Tuple[str, int, Money, Money]:
+        """(item_name, qty, unit_price, line_total) as save_order expects"""
+        return (self.name, self.qty, self.unit_price, self.line_total)
+
+
+class Cart:
+    """
+    Order being rung up, with running totals.
+
+    Adding an item that is already in the cart merges into its line (the
+    line keeps the price it was first added at). The subtotal is updated
+    incrementally on every change, so totals() costs the same for 3 lines
+    or 3000 as long as the pricing rules treat every line alike (no GST
+    slabs, combos or category happy hours in use). Listeners are told which
+    line changed so views can update that row in place.
+
+    discount=None applies the automatic discounts from the pricing rules;
+    a percentage replaces them. rules=None follows the session's rules.
+    With a cache (utils/totals_cache.py), carts those rules have to price
+    line by line are looked up by their contents first.
+    """
+
+    def __init__(self, discount: Optional[float] = None, rules: Optional[CompiledRules] = None,
+                 cache: Optional["TotalsCache"] = None):
+        self.discount = discount
+        self._rules = rules
+        self.cache = cache
+        self._lines: Dict[str, CartLine] = {}
+        self._subtotal = 0   # paise
+        self._listeners: List[ChangeListener] = []
+
+    def add_listener(self, listener: ChangeListener):
+        self._listeners.append(listener)
+
+    def _notify(self, name: str, line: Optional[CartLine]):
+        for listener in self._listeners:
+            listener(name, line)
+
+    # ------------------- Editing -------------------
+    def add(self, name: str, qty: int, unit_price) -> CartLine:
+        if qty <= 0:
+            raise ValueError("qty must be positive")
+        line = self._lines.get(name)
+        if line is None:
+            line = self._lines[name] = CartLine(name, 0, Money.of(unit_price))
+        line.qty += qty
+        self._subtotal += qty * line.unit_price.paise
+        self._notify(name, line)
+        return line
+
+    def set_qty(self, name: str, qty: int, unit_price=None):
+        """Set an item's quantity; 0 removes it. unit_price is needed for new items."""
+        line = self._lines.get(name)
+        if qty <= 0:
+            if line is not None:
+                self.remove(name)
+            return None
+        if line is None:
+            if unit_price is None:
+                raise KeyError(name)
+            return self.add(name, qty, unit_price)
+        self._subtotal += (qty - line.qty) * line.unit_price.paise
+        line.qty = qty
+        self._notify(name, line)
+        return line
+
+    def remove(self, name: str):
+        line = self._lines.pop(name)
+        self._subtotal -= line.qty * line.unit_price.paise
+        self._notify(name, None)
+
+    def clear(self):
+        names = list(self._lines)
+        self._lines.clear()
+        self._subtotal = 0
+        for name in names:
+            self._notify(name, None)
+
+    # ------------------- Reading -------------------
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self) -> Iterator[CartLine]:
+        return iter(self._lines.values())
+
+    def __contains__(self, name: str):
+        return name in self._lines
+
+    def get(self, name: str) -> Optional[CartLine]:
+        return self._lines.get(name)
+
+    @property
+    def subtotal(self) -> Money:
+        return Money(self._subtotal)
+
+    @property
+    def rules(self) -> CompiledRules:
+        return self._rules or get_rules()
+
+    def totals(self, at: Optional[datetime] = None, rules: Optional[CompiledRules] = None) -> Dict[str, Money]:
+        """
+        Same keys and values as rules.totals(lines, at, discount).
+        rules: price with these instead of self.rules, e.g. rules resolved
+        on another thread so this call never touches the database
+        """
+        rules = rules or self.rules
+        subtotal = self._subtotal
+        if not rules.uniform:
+            lines = [(l.name, l.qty, l.unit_price.paise) for l in self._lines.values()]
+            if self.cache is not None:
+                return self.cache.totals(rules, lines, at, self.discount)
+            return rules.totals(lines, at, self.discount)
+        gst_amount, discount_amount = rules.price_subtotal(subtotal, at, self.discount)
+        return {
+            "subtotal": Money(subtotal),
+            "gst_amount": Money(gst_amount),
+            "discount_amount": Money(discount_amount),
+            "total": Money(subtotal + gst_amount - discount_amount),
+        }
+
+    def items(self) -> List[BillItem]:
+        return [BillItem(l.name, l.qty, l.unit_price) for l in self._lines.values()]
+
+    def order_lines(self) -> List[Tuple[str, int, Money, Money]]:
+        return [l.as_tuple() for l in self._lines.values()]
@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+from .metrics import connection_factory, incr, timed
+
+T = TypeVar("T")
+
+# journal_mode / synchronous values accepted by SQLite
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def is_lock_error(exc: BaseException) -> bool:
+    """True for "database is locked" / "busy" errors, which go away when retried"""
+    msg = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in msg or "busy" in msg)
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0            # get() calls
+    connections_opened: int = 0   # physical sqlite3.connect() calls
+    waits: int = 0                # checkouts that had to wait for a free slot
+    wait_seconds: float = 0.0
+    lock_retries: int = 0         # "database is locked" retries in run()
+
+
+class _Holder:
+    """Thread-local slot owning one connection; closes it when the thread goes away."""
+
+    def __init__(self, pool: "ConnectionPool", con: sqlite3.Connection):
+        self.con = con
+        self.pid = os.getpid()
+        self._finalizer = weakref.finalize(self, pool._discard, con, self.pid)
+
+    def close(self):
+        self._finalizer()
+
+
+class ConnectionPool:
+    """
+    Hands out one reusable SQLite connection per thread.
+
+    Connections are opened lazily, configured once (journal mode, synchronous,
+    busy_timeout) and then reused, so sqlite3's per-connection statement cache
+    keeps the prepared statements of the hot queries alive between calls.
+    At most `max_connections` threads hold a connection at the same time;
+    further threads wait for a slot to be freed.
+    """
+
+    def __init__(self, path, journal_mode: str = "WAL", synchronous: str = "NORMAL",
+                 busy_timeout_ms: int = 5000, cached_statements: int = 256,
+                 max_connections: int = 16, acquire_timeout: float = 30.0,
+                 lock_retries: int = 5, retry_backoff: float = 0.05):
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unknown journal_mode: {journal_mode}")
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown synchronous mode: {synchronous}")
+        self.path = Path(path)
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.max_connections = max_connections
+        self.acquire_timeout = acquire_timeout
+        self.lock_retries = lock_retries
+        self.retry_backoff = retry_backoff
+        self.stats = PoolStats()
+
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._open: Dict[int, sqlite3.Connection] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0,
+                              cached_statements=self.cached_statements,
+                              check_same_thread=False, factory=connection_factory())
+        con.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        con.execute(f"PRAGMA synchronous={self.synchronous}")
+        con.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return con
+
+    def _discard(self, con: sqlite3.Connection, pid: int):
+        with self._lock:
+            owned = self._open.pop(id(con), None) is not None
+        if not owned:
+            # already closed by close_all()
+            return
+        # A connection inherited through fork() belongs to the parent: never touch it
+        if pid == os.getpid():
+            con.close()
+        self._slots.release()
+
+    @timed("pool.get")
+    def get(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        holder: Optional[_Holder] = getattr(self._local, "holder", None)
+        with self._lock:
+            self.stats.checkouts += 1
+        if holder is not None and holder.pid == os.getpid():
+            return holder.con
+
+        if not self._slots.acquire(blocking=False):
+            start = time.perf_counter()
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                raise sqlite3.OperationalError("connection pool exhausted")
+            with self._lock:
+                self.stats.waits += 1
+                self.stats.wait_seconds += time.perf_counter() - start
+        try:
+            con = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.stats.connections_opened += 1
+            self._open[id(con)] = con
+        self._local.holder = _Holder(self, con)
+        return con
+
+    def release(self):
+        """Close the calling thread's connection and free its slot"""
+        holder = getattr(self._local, "holder", None)
+        if holder is not None:
+            del self._local.holder
+            holder.close()
+
+    def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """
+        Run fn(con) in a transaction on this thread's connection, retrying
+        with exponential backoff while the database is locked by another writer.
+        """
+        con = self.get()
+        attempt = 0
+        while True:
+            try:
+                with con:
+                    return fn(con)
+            except sqlite3.OperationalError as e:
+                if attempt >= self.lock_retries or not is_lock_error(e):
+                    raise
+                with self._lock:
+                    self.stats.lock_retries += 1
+                incr("pool.lock_retries")
+                time.sleep(self.retry_backoff * (2 ** attempt))
+                attempt += 1
+
+    def close_all(self):
+        """Close every connection handed out by this pool"""
+        with self._lock:
+            cons = list(self._open.values())
+            self._open.clear()
+        for con in cons:
+            try:
+                con.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+
+    def stats_dict(self) -> Dict[str, float]:
+        with self._lock:
+            data = asdict(self.stats)
+            data["open_connections"] = len(self._open)
+        return data
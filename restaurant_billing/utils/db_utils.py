@@ -1,123 +1,753 @@
+import json
 import sqlite3
 from pathlib import Path
-import csv
-from datetime import datetime
-from typing import List, Tuple
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from .db_pool import ConnectionPool
+from .metrics import timed
+from .money import Money
+
+if TYPE_CHECKING:
+    # concurrent.futures pulls in logging; only write-behind mode needs it at runtime
+    from concurrent.futures import Future
+
+# Money values or plain rupee amounts (10, 9.5, "12.50")
+Amount = Union[Money, int, float, str]
 
 # Database file path (relative to project)
 BASE_DIR = Path(__file__).resolve().parents[1]
 DB_PATH = BASE_DIR / "db" / "restaurant.db"
 MENU_CSV = BASE_DIR / "data" / "menu.csv"
 
+# Connection pool tuning (see utils/db_pool.py)
+POOL_OPTIONS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout_ms": 5000,
+}
+
+_pool: Optional[ConnectionPool] = None
+
+def get_pool() -> ConnectionPool:
+    """Return the shared pool, (re)creating it when DB_PATH has changed"""
+    global _pool
+    if _pool is None or _pool.path != Path(DB_PATH):
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(DB_PATH, **POOL_OPTIONS)
+    return _pool
+
+def configure_pool(**options):
+    """Override pool options (journal_mode, synchronous, busy_timeout_ms, ...)"""
+    global _pool
+    POOL_OPTIONS.update(options)
+    if _pool is not None:
+        _pool.close_all()
+        _pool = None
+
+def pool_stats() -> Dict[str, float]:
+    return get_pool().stats_dict()
+
 def get_conn():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+    """Return this thread's pooled connection (usable as `with get_conn() as con:`)"""
+    return get_pool().get()
 
-def init_db():
-    """Create tables if they don't exist"""
-    with get_conn() as con:
-        cur = con.cursor()
+# Bump when the schema changes and add a step to MIGRATIONS
+SCHEMA_VERSION = 8
+
+# Table definitions (column list). Money is stored as INTEGER paise.
+TABLES = {
+    "menu": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        category TEXT,
+        price_paise INTEGER NOT NULL
+    """,
+    "orders": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mode TEXT NOT NULL,
+        payment_method TEXT NOT NULL,
+        subtotal_paise INTEGER NOT NULL,
+        gst_paise INTEGER NOT NULL,
+        discount_paise INTEGER NOT NULL,
+        total_paise INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    """,
+    "order_items": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        item_name TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        unit_price_paise INTEGER NOT NULL,
+        line_total_paise INTEGER NOT NULL,
+        -- NULL for open items that are not on the menu; item_name keeps the name as billed
+        menu_item_id INTEGER REFERENCES menu(id),
+        FOREIGN KEY(order_id) REFERENCES orders(id)
+    """,
+    # one row per price a menu item has had; valid_to is NULL for the current price
+    "menu_price_history": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        menu_item_id INTEGER NOT NULL REFERENCES menu(id),
+        price_paise INTEGER NOT NULL,
+        valid_from TEXT NOT NULL,
+        valid_to TEXT
+    """,
+    # highest spooled order committed by each write-behind writer (utils/order_writer.py)
+    "order_spool": """
+        spool TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL
+    """,
+    # single row, bumped by triggers on every menu change (utils/menu_cache.py)
+    "menu_version": """
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    """,
+    # GST slabs and discounts (utils/rules.py); items is a JSON list, days e.g. "0,1,2"
+    "pricing_rules": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        percent REAL NOT NULL,
+        category TEXT,
+        above_paise INTEGER,
+        items TEXT,
+        days TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        active INTEGER NOT NULL DEFAULT 1
+    """,
+    # single row, bumped by triggers on every pricing_rules change
+    "rules_version": """
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    """,
+    # append-only order history (utils/ledger.py): created/item_added/voided/paid/refunded
+    "order_events": """
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        amount_paise INTEGER NOT NULL,
+        method TEXT,
+        data TEXT,
+        created_at TEXT NOT NULL
+    """,
+    # ledger state as of event `seq`, as JSON
+    "ledger_snapshots": """
+        seq INTEGER PRIMARY KEY,
+        taken_at TEXT NOT NULL,
+        state TEXT NOT NULL
+    """,
+    # WhatsApp bills waiting for / after delivery (utils/dispatch.py)
+    "whatsapp_outbox": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone TEXT NOT NULL,
+        message TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at TEXT NOT NULL,
+        sent_at TEXT
+    """,
+    # source order_ref of every order loaded by utils/importer.py, so re-imports skip it
+    "order_imports": """
+        source_ref TEXT PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        imported_at TEXT NOT NULL
+    """,
+    # months moved out to the columnar archive (utils/archive.py)
+    "archive_months": """
+        month TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL,
+        lines INTEGER NOT NULL,
+        archived_at TEXT NOT NULL
+    """,
+}
+
+def _columns(cur, table: str) -> List[str]:
+    return [r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def _migrate_to_paise(cur):
+    """Schema 1: REAL rupee columns become INTEGER paise columns"""
+    legacy = {
+        "menu": "id, name, category, CAST(ROUND(price*100) AS INTEGER)",
+        "orders": """id, mode, payment_method,
+            CAST(ROUND(subtotal*100) AS INTEGER), CAST(ROUND(gst_amount*100) AS INTEGER),
+            CAST(ROUND(discount*100) AS INTEGER), CAST(ROUND(total*100) AS INTEGER),
+            created_at""",
+        "order_items": """id, order_id, item_name, qty,
+            CAST(ROUND(unit_price*100) AS INTEGER), CAST(ROUND(line_total*100) AS INTEGER),
+            NULL""",
+    }
+    marker = {"menu": "price", "orders": "total", "order_items": "unit_price"}
+    for table, select in legacy.items():
+        if marker[table] not in _columns(cur, table):
+            continue
+        cur.execute(f"CREATE TABLE {table}_new ({TABLES[table]})")
+        cur.execute(f"INSERT INTO {table}_new SELECT {select} FROM {table}")
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    # Rollups are derived data: drop them and let create_rollups() rebuild in paise
+    cur.execute("DROP TRIGGER IF EXISTS orders_rollup_ai")
+    for table, _key in ROLLUPS.values():
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+
+def _migrate_item_ids(cur):
+    """Schema 5: order lines reference menu.id; indexes are replaced by covering ones"""
+    columns = _columns(cur, "order_items")
+    if columns and "menu_item_id" not in columns:
+        cur.execute("ALTER TABLE order_items ADD COLUMN menu_item_id INTEGER REFERENCES menu(id)")
+    if columns:
+        # also covers tables _migrate_to_paise just rebuilt with the column already in place
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS menu (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                category TEXT,
-                price REAL NOT NULL
-            )
+            UPDATE order_items
+            SET menu_item_id = (SELECT id FROM menu WHERE menu.name = order_items.item_name)
+            WHERE menu_item_id IS NULL
         """)
+    cur.execute("DROP INDEX IF EXISTS idx_orders_created_at")
+    cur.execute("DROP INDEX IF EXISTS idx_order_items_order")
+
+def _add_pricing_rules(cur):
+    """Schema 6: pricing rules table, seeded with the GST and bulk discount that were hardcoded"""
+    cur.execute(f"CREATE TABLE IF NOT EXISTS pricing_rules ({TABLES['pricing_rules']})")
+    if cur.execute("SELECT 1 FROM pricing_rules LIMIT 1").fetchone() is None:
+        cur.executemany("INSERT INTO pricing_rules(kind, percent, above_paise) VALUES (?, ?, ?)",
+                        [("gst", 5.0, None), ("threshold", 10.0, 10000)])
+
+def _add_order_ledger(cur):
+    """Schema 7: order event ledger, backfilled with created + paid events for existing orders"""
+    cur.execute(f"CREATE TABLE IF NOT EXISTS order_events ({TABLES['order_events']})")
+    if DB_PATH.with_suffix(".archive").is_dir():
+        # archived months are older than anything still in orders, so they go first
+        from .archive import archived_months, open_partition
+        for month in archived_months():
+            with open_partition(month) as part:
+                cur.executemany("""
+                    INSERT INTO order_events(order_id, kind, amount_paise, method, created_at)
+                    VALUES (?,?,?,?,?)
+                """, [ev for (i, _mode, pay, _s, _g, _d, total, created) in part.orders()
+                      for ev in ((i, "created", total, None, created), (i, "paid", total, pay, created))])
+    if _columns(cur, "orders"):
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                mode TEXT NOT NULL,
-                payment_method TEXT NOT NULL,
-                subtotal REAL NOT NULL,
-                gst_amount REAL NOT NULL,
-                discount REAL NOT NULL,
-                total REAL NOT NULL,
-                created_at TEXT NOT NULL
-            )
+            INSERT INTO order_events(order_id, kind, amount_paise, method, created_at)
+            SELECT id, kind, total_paise, CASE kind WHEN 'paid' THEN payment_method END, created_at
+            FROM orders, (SELECT 'created' AS kind UNION ALL SELECT 'paid')
+            ORDER BY created_at, id, kind DESC
         """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS order_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER NOT NULL,
-                item_name TEXT NOT NULL,
-                qty INTEGER NOT NULL,
-                unit_price REAL NOT NULL,
-                line_total REAL NOT NULL,
-                FOREIGN KEY(order_id) REFERENCES orders(id)
+
+# (schema version, step) applied in order to databases older than that version
+MIGRATIONS = [
+    (1, _migrate_to_paise),
+    (5, _migrate_item_ids),
+    (6, _add_pricing_rules),
+    (7, _add_order_ledger),
+]
+
+# Covering indexes: reports read these columns without touching the tables
+INDEXES = {
+    # date-range scans (reports, analytics heatmap, archive)
+    "idx_orders_created": "orders(created_at, total_paise)",
+    # order -> lines join for a date range of orders
+    "idx_order_items_order": "order_items(order_id, menu_item_id, qty, line_total_paise)",
+    # per-item aggregates over all history
+    "idx_order_items_menu_item": "order_items(menu_item_id, qty, line_total_paise)",
+    "idx_price_history_item": "menu_price_history(menu_item_id, valid_from)",
+    "idx_outbox_due": "whatsapp_outbox(status, next_attempt_at)",
+    "idx_order_events_order": "order_events(order_id, seq)",
+}
+
+@timed("db.init_db")
+def init_db(force: bool = False):
+    """
+    Create tables if they don't exist and migrate older databases.
+    A database already at SCHEMA_VERSION is left alone unless force is set,
+    so a normal launch costs one PRAGMA read instead of a locked DDL pass.
+    """
+    con = get_conn()
+    if not force and con.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        _recover_archive()
+        return
+    with con:
+        cur = con.cursor()
+        # one transaction, so terminals starting together don't race on DDL
+        cur.execute("BEGIN IMMEDIATE")
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        for target, step in MIGRATIONS:
+            if version < target:
+                step(cur)
+        for table, columns in TABLES.items():
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+        for name, target in INDEXES.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        create_rollups(cur)
+        create_order_ledger(cur)
+        create_menu_version(cur)
+        create_rules_version(cur)
+        create_price_history(cur)
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        con.commit()
+    _recover_archive()
+
+def _recover_archive():
+    if DB_PATH.with_suffix(".archive").is_dir():
+        from .archive import recover
+        recover()
+
+def create_menu_version(cur):
+    """Triggers that bump menu_version.version whenever a menu row changes"""
+    cur.execute("INSERT OR IGNORE INTO menu_version(id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS menu_version_{event.lower()} AFTER {event} ON menu
+            BEGIN
+                UPDATE menu_version SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+def create_rules_version(cur):
+    """Triggers that bump rules_version.version whenever a pricing rule changes"""
+    cur.execute("INSERT OR IGNORE INTO rules_version(id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS rules_version_{event.lower()} AFTER {event} ON pricing_rules
+            BEGIN
+                UPDATE rules_version SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+def create_price_history(cur):
+    """
+    Triggers that record every menu price in menu_price_history, and a
+    backfill giving items without an open history row their current price.
+    """
+    now = "strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')"
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS menu_price_ai AFTER INSERT ON menu
+        BEGIN
+            INSERT INTO menu_price_history(menu_item_id, price_paise, valid_from)
+            VALUES (NEW.id, NEW.price_paise, {now});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS menu_price_au AFTER UPDATE OF price_paise ON menu
+        WHEN NEW.price_paise != OLD.price_paise
+        BEGIN
+            UPDATE menu_price_history SET valid_to = {now}
+            WHERE menu_item_id = NEW.id AND valid_to IS NULL;
+            INSERT INTO menu_price_history(menu_item_id, price_paise, valid_from)
+            VALUES (NEW.id, NEW.price_paise, {now});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS menu_price_ad AFTER DELETE ON menu
+        BEGIN
+            UPDATE menu_price_history SET valid_to = {now}
+            WHERE menu_item_id = OLD.id AND valid_to IS NULL;
+        END
+    """)
+    # prices from before the history existed count as valid since forever
+    cur.execute("""
+        INSERT INTO menu_price_history(menu_item_id, price_paise, valid_from)
+        SELECT id, price_paise, '0001-01-01T00:00:00' FROM menu
+        WHERE id NOT IN (SELECT menu_item_id FROM menu_price_history WHERE valid_to IS NULL)
+    """)
+
+def menu_version() -> int:
+    """Current menu version; changes whenever any terminal edits the menu"""
+    with get_conn() as con:
+        row = con.execute("SELECT version FROM menu_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+def rules_version() -> int:
+    """Current pricing rules version; changes whenever any terminal edits the rules"""
+    with get_conn() as con:
+        row = con.execute("SELECT version FROM rules_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+def fetch_pricing_rules() -> List[Dict[str, object]]:
+    """Active pricing rules as dicts in the utils.rules file format"""
+    with get_conn() as con:
+        rows = con.execute("""
+            SELECT kind, percent, category, above_paise, items, days, start_time, end_time
+            FROM pricing_rules WHERE active ORDER BY id
+        """).fetchall()
+    rules = []
+    for kind, percent, category, above, items, days, start, end in rows:
+        rules.append({
+            "kind": kind, "percent": percent, "category": category,
+            "above": None if above is None else str(Money(above)),
+            "items": json.loads(items) if items else [],
+            "days": [int(d) for d in days.split(",")] if days else [],
+            "start": start, "end": end,
+        })
+    return rules
+
+# ------------------- Sales rollups -------------------
+# period -> (rollup table, expression deriving the period key from a timestamp/date)
+ROLLUPS = {
+    "daily": ("sales_daily", "substr({},1,10)"),
+    "weekly": ("sales_weekly", "strftime('%Y-W%W', {})"),
+    "monthly": ("sales_monthly", "substr({},1,7)"),
+}
+
+def _rollup(period: str) -> Tuple[str, str]:
+    # anything that is not daily/weekly has always meant monthly
+    return ROLLUPS.get(period, ROLLUPS["monthly"])
+
+def create_rollups(cur):
+    """
+    Create the daily/weekly/monthly rollup tables and the trigger that keeps
+    them current on every insert into orders. Backfills them when they are new.
+    """
+    cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='sales_daily'")
+    existed = cur.fetchone()[0] > 0
+    upserts = []
+    for table, key in ROLLUPS.values():
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                period_key TEXT PRIMARY KEY,
+                total_sales_paise INTEGER NOT NULL,
+                total_orders INTEGER NOT NULL
             )
         """)
-        con.commit()
+        upserts.append(f"""
+            INSERT INTO {table}(period_key, total_sales_paise, total_orders)
+            VALUES ({key.format("NEW.created_at")}, NEW.total_paise, 1)
+            ON CONFLICT(period_key) DO UPDATE SET
+                total_sales_paise = total_sales_paise + excluded.total_sales_paise,
+                total_orders = total_orders + 1;
+        """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_ai AFTER INSERT ON orders
+        BEGIN
+            {"".join(upserts)}
+        END
+    """)
+    if not existed:
+        _rebuild_rollups(cur)
+
+def create_order_ledger(cur):
+    """Trigger recording every saved order in order_events: created, then paid in full"""
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS orders_ledger_ai AFTER INSERT ON orders
+        BEGIN
+            INSERT INTO order_events(order_id, kind, amount_paise, created_at)
+            VALUES (NEW.id, 'created', NEW.total_paise, NEW.created_at);
+            INSERT INTO order_events(order_id, kind, amount_paise, method, created_at)
+            VALUES (NEW.id, 'paid', NEW.total_paise, NEW.payment_method, NEW.created_at);
+        END
+    """)
+
+def _period_key(period: str, day: str) -> str:
+    """Python twin of the ROLLUPS key expressions, for a 'YYYY-MM-DD' day"""
+    if period == "daily":
+        return day
+    if period == "weekly":
+        return date.fromisoformat(day).strftime("%Y-W%W")
+    return day[:7]
 
+def _archived_sales(period: str, start: Optional[str] = None,
+                    end: Optional[str] = None) -> Dict[str, List[int]]:
+    """period_key -> [total_paise, orders] for orders moved to utils/archive.py"""
+    if not DB_PATH.with_suffix(".archive").is_dir():
+        return {}
+    from .archive import daily_totals
+    out: Dict[str, List[int]] = {}
+    for day, (paise, n) in daily_totals(start, end).items():
+        cell = out.setdefault(_period_key(period, day), [0, 0])
+        cell[0] += paise
+        cell[1] += n
+    return out
+
+def _rebuild_rollups(cur):
+    for period, (table, key) in ROLLUPS.items():
+        cur.execute(f"DELETE FROM {table}")
+        cur.execute(f"""
+            INSERT INTO {table}(period_key, total_sales_paise, total_orders)
+            SELECT {key.format("created_at")} AS k, SUM(total_paise), COUNT(*)
+            FROM orders
+            GROUP BY k
+        """)
+        cur.executemany(f"""
+            INSERT INTO {table}(period_key, total_sales_paise, total_orders) VALUES (?,?,?)
+            ON CONFLICT(period_key) DO UPDATE SET
+                total_sales_paise = total_sales_paise + excluded.total_sales_paise,
+                total_orders = total_orders + excluded.total_orders
+        """, [(k, paise, n) for k, (paise, n) in _archived_sales(period).items()])
+
+def rebuild_rollups():
+    """Recompute every rollup table from the raw orders table and the archive"""
+    with get_conn() as con:
+        _rebuild_rollups(con.cursor())
+
+@timed("db.bootstrap_menu")
 def bootstrap_menu_from_csv():
     """Load menu.csv into DB if menu table is empty"""
     if not MENU_CSV.exists():
         return
     with get_conn() as con:
+        cnt = con.execute("SELECT COUNT(*) FROM menu").fetchone()[0]
+    if cnt > 0:
+        return
+    # streamed in chunks; bad rows are skipped (see utils/importer.py for a reject file)
+    from .importer import import_menu
+    import_menu(MENU_CSV, upsert=False)
+
+@timed("db.fetch_menu")
+def fetch_menu(as_of: Optional[str] = None) -> List[Tuple[int, str, str, Money]]:
+    """
+    Return list of (id, name, category, price).
+    as_of: optional 'YYYY-MM-DDTHH:MM:SS'; prices as they were at that time.
+    Past menus can come from the reporting replica; the current menu is always
+    read live, since MenuCache pairs it with the live menu_version.
+    """
+    con, source, snapshot_at, _age = _report_conn(live=as_of is None)
+    if source == "replica" and as_of > snapshot_at.isoformat(timespec="seconds"):
+        con = get_conn()   # the replica predates as_of
+    with con:
         cur = con.cursor()
-        cur.execute("SELECT COUNT(*) FROM menu")
-        cnt = cur.fetchone()[0]
-        if cnt > 0:
-            return
-        with open(MENU_CSV, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            rows = []
-            for r in reader:
-                try:
-                    name = r['name'].strip()
-                    category = r.get('category','').strip()
-                    price = float(r['price'])
-                    rows.append((name, category, price))
-                except Exception:
-                    continue
-        cur.executemany("INSERT OR IGNORE INTO menu(name, category, price) VALUES(?,?,?)", rows)
-        con.commit()
+        if as_of is None:
+            cur.execute("SELECT id, name, category, price_paise FROM menu ORDER BY name")
+        else:
+            cur.execute("""
+                SELECT m.id, m.name, m.category, h.price_paise
+                FROM menu m JOIN menu_price_history h ON h.menu_item_id = m.id
+                WHERE h.valid_from <= ? AND (h.valid_to IS NULL OR h.valid_to > ?)
+                ORDER BY m.name
+            """, (as_of, as_of))
+        return [(i, n, c, Money(p)) for (i, n, c, p) in cur.fetchall()]
 
-def fetch_menu() -> List[Tuple[int, str, str, float]]:
-    """Return list of (id, name, category, price)"""
+def price_history(menu_item_id: int) -> List[Tuple[Money, str, Optional[str]]]:
+    """(price, valid_from, valid_to) of one menu item, oldest first"""
     with get_conn() as con:
-        cur = con.cursor()
-        cur.execute("SELECT id, name, category, price FROM menu ORDER BY name")
-        return cur.fetchall()
+        rows = con.execute("""
+            SELECT price_paise, valid_from, valid_to FROM menu_price_history
+            WHERE menu_item_id = ? ORDER BY valid_from, id
+        """, (menu_item_id,)).fetchall()
+    return [(Money(p), a, b) for (p, a, b) in rows]
+
+def _paise(amount: Amount) -> int:
+    return Money.of(amount).paise
+
+# SQL expression for the menu id of an item name parameter (NULL when not on the menu)
+MENU_ITEM_ID = "(SELECT id FROM menu WHERE name = ?)"
+
+def insert_order(cur, mode: str, payment: str, items: List[Tuple[str,int,Amount,Amount]],
+                 subtotal: Amount, gst_amount: Amount, discount: Amount, total: Amount,
+                 created_at: str) -> int:
+    """Insert one order and its items on an open cursor; returns order_id"""
+    cur.execute("""
+        INSERT INTO orders(mode, payment_method, subtotal_paise, gst_paise, discount_paise,
+                           total_paise, created_at)
+        VALUES (?,?,?,?,?,?,?)
+    """, (mode, payment, _paise(subtotal), _paise(gst_amount), _paise(discount),
+          _paise(total), created_at))
+    order_id = cur.lastrowid
+    # menu_item_id is resolved through the unique index on menu.name
+    cur.executemany(f"""
+        INSERT INTO order_items(order_id, menu_item_id, item_name, qty, unit_price_paise, line_total_paise)
+        VALUES (?, {MENU_ITEM_ID}, ?, ?, ?, ?)
+    """, [(order_id, n, n, q, _paise(p), _paise(lt)) for (n,q,p,lt) in items])
+    return order_id
 
-def save_order(mode: str, payment: str, items: List[Tuple[str,int,float,float]],
-               subtotal: float, gst_amount: float, discount: float, total: float) -> int:
+@timed("db.save_order")
+def save_order(mode: str, payment: str, items: List[Tuple[str,int,Amount,Amount]],
+               subtotal: Amount, gst_amount: Amount, discount: Amount, total: Amount) -> int:
     """
     items: list of tuples (item_name, qty, unit_price, line_total)
+    amounts are Money or plain rupee values
     returns order_id
     """
-    with get_conn() as con:
-        cur = con.cursor()
-        cur.execute("""
-            INSERT INTO orders(mode, payment_method, subtotal, gst_amount, discount, total, created_at)
-            VALUES (?,?,?,?,?,?,?)
-        """, (mode, payment, subtotal, gst_amount, discount, total, datetime.now().isoformat(timespec='seconds')))
-        order_id = cur.lastrowid
-        cur.executemany("""
-            INSERT INTO order_items(order_id, item_name, qty, unit_price, line_total)
-            VALUES (?,?,?,?,?)
-        """, [(order_id, n, q, p, lt) for (n,q,p,lt) in items])
-        con.commit()
-        return order_id
+    created_at = datetime.now().isoformat(timespec='seconds')
+
+    def write(con):
+        return insert_order(con.cursor(), mode, payment, items,
+                            subtotal, gst_amount, discount, total, created_at)
+
+    # retried on "database is locked" when several terminals write at once
+    return get_pool().run(write)
 
-def sales_report(period: str = "daily"):
+# ------------------- Write-behind mode -------------------
+_writer = None
+
+def enable_write_behind(spool_path=None, batch_size: int = 50, max_latency: float = 0.2,
+                        fsync: bool = True):
+    """
+    Route submit_order() through a background group-commit writer
+    (utils/order_writer.py). Orders left in the spool by a crash are
+    queued ahead of new ones; orders the database rejects are moved to
+    the spool's .rejected file instead of being retried forever.
+    """
+    global _writer
+    from .order_writer import OrderWriter
+    if _writer is None:
+        _writer = OrderWriter(spool_path, batch_size=batch_size,
+                              max_latency=max_latency, fsync=fsync)
+    return _writer
+
+def disable_write_behind():
+    """Flush pending orders and go back to synchronous writes"""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+@timed("db.submit_order")
+def submit_order(mode: str, payment: str, items: List[Tuple[str,int,Amount,Amount]],
+                 subtotal: Amount, gst_amount: Amount, discount: Amount, total: Amount) -> "Future":
+    """
+    Like save_order, but returns a Future resolving to the order_id.
+    In write-behind mode the order is committed later in a batch;
+    otherwise it is saved synchronously and the Future is already done.
+    """
+    if _writer is not None:
+        return _writer.submit(mode, payment, items, subtotal, gst_amount, discount, total)
+    from concurrent.futures import Future
+    fut: Future = Future()
+    fut.set_result(save_order(mode, payment, items, subtotal, gst_amount, discount, total))
+    return fut
+
+# ------------------- Reporting replica -------------------
+_replica = None
+
+class ReportRows(list):
+    """
+    Report rows plus where they were read from: source is "live" or
+    "replica", as_of is when the data was current, age its staleness in seconds.
+    """
+
+    def __init__(self, rows, source: str = "live", as_of: Optional[datetime] = None, age: float = 0.0):
+        super().__init__(rows)
+        self.source = source
+        self.as_of = as_of or datetime.now()
+        self.age = age
+
+def enable_replica(path=None, max_staleness: float = 60.0, background: bool = False):
+    """
+    Serve reports from a snapshot copy of the database (utils/replica.py),
+    recopied once it is more than max_staleness seconds old. With background
+    set a thread keeps it fresh, so no report waits for a copy.
+    """
+    global _replica
+    from .replica import Replica
+    disable_replica()
+    _replica = Replica(DB_PATH, path, max_staleness)
+    if background:
+        _replica.start()
+    return _replica
+
+def disable_replica():
+    """Go back to reading reports from the live database"""
+    global _replica
+    if _replica is not None:
+        _replica.close()
+        _replica = None
+
+def report_db_path() -> Path:
+    """Database file reporting reads go to: the fresh replica if enabled, else DB_PATH"""
+    if _replica is not None and _replica.source == Path(DB_PATH):
+        _replica.ensure_fresh()
+        return _replica.path
+    return Path(DB_PATH)
+
+def _report_conn(live: bool = False):
+    """(connection, source, as_of, age) for a report; the live pool unless a replica is enabled"""
+    if live or _replica is None or _replica.source != Path(DB_PATH):
+        return get_conn(), "live", None, 0.0
+    con = _replica.connection()
+    return con, "replica", _replica.as_of, _replica.age()
+
+def _date_range(start: Optional[str], end: Optional[str]) -> Tuple[str, str]:
+    # start/end are inclusive 'YYYY-MM-DD' dates; missing bounds are open
+    return (start or "0000-00-00", end or "9999-99-99")
+
+@timed("db.sales_report")
+def sales_report(period: str = "daily", start: Optional[str] = None, end: Optional[str] = None,
+                 live: bool = False):
     """
     period: 'daily', 'weekly', 'monthly'
-    returns list of tuples (period_key, total_sales, total_orders)
+    start, end: optional inclusive date range ('YYYY-MM-DD')
+    live: read the live database even when a reporting replica is enabled
+    returns ReportRows of tuples (period_key, total_sales: Money, total_orders)
     """
-    with get_conn() as con:
+    table, key = _rollup(period)
+    con, source, as_of, age = _report_conn(live)
+    with con:
         cur = con.cursor()
-        if period == "daily":
-            key = "substr(created_at,1,10)"
-        elif period == "weekly":
-            key = "strftime('%Y-W%W', created_at)"
+        if start is None and end is None:
+            cur.execute(f"""
+                SELECT period_key, total_sales_paise, total_orders
+                FROM {table}
+                ORDER BY period_key
+            """)
         else:
-            key = "substr(created_at,1,7)"
+            # partial weeks/months: re-bucket the (small) daily rollup inside the range
+            cur.execute(f"""
+                SELECT {key.format("period_key")} as k, SUM(total_sales_paise), SUM(total_orders)
+                FROM sales_daily
+                WHERE period_key BETWEEN ? AND ?
+                GROUP BY k
+                ORDER BY k
+            """, _date_range(start, end))
+        return ReportRows([(k, Money(paise), n) for (k, paise, n) in cur.fetchall()], source, as_of, age)
+
+def raw_sales_report(period: str = "daily", start: Optional[str] = None, end: Optional[str] = None,
+                     live: bool = False):
+    """sales_report computed straight from the orders table and the archive (used to verify the rollups)"""
+    _table, key = _rollup(period)
+    lo = start or "0000-00-00"
+    # created_at carries a time, so compare against the day after `end`
+    hi = (date.fromisoformat(end) + timedelta(days=1)).isoformat() if end else "9999"
+    con, source, as_of, age = _report_conn(live)
+    with con:
+        cur = con.cursor()
         cur.execute(f"""
-            SELECT {key} as k, SUM(total) as total_sales, COUNT(*) as total_orders
+            SELECT {key.format("created_at")} as k, SUM(total_paise) as total_sales, COUNT(*) as total_orders
             FROM orders
+            WHERE created_at >= ? AND created_at < ?
             GROUP BY k
             ORDER BY k
-        """)
-        return cur.fetchall()
\ No newline at end of file
+        """, (lo, hi))
+        rows = cur.fetchall()
+    archived = _archived_sales(period, start, end)
+    if archived:
+        for k, paise, n in rows:
+            cell = archived.setdefault(k, [0, 0])
+            cell[0] += paise
+            cell[1] += n
+        rows = sorted((k, paise, n) for k, (paise, n) in archived.items())
+    return ReportRows([(k, Money(paise), n) for (k, paise, n) in rows], source, as_of, age)
+
+def check_rollups(period: Optional[str] = None):
+    """
+    Compare rollups with the raw orders table.
+    returns list of (period, period_key, rollup_row, raw_row) for every mismatch
+    """
+    mismatches = []
+    for p in ([period] if period else list(ROLLUPS)):
+        rolled = {r[0]: r for r in sales_report(p, live=True)}
+        raw = {r[0]: r for r in raw_sales_report(p, live=True)}
+        for k in sorted(set(rolled) | set(raw)):
+            a, b = rolled.get(k), raw.get(k)
+            if a != b:
+                mismatches.append((p, k, a, b))
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python -m utils.db_utils rebuild-rollups | check-rollups
+    import sys
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    init_db(force=True)
+    if cmd == "rebuild-rollups":
+        rebuild_rollups()
+        print("Rollups rebuilt.")
+    elif cmd == "check-rollups":
+        bad = check_rollups()
+        for p, k, a, b in bad:
+            print(f"{p} {k}: rollup={a} raw={b}")
+        print("Rollups consistent." if not bad else f"{len(bad)} mismatching periods.")
+        sys.exit(1 if bad else 0)
+    else:
+        print("usage: python -m utils.db_utils rebuild-rollups|check-rollups")
+        sys.exit(2)
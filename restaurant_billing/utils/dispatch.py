@@ -0,0 +1,243 @@
+import datetime
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import db_utils
+from .metrics import incr, span
+
+# sender(phone, message) delivers one message or raises
+Sender = Callable[[str, str], None]
+# on_status(outbox_id, status, error) -- called from the worker thread
+StatusCallback = Callable[[int, str, Optional[str]], None]
+
+PENDING, SENDING, SENT, FAILED = "pending", "sending", "sent", "failed"
+
+# A claimed message counts as abandoned (crashed terminal) after this many seconds
+SEND_LEASE = 600.0
+
+
+# ------------------- Senders -------------------
+def pywhatkit_sender(phone: str, message: str):
+    """Send through WhatsApp Web with pywhatkit, scheduled one minute ahead"""
+    # imported here: pywhatkit is slow to import and probes the network
+    import pywhatkit as kit
+    when = datetime.datetime.now() + datetime.timedelta(minutes=1)
+    kit.sendwhatmsg(phone, message, when.hour, when.minute, wait_time=10, tab_close=True)
+
+
+class FileSender:
+    """Local stand-in for WhatsApp: appends messages to a text file"""
+
+    def __init__(self, path, fail_times: int = 0):
+        self.path = Path(path)
+        self.fail_times = fail_times   # fail this many calls first (for retry testing)
+        self.calls = 0
+
+    def __call__(self, phone: str, message: str):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise ConnectionError("simulated send failure")
+        now = datetime.datetime.now()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(f"Date: {now.day}/{now.month}/{now.year}\nTime: {now.hour}:{now.minute}\n"
+                    f"Phone Number: {phone}\nMessage: {message}\n--------------------\n")
+
+
+# ------------------- Outbox -------------------
+def enqueue_message(phone: str, message: str) -> int:
+    """Persist a message in the outbox; returns its id"""
+    def write(con):
+        cur = con.execute("""
+            INSERT INTO whatsapp_outbox(phone, message, status, attempts, next_attempt_at, created_at)
+            VALUES (?, ?, ?, 0, ?, ?)
+        """, (phone, message, PENDING, time.time(),
+              datetime.datetime.now().isoformat(timespec='seconds')))
+        return cur.lastrowid
+    return db_utils.get_pool().run(write)
+
+
+def outbox_status(outbox_id: int):
+    """(status, attempts, last_error) of one message, or None"""
+    with db_utils.get_conn() as con:
+        return con.execute("SELECT status, attempts, last_error FROM whatsapp_outbox WHERE id = ?",
+                           (outbox_id,)).fetchone()
+
+
+class DispatchWorker:
+    """
+    Background delivery of outbox messages.
+
+    Messages are retried with exponential backoff (base_backoff * 2**n,
+    capped at max_backoff) up to max_attempts, and consecutive sends are
+    spaced at least min_interval seconds apart. Each attempt is claimed
+    with a conditional UPDATE, so several terminals can run a worker
+    against the same database without sending a message twice. A claim
+    is a lease of SEND_LEASE seconds: a message whose worker died mid-send
+    is claimed again once it runs out.
+
+    Database errors (e.g. "database is locked" after the pool's retries)
+    never end the worker: they are logged and the loop backs off and
+    carries on. A send whose outcome could not be recorded is retried
+    until it is, so the claim is not left behind.
+    """
+
+    def __init__(self, sender: Sender = pywhatkit_sender, on_status: Optional[StatusCallback] = None,
+                 max_attempts: int = 5, base_backoff: float = 30.0, max_backoff: float = 900.0,
+                 min_interval: float = 5.0, poll_interval: float = 1.0):
+        self.sender = sender
+        self.on_status = on_status
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.min_interval = min_interval
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_send = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._reset_interrupted()
+        self._thread = threading.Thread(target=self._run, name="whatsapp-dispatch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def enqueue(self, phone: str, message: str) -> int:
+        outbox_id = enqueue_message(phone, message)
+        self._wake.set()
+        return outbox_id
+
+    def _reset_interrupted(self):
+        # a crash mid-send leaves rows in 'sending'; retry them once their lease ran out
+        def reset(con):
+            con.execute("""
+                UPDATE whatsapp_outbox SET status = ?
+                WHERE status = ? AND next_attempt_at <= ?
+            """, (PENDING, SENDING, time.time()))
+        try:
+            db_utils.get_pool().run(reset)
+        except sqlite3.Error as e:
+            # _claim() takes over expired leases as well
+            self._log_error("could not release expired claims", e)
+
+    def _claim(self):
+        """Mark the next due message as sending; returns (id, phone, message, attempts) or None"""
+        def claim(con):
+            now = time.time()
+            # due messages, and claims whose lease ran out (their worker died mid-send)
+            row = con.execute("""
+                SELECT id, phone, message, attempts, status FROM whatsapp_outbox
+                WHERE status IN (?, ?) AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT 1
+            """, (PENDING, SENDING, now)).fetchone()
+            if row is None:
+                return None
+            cur = con.execute("""
+                UPDATE whatsapp_outbox
+                SET status = ?, attempts = attempts + 1, next_attempt_at = ?
+                WHERE id = ? AND status = ? AND next_attempt_at <= ?
+            """, (SENDING, now + SEND_LEASE, row[0], row[4], now))
+            return row[:4] if cur.rowcount == 1 else None
+        return db_utils.get_pool().run(claim)
+
+    def _finish(self, outbox_id: int, attempts: int, error: Optional[str]) -> str:
+        if error is None:
+            status, next_at = SENT, time.time()
+        elif attempts >= self.max_attempts:
+            status, next_at = FAILED, time.time()
+        else:
+            delay = min(self.base_backoff * (2 ** (attempts - 1)), self.max_backoff)
+            status, next_at = PENDING, time.time() + delay
+
+        def write(con):
+            con.execute("""
+                UPDATE whatsapp_outbox
+                SET status = ?, last_error = ?, next_attempt_at = ?,
+                    sent_at = CASE WHEN ? = 'sent' THEN ? ELSE sent_at END
+                WHERE id = ?
+            """, (status, error, next_at, status,
+                  datetime.datetime.now().isoformat(timespec='seconds'), outbox_id))
+        db_utils.get_pool().run(write)
+        return status
+
+    def _log_error(self, what: str, error: Exception):
+        incr("whatsapp.worker_errors")
+        # imported here: logging is only needed once something went wrong
+        import logging
+        logging.getLogger(__name__).warning("WhatsApp dispatch: %s: %s: %s",
+                                            what, type(error).__name__, error)
+
+    def _until_done(self, what: str, fn, *args):
+        """fn(*args), retried with backoff on database errors; None if stopped first"""
+        delay = self.poll_interval
+        while True:
+            try:
+                return fn(*args)
+            except sqlite3.Error as e:
+                self._log_error(what, e)
+                if self._stop.wait(delay):
+                    return None
+                delay = min(delay * 2, self.max_backoff)
+
+    def _run(self):
+        delay = self.poll_interval
+        while not self._stop.is_set():
+            try:
+                busy = self._dispatch_one()
+            except Exception as e:
+                self._log_error("worker loop", e)
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            delay = self.poll_interval
+            if not busy:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _dispatch_one(self) -> bool:
+        """Send the next due message, if any; False when there was none"""
+        job = self._claim()
+        if job is None:
+            return False
+        outbox_id, phone, message, attempts = job
+        attempts += 1
+
+        # rate limit between consecutive sends
+        gap = self._last_send + self.min_interval - time.monotonic()
+        if gap > 0 and self._stop.wait(gap):
+            # stopping: hand the claimed message back untouched
+            def release(con):
+                con.execute("""
+                    UPDATE whatsapp_outbox
+                    SET status = ?, attempts = attempts - 1, next_attempt_at = ?
+                    WHERE id = ?
+                """, (PENDING, time.time(), outbox_id))
+            db_utils.get_pool().run(release)
+            return False
+        self._last_send = time.monotonic()
+
+        try:
+            with span("whatsapp.send"):
+                self.sender(phone, message)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        status = self._until_done("recording a send", self._finish, outbox_id, attempts, error)
+        if status is None:
+            return False   # stopped; the lease lets a later worker pick it up
+        incr(f"whatsapp.{status}")
+        if self.on_status is not None:
+            try:
+                self.on_status(outbox_id, status, error)
+            except Exception as e:
+                self._log_error("status callback", e)
+        return True
@@ -0,0 +1,331 @@
+"""
+Streaming bulk importer for menu catalogs and historical orders.
+
+    python -m utils.importer menu   <file.csv> [--chunk N] [--rejects FILE] [--insert-only]
+    python -m utils.importer orders <file.csv> [--chunk N] [--rejects FILE]
+
+Menu CSV columns: name, category, price
+Order CSV columns (one row per bill line, rows of an order consecutive):
+    order_ref, created_at, mode, payment_method, item_name, qty, unit_price
+    [, discount_pct][, gst, discount, total]
+
+gst, discount and total are the amounts actually charged (order's first
+row); when total is given the order is stored with them, after checking
+that the lines' subtotal + gst - discount adds up. Without them the order
+is priced with the configured rules at its created_at, as the till would
+have: automatic discounts, or discount_pct in their place. The rules keep
+no history, so only the supplied figures are exact for old orders.
+
+Rows are read lazily and written in chunked executemany transactions, so
+memory stays bounded by the chunk size. Rejected rows go to a side CSV
+with an extra `error` column.
+
+Imported orders are recorded by order_ref in the order_imports table, so
+re-running an import skips the orders already loaded instead of doubling
+the sales. An order_ref that shows up again further down the same file
+is rejected. Order ids continue from sqlite_sequence, like AUTOINCREMENT
+would: ids of orders moved to the archive are never handed out again.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import InvalidOperation
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import db_utils
+from .calculator import BillItem, compute_totals
+from .money import Money
+
+DEFAULT_CHUNK = 5000
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    loaded: int = 0
+    rejected: int = 0
+    skipped: int = 0   # orders: rows of orders imported by an earlier run
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        skipped = f", {self.skipped} already imported" if self.skipped else ""
+        return (f"{self.rows} rows read, {self.loaded} loaded, {self.rejected} rejected{skipped} "
+                f"in {self.seconds:.2f}s ({self.rows_per_sec:,.0f} rows/s)")
+
+
+class _Rejects:
+    """Lazily opened side file for rows that could not be imported"""
+
+    def __init__(self, path: Optional[Path], fieldnames: List[str]):
+        self.path = path
+        self.fieldnames = list(fieldnames) + ["error"]
+        self._file = None
+        self._writer = None
+
+    def write(self, row: Dict[str, str], error: str):
+        if self.path is None:
+            return
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames,
+                                          extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerow({**row, "error": error})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _chunks(it: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for x in it:
+        chunk.append(x)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _price(value: str) -> Money:
+    try:
+        price = Money.of((value or "").strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid price {value!r}")
+    if price.paise < 0:
+        raise ValueError("negative price")
+    return price
+
+
+# ------------------- Menu -------------------
+def _menu_row(r: Dict[str, str]) -> Tuple[str, str, int]:
+    name = (r.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    return name, (r.get("category") or "").strip(), _price(r.get("price")).paise
+
+
+def import_menu(path, chunk_size: int = DEFAULT_CHUNK, rejects_path=None,
+                upsert: bool = True) -> ImportStats:
+    """Load menu rows; existing names are updated when upsert is True, else kept"""
+    if upsert:
+        sql = """
+            INSERT INTO menu(name, category, price_paise) VALUES (?,?,?)
+            ON CONFLICT(name) DO UPDATE SET
+                category = excluded.category,
+                price_paise = excluded.price_paise
+        """
+    else:
+        sql = "INSERT OR IGNORE INTO menu(name, category, price_paise) VALUES (?,?,?)"
+
+    stats = ImportStats()
+    start = time.perf_counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        rejects = _Rejects(rejects_path and Path(rejects_path), reader.fieldnames or [])
+        try:
+            for chunk in _chunks(reader, chunk_size):
+                rows = []
+                for r in chunk:
+                    stats.rows += 1
+                    try:
+                        rows.append(_menu_row(r))
+                    except ValueError as e:
+                        stats.rejected += 1
+                        rejects.write(r, str(e))
+                if rows:
+                    db_utils.get_pool().run(lambda con: con.executemany(sql, rows))
+                    stats.loaded += len(rows)
+        finally:
+            rejects.close()
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+# ------------------- Orders -------------------
+def _parse_order(rows: List[Dict[str, str]]):
+    """One order's CSV rows -> (order_ref, mode, payment, created_at, items, totals)"""
+    head = rows[0]
+    ref = (head.get("order_ref") or "").strip()
+    if not ref:
+        raise ValueError("missing order_ref")
+    created_at = (head.get("created_at") or "").strip()
+    try:
+        created_at = datetime.fromisoformat(created_at).isoformat(timespec="seconds")
+    except ValueError:
+        raise ValueError(f"invalid created_at {created_at!r}")
+    items = []
+    for r in rows:
+        name = (r.get("item_name") or "").strip()
+        if not name:
+            raise ValueError("missing item_name")
+        try:
+            qty = int(r.get("qty") or "")
+        except ValueError:
+            raise ValueError(f"invalid qty {r.get('qty')!r}")
+        if qty <= 0:
+            raise ValueError("qty must be positive")
+        items.append(BillItem(name, qty, _price(r.get("unit_price"))))
+    if (head.get("total") or "").strip():
+        totals = _charged_totals(head, items)
+    else:
+        pct = (head.get("discount_pct") or "").strip()
+        try:
+            discount_pct = float(pct) if pct else None
+        except ValueError:
+            raise ValueError(f"invalid discount_pct {pct!r}")
+        totals = compute_totals(items, discount_pct, at=datetime.fromisoformat(created_at),
+                                auto_discounts=discount_pct is None)
+    mode = (head.get("mode") or "").strip() or "Dine-In"
+    payment = (head.get("payment_method") or "").strip() or "Cash"
+    return ref, mode, payment, created_at, items, totals
+
+
+def _charged_totals(head: Dict[str, str], items: List[BillItem]) -> Dict[str, Money]:
+    subtotal = Money(sum(i.line_total.paise for i in items))
+    gst = _price(head.get("gst") or "0")
+    discount = _price(head.get("discount") or "0")
+    total = _price(head.get("total"))
+    if subtotal + gst - discount != total:
+        raise ValueError(f"total {total} does not match {subtotal} + gst {gst} - discount {discount}")
+    return {"subtotal": subtotal, "gst_amount": gst, "discount_amount": discount, "total": total}
+
+
+def _write_orders(orders: list, run_ids: List[range]) -> Tuple[int, int, List[int], range]:
+    """
+    Insert parsed orders not imported before. run_ids: order ids this import
+    run already assigned, so a ref seen there is a repeat within the file.
+    Returns (lines loaded, lines skipped, indexes of repeated orders, ids assigned).
+    """
+    def write(con):
+        # ids are assigned here so orders and items go in with two executemany calls;
+        # the write lock taken by BEGIN IMMEDIATE keeps the sequence stable.
+        # sqlite_sequence remembers ids of deleted (archived) orders, MAX(id) does not.
+        con.execute("BEGIN IMMEDIATE")
+        next_id = con.execute("""
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'orders'), 0),
+                       COALESCE((SELECT MAX(id) FROM orders), 0)) + 1
+        """).fetchone()[0]
+        seen = dict(con.execute(
+            "SELECT source_ref, order_id FROM order_imports WHERE source_ref IN (SELECT value FROM json_each(?))",
+            (json.dumps([o[0] for o in orders]),)))
+        order_rows, item_rows, import_rows = [], [], []
+        skipped, repeated = 0, []
+        imported_at = datetime.now().isoformat(timespec="seconds")
+        for n, (ref, mode, payment, created_at, items, t) in enumerate(orders):
+            if ref in seen:
+                if seen[ref] >= next_id or any(seen[ref] in ids for ids in run_ids):
+                    repeated.append(n)
+                else:
+                    skipped += len(items)
+                continue
+            order_id = seen[ref] = next_id + len(order_rows)
+            order_rows.append((order_id, mode, payment, t["subtotal"].paise,
+                               t["gst_amount"].paise, t["discount_amount"].paise,
+                               t["total"].paise, created_at))
+            item_rows.extend((order_id, i.name, i.name, i.qty, i.unit_price.paise, i.line_total.paise)
+                             for i in items)
+            import_rows.append((ref, order_id, imported_at))
+        con.executemany("""
+            INSERT INTO orders(id, mode, payment_method, subtotal_paise, gst_paise,
+                               discount_paise, total_paise, created_at)
+            VALUES (?,?,?,?,?,?,?,?)
+        """, order_rows)
+        con.executemany(f"""
+            INSERT INTO order_items(order_id, menu_item_id, item_name, qty,
+                                    unit_price_paise, line_total_paise)
+            VALUES (?, {db_utils.MENU_ITEM_ID}, ?, ?, ?, ?)
+        """, item_rows)
+        con.executemany("INSERT INTO order_imports(source_ref, order_id, imported_at) VALUES (?,?,?)",
+                        import_rows)
+        return len(item_rows), skipped, repeated, range(next_id, next_id + len(order_rows))
+
+    return db_utils.get_pool().run(write)
+
+
+def import_orders(path, chunk_size: int = DEFAULT_CHUNK, rejects_path=None) -> ImportStats:
+    """
+    Append historical orders. chunk_size counts bill lines; a chunk always
+    ends on an order boundary. An order with any bad line is rejected whole;
+    an order_ref imported by an earlier run is skipped, and one that shows
+    up again later in this file is rejected.
+    """
+    stats = ImportStats()
+    start = time.perf_counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        rejects = _Rejects(rejects_path and Path(rejects_path), reader.fieldnames or [])
+        pending, pending_rows, pending_lines = [], [], 0
+        run_ids: List[range] = []
+
+        def flush():
+            loaded, skipped, repeated, ids = _write_orders(pending, run_ids)
+            run_ids.append(ids)
+            stats.loaded += loaded
+            stats.skipped += skipped
+            for n in repeated:
+                stats.rejected += len(pending_rows[n])
+                for r in pending_rows[n]:
+                    rejects.write(r, f"order_ref {pending[n][0]} repeated; rows of an order must be consecutive")
+
+        try:
+            for _ref, group in groupby(reader, key=lambda r: r.get("order_ref")):
+                rows = list(group)
+                stats.rows += len(rows)
+                try:
+                    pending.append(_parse_order(rows))
+                except ValueError as e:
+                    stats.rejected += len(rows)
+                    for r in rows:
+                        rejects.write(r, str(e))
+                    continue
+                pending_rows.append(rows)
+                pending_lines += len(rows)
+                if pending_lines >= chunk_size:
+                    flush()
+                    pending, pending_rows, pending_lines = [], [], 0
+            if pending:
+                flush()
+        finally:
+            rejects.close()
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import menu or order CSV files")
+    parser.add_argument("kind", choices=("menu", "orders"))
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK,
+                        help="rows per transaction (default %(default)s)")
+    parser.add_argument("--rejects", type=Path,
+                        help="where to write rejected rows (default <file>.rejects.csv)")
+    parser.add_argument("--insert-only", action="store_true",
+                        help="menu: keep existing items instead of updating them")
+    args = parser.parse_args(argv)
+
+    rejects = args.rejects or args.path.with_suffix(".rejects.csv")
+    db_utils.init_db()
+    if args.kind == "menu":
+        stats = import_menu(args.path, args.chunk, rejects, upsert=not args.insert_only)
+    else:
+        stats = import_orders(args.path, args.chunk, rejects)
+    print(stats)
+    if stats.rejected:
+        print(f"Rejected rows written to {rejects}")
+    return 1 if stats.rejected else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,433 @@
+"""
+Event-sourced order ledger.
+
+    python -m utils.ledger totals [--day YYYY-MM-DD] [--shifts]
+    python -m utils.ledger void ORDER_ID [--reason TEXT]
+    python -m utils.ledger refund ORDER_ID AMOUNT [--method CASH]
+    python -m utils.ledger snapshot | verify | replay [--until SEQ]
+
+order_events is append-only: one row per thing that happened to an order.
+
+    created      bill total when the order was saved
+    item_added   line total added to a saved bill (data: item, qty, unit price)
+    voided       outstanding bill total written off
+    paid         amount collected, with the payment method
+    refunded     amount handed back, with the payment method
+
+save_order() and every other insert into orders records created + paid
+through a trigger (db_utils.create_order_ledger). The functions below add
+the post-sale events. The orders table keeps the bill as first saved.
+
+The ledger state is a few running totals per day and per shift, plus the
+unsettled balance of each open order. Each event moves it forward by one
+step (apply). Every SNAPSHOT_EVERY events the state is written to
+ledger_snapshots, so the current totals cost the latest snapshot plus the
+events after it instead of a rescan of orders. Amounts are in paise.
+"""
+import json
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import db_utils
+from .metrics import timed
+from .money import Money
+
+CREATED, ITEM_ADDED, VOIDED, PAID, REFUNDED = "created", "item_added", "voided", "paid", "refunded"
+KINDS = (CREATED, ITEM_ADDED, VOIDED, PAID, REFUNDED)
+
+# (name, first hour); a shift runs until the next one starts, the last until midnight
+SHIFTS = (("night", 0), ("morning", 6), ("afternoon", 12), ("evening", 17))
+
+# Write a snapshot once this many events have piled up after the latest one
+SNAPSHOT_EVERY = 5000
+
+# (seq, order_id, kind, amount_paise, method, created_at)
+Event = Tuple[int, int, str, int, Optional[str], str]
+
+EVENT_COLUMNS = "seq, order_id, kind, amount_paise, method, created_at"
+
+
+class LedgerError(ValueError):
+    """An event that does not fit the order's history (unknown order, void twice, ...)"""
+
+
+# ------------------- State -------------------
+def shift_of(created_at: str) -> str:
+    hour = int(created_at[11:13] or 0)
+    name = SHIFTS[0][0]
+    for shift, start in SHIFTS:
+        if hour >= start:
+            name = shift
+    return name
+
+
+def empty_state() -> dict:
+    return {"seq": 0, "days": {}, "shifts": {}, "open": {}}
+
+
+def _bucket(table: Dict[str, dict], key: str) -> dict:
+    cell = table.get(key)
+    if cell is None:
+        cell = table[key] = {"orders": 0, "sales": 0, "voided": 0, "voids": 0,
+                             "paid": 0, "refunds": 0, "methods": {}}
+    return cell
+
+
+def apply(state: dict, event: Event) -> dict:
+    """Move state forward by one event (in place); returns state"""
+    seq, order_id, kind, amount, method, created_at = event
+    day = created_at[:10]
+    cells = (_bucket(state["days"], day), _bucket(state["shifts"], f"{day} {shift_of(created_at)}"))
+    # open orders: id -> bill total minus net payments; settled orders drop out
+    key = str(order_id)
+    balance = state["open"].get(key, 0)
+    if kind in (CREATED, ITEM_ADDED):
+        balance += amount
+        for cell in cells:
+            cell["orders"] += kind == CREATED
+            cell["sales"] += amount
+    elif kind == VOIDED:
+        balance -= amount
+        for cell in cells:
+            cell["voided"] += 1
+            cell["voids"] += amount
+    elif kind in (PAID, REFUNDED):
+        sign = 1 if kind == PAID else -1
+        balance -= sign * amount
+        method = method or "?"
+        for cell in cells:
+            cell["paid" if kind == PAID else "refunds"] += amount
+            cell["methods"][method] = cell["methods"].get(method, 0) + sign * amount
+    else:
+        raise LedgerError(f"unknown event kind {kind!r} at seq {seq}")
+    if balance:
+        state["open"][key] = balance
+    else:
+        state["open"].pop(key, None)
+    state["seq"] = seq
+    return state
+
+
+def apply_all(state: dict, events: Iterable[Event]) -> dict:
+    for event in events:
+        apply(state, event)
+    return state
+
+
+# ------------------- Reading -------------------
+def _events(cur, after: int = 0, until: Optional[int] = None, batch: int = 2000):
+    """Events with after < seq <= until, in seq order"""
+    cur.execute(f"SELECT {EVENT_COLUMNS} FROM order_events WHERE seq > ? AND seq <= ? ORDER BY seq",
+                (after, until if until is not None else sys.maxsize))
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            return
+        yield from rows
+
+
+def _latest_snapshot(cur, until: Optional[int] = None) -> Optional[Tuple[int, dict]]:
+    if until is None:
+        cur.execute("SELECT seq, state FROM ledger_snapshots ORDER BY seq DESC LIMIT 1")
+    else:
+        cur.execute("SELECT seq, state FROM ledger_snapshots WHERE seq <= ? ORDER BY seq DESC LIMIT 1",
+                    (until,))
+    row = cur.fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+
+@timed("ledger.replay")
+def replay(until: Optional[int] = None) -> dict:
+    """State rebuilt from the first event, ignoring snapshots"""
+    with db_utils.get_conn() as con:
+        return apply_all(empty_state(), _events(con.cursor(), 0, until))
+
+
+@timed("ledger.load_state")
+def load_state(until: Optional[int] = None, snapshot: bool = True) -> dict:
+    """
+    State from the latest snapshot plus the events after it. With snapshot set,
+    a new snapshot is written when the tail was SNAPSHOT_EVERY events or longer.
+    """
+    with db_utils.get_conn() as con:
+        cur = con.cursor()
+        latest = _latest_snapshot(cur, until)
+        state = latest[1] if latest else empty_state()
+        start, tail = state["seq"], 0
+        for event in _events(cur, start, until):
+            apply(state, event)
+            tail += 1
+    if snapshot and until is None and tail >= SNAPSHOT_EVERY:
+        take_snapshot(state)
+    return state
+
+
+def take_snapshot(state: Optional[dict] = None) -> int:
+    """Store state (default: the current one) in ledger_snapshots; returns its seq"""
+    if state is None:
+        state = load_state(snapshot=False)
+    taken_at = datetime.now().isoformat(timespec="seconds")
+    db_utils.get_pool().run(lambda con: con.execute(
+        "INSERT OR IGNORE INTO ledger_snapshots(seq, taken_at, state) VALUES (?,?,?)",
+        (state["seq"], taken_at, json.dumps(state, separators=(",", ":")))))
+    return state["seq"]
+
+
+class LedgerView:
+    """
+    Current ledger state kept in memory; refresh() applies only the events
+    written since the last call. For dashboards and reports that ask often.
+    """
+
+    def __init__(self):
+        self.state = load_state()
+
+    def refresh(self) -> dict:
+        with db_utils.get_conn() as con:
+            apply_all(self.state, _events(con.cursor(), self.state["seq"]))
+        return self.state
+
+    @property
+    def seq(self) -> int:
+        return self.state["seq"]
+
+    def day(self, day: str) -> dict:
+        return day_totals(day, self.refresh())
+
+    def shifts(self, day: str) -> Dict[str, dict]:
+        return shift_totals(day, self.refresh())
+
+
+# ------------------- Totals -------------------
+def _summary(cell: Optional[dict]) -> dict:
+    cell = cell or _bucket({}, "")
+    return {
+        "orders": cell["orders"],
+        "voided": cell["voided"],
+        "sales": Money(cell["sales"]),
+        "voids": Money(cell["voids"]),
+        "net_sales": Money(cell["sales"] - cell["voids"]),
+        "paid": Money(cell["paid"]),
+        "refunds": Money(cell["refunds"]),
+        "collected": Money(cell["paid"] - cell["refunds"]),
+        "methods": {m: Money(p) for m, p in sorted(cell["methods"].items())},
+    }
+
+
+def day_totals(day: str, state: Optional[dict] = None) -> dict:
+    """Orders, sales, voids, payments and refunds recorded on `day` (YYYY-MM-DD)"""
+    state = state if state is not None else load_state()
+    return _summary(state["days"].get(day))
+
+
+def shift_totals(day: str, state: Optional[dict] = None) -> Dict[str, dict]:
+    """day_totals split by SHIFTS; shifts without events are left out"""
+    state = state if state is not None else load_state()
+    return {shift: _summary(state["shifts"][f"{day} {shift}"])
+            for shift, _start in SHIFTS if f"{day} {shift}" in state["shifts"]}
+
+
+def open_orders(state: Optional[dict] = None) -> Dict[int, Money]:
+    """order id -> balance still due (negative: owed back to the customer)"""
+    state = state if state is not None else load_state()
+    return {int(k): Money(v) for k, v in state["open"].items()}
+
+
+# ------------------- Writing -------------------
+def order_events(order_id: int, cur=None) -> List[Event]:
+    if cur is None:
+        with db_utils.get_conn() as con:
+            return order_events(order_id, con.cursor())
+    cur.execute(f"SELECT {EVENT_COLUMNS} FROM order_events WHERE order_id = ? ORDER BY seq", (order_id,))
+    return cur.fetchall()
+
+
+def order_state(order_id: int, cur=None) -> Optional[dict]:
+    """Bill total, net paid and void flag of one order, from its events; None if unknown"""
+    events = order_events(order_id, cur)
+    if not events:
+        return None
+    state = {"total": 0, "paid": 0, "voided": False, "methods": {}}
+    for _seq, _id, kind, amount, method, _at in events:
+        if kind in (CREATED, ITEM_ADDED):
+            state["total"] += amount
+        elif kind == VOIDED:
+            state["total"] -= amount
+            state["voided"] = True
+        else:
+            sign = 1 if kind == PAID else -1
+            state["paid"] += sign * amount
+            state["methods"][method] = state["methods"].get(method, 0) + sign * amount
+    return state
+
+
+def _append(cur, order_id: int, kind: str, amount: int, method: Optional[str] = None,
+            data: Optional[dict] = None, created_at: Optional[str] = None) -> int:
+    cur.execute("""
+        INSERT INTO order_events(order_id, kind, amount_paise, method, data, created_at)
+        VALUES (?,?,?,?,?,?)
+    """, (order_id, kind, amount, method, json.dumps(data) if data else None,
+          created_at or datetime.now().isoformat(timespec="seconds")))
+    return cur.lastrowid
+
+
+def _record(order_id: int, step) -> List[int]:
+    """Run step(cur, order_state) in one write transaction; returns the new event seqs"""
+    def write(con: sqlite3.Connection):
+        cur = con.cursor()
+        # take the write lock first, so two tills can't void the same order at once
+        cur.execute("BEGIN IMMEDIATE")
+        state = order_state(order_id, cur)
+        if state is None:
+            raise LedgerError(f"no order {order_id} in the ledger")
+        return step(cur, state)
+    return db_utils.get_pool().run(write)
+
+
+def add_item(order_id: int, item: str, qty: int, unit_price, paid=None,
+             method: Optional[str] = None) -> List[int]:
+    """Add a line to a saved bill; `paid` records the extra amount collected for it"""
+    line = db_utils._paise(unit_price) * qty
+
+    def step(cur, state):
+        if state["voided"]:
+            raise LedgerError(f"order {order_id} is void")
+        seqs = [_append(cur, order_id, ITEM_ADDED, line,
+                        data={"item": item, "qty": qty, "unit_price": db_utils._paise(unit_price)})]
+        if paid is not None:
+            seqs.append(_append(cur, order_id, PAID, db_utils._paise(paid), method))
+        return seqs
+    return _record(order_id, step)
+
+
+def void_order(order_id: int, reason: str = "", refund: bool = True) -> List[int]:
+    """Write off an order's bill; what was paid for it is refunded per method unless refund=False"""
+    def step(cur, state):
+        if state["voided"]:
+            raise LedgerError(f"order {order_id} is already void")
+        seqs = [_append(cur, order_id, VOIDED, state["total"], data={"reason": reason} if reason else None)]
+        if refund:
+            for method, amount in state["methods"].items():
+                if amount > 0:
+                    seqs.append(_append(cur, order_id, REFUNDED, amount, method))
+        return seqs
+    return _record(order_id, step)
+
+
+def refund_order(order_id: int, amount, method: Optional[str] = None, reason: str = "") -> List[int]:
+    """Refund part or all of what was paid; the method defaults to the one used to pay"""
+    paise = db_utils._paise(amount)
+
+    def step(cur, state):
+        if paise <= 0 or paise > state["paid"]:
+            raise LedgerError(f"refund of {Money(paise)} exceeds {Money(state['paid'])} paid on order {order_id}")
+        how = method or max(state["methods"], key=state["methods"].get)
+        return [_append(cur, order_id, REFUNDED, paise, how, data={"reason": reason} if reason else None)]
+    return _record(order_id, step)
+
+
+# ------------------- Verification -------------------
+def _same(a: dict, b: dict) -> bool:
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+@timed("ledger.verify")
+def verify() -> List[str]:
+    """
+    Check that snapshots + tail agree with a full replay, that every snapshot
+    matches a replay up to its seq, and that created events agree with the
+    orders table (and archive) day by day. Returns a list of problems.
+    """
+    problems = []
+    full = replay()
+    if not _same(load_state(snapshot=False), full):
+        problems.append("latest snapshot + tail differs from full replay")
+
+    with db_utils.get_conn() as con:
+        cur = con.cursor()
+        cur.execute("SELECT seq, state FROM ledger_snapshots ORDER BY seq")
+        snapshots = cur.fetchall()
+        state = empty_state()
+        for seq, stored in snapshots:
+            apply_all(state, _events(cur, state["seq"], seq))
+            state["seq"] = seq
+            if not _same(json.loads(stored), state):
+                problems.append(f"snapshot at seq {seq} differs from replay")
+
+        # created events are the bills as saved, so they must match orders day by day
+        cur.execute("""
+            SELECT substr(created_at,1,10) AS d, SUM(amount_paise), COUNT(*)
+            FROM order_events WHERE kind = ? GROUP BY d
+        """, (CREATED,))
+        ledger = {d: (Money(p), n) for d, p, n in cur.fetchall()}
+    orders = {d: (p, n) for d, p, n in db_utils.raw_sales_report("daily", live=True)}
+    for day in sorted(set(ledger) | set(orders)):
+        if ledger.get(day) != orders.get(day):
+            problems.append(f"{day}: ledger {ledger.get(day)} vs orders {orders.get(day)}")
+    return problems
+
+
+# ------------------- CLI -------------------
+def _print_summary(label: str, s: dict):
+    methods = ", ".join(f"{m} {p}" for m, p in s["methods"].items()) or "-"
+    print(f"{label:<12} orders {s['orders']:>5}  sales {s['sales']}  voids {s['voids']} ({s['voided']})  "
+          f"net {s['net_sales']}  collected {s['collected']}  [{methods}]")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Order event ledger")
+    sub = parser.add_subparsers(dest="command", required=True)
+    totals = sub.add_parser("totals", help="day and shift totals from snapshot + tail")
+    totals.add_argument("--day", help="YYYY-MM-DD (default: today)")
+    totals.add_argument("--shifts", action="store_true", help="split the day by shift")
+    void = sub.add_parser("void", help="void an order (refunds what was paid)")
+    void.add_argument("order_id", type=int)
+    void.add_argument("--reason", default="")
+    void.add_argument("--no-refund", action="store_true")
+    refund = sub.add_parser("refund", help="refund part of an order")
+    refund.add_argument("order_id", type=int)
+    refund.add_argument("amount")
+    refund.add_argument("--method")
+    refund.add_argument("--reason", default="")
+    sub.add_parser("snapshot", help="write a snapshot of the current state")
+    sub.add_parser("verify", help="check snapshots and the ledger against a replay and the orders")
+    rep = sub.add_parser("replay", help="rebuild the state from the first event")
+    rep.add_argument("--until", type=int, help="stop after this event seq")
+    args = parser.parse_args(argv)
+
+    db_utils.init_db()
+    try:
+        if args.command == "totals":
+            day = args.day or datetime.now().date().isoformat()
+            state = load_state()
+            _print_summary(day, day_totals(day, state))
+            if args.shifts:
+                for shift, s in shift_totals(day, state).items():
+                    _print_summary(f"  {shift}", s)
+            print(f"{len(state['open'])} open order(s), ledger at seq {state['seq']}")
+        elif args.command == "void":
+            print(f"events {void_order(args.order_id, args.reason, not args.no_refund)}")
+        elif args.command == "refund":
+            print(f"event {refund_order(args.order_id, args.amount, args.method, args.reason)}")
+        elif args.command == "snapshot":
+            print(f"snapshot at seq {take_snapshot()}")
+        elif args.command == "replay":
+            state = replay(args.until)
+            print(f"{len(state['days'])} day(s), {len(state['open'])} open order(s), seq {state['seq']}")
+        else:
+            problems = verify()
+            for p in problems:
+                print(p)
+            print("Ledger OK." if not problems else f"{len(problems)} problem(s).")
+            return 1 if problems else 0
+    except LedgerError as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
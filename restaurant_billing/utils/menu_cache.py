@@ -0,0 +1,184 @@
+import bisect
+import csv
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import db_utils
+from .money import Money
+
+
+@dataclass(frozen=True)
+class MenuItem:
+    id: Optional[int]   # None for items that only exist in the CSV fallback
+    name: str
+    category: str
+    price: Money
+
+
+class _Index:
+    """Immutable snapshot of the menu with lookup structures"""
+
+    def __init__(self, items: List[MenuItem], version: int):
+        self.version = version
+        self.by_name: Dict[str, MenuItem] = {i.name: i for i in items}
+        self.by_category: Dict[str, List[MenuItem]] = {}
+        for i in sorted(items, key=lambda i: i.name):
+            self.by_category.setdefault(i.category, []).append(i)
+        # (lowercase name, name) pairs, sorted for bisect prefix search
+        self.sorted_keys = sorted((i.name.lower(), i.name) for i in items)
+        self.lower_keys = [k for k, _ in self.sorted_keys]
+
+
+class MenuCache:
+    """
+    Shared in-memory menu with name/category indexes and prefix search.
+
+    The menu is reloaded only when menu_version (bumped by DB triggers on
+    any menu change, from any terminal) differs from the loaded one. The
+    version is checked at most once per `check_interval` seconds, so
+    lookups normally cost a dict access.
+
+    Every menu read from the database is also written to a snapshot file;
+    load_snapshot() lets the next launch start from it without querying
+    the database, and the usual version check replaces it if it is stale.
+    """
+
+    def __init__(self, check_interval: float = 2.0, fallback_csv=None, snapshot_path=None):
+        self.check_interval = check_interval
+        self.fallback_csv = Path(fallback_csv) if fallback_csv else None
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self._lock = threading.Lock()
+        self._index: Optional[_Index] = None
+        self._checked_at = 0.0
+
+    def _load(self, version: int) -> _Index:
+        items = [MenuItem(i, n, c or "", p) for (i, n, c, p) in db_utils.fetch_menu()]
+        if items:
+            self._save_snapshot(items, version)
+        elif self.fallback_csv is not None:
+            items = _read_menu_csv(self.fallback_csv)
+        return _Index(items, version)
+
+    # ------------------- Snapshot -------------------
+    def _save_snapshot(self, items: List[MenuItem], version: int):
+        if self.snapshot_path is None:
+            return
+        data = {"version": version,
+                "items": [[i.id, i.name, i.category, i.price.paise] for i in items]}
+        tmp = self.snapshot_path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp, self.snapshot_path)
+        except OSError:
+            pass   # only a start-up optimisation
+
+    def load_snapshot(self) -> bool:
+        """
+        Start from the snapshot file without touching the database.
+        Returns False when there is no usable snapshot (call refresh() instead).
+        """
+        if self.snapshot_path is None:
+            return False
+        try:
+            data = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            items = [MenuItem(i, n, c, Money(p)) for i, n, c, p in data["items"]]
+            version = int(data["version"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if not items:
+            return False
+        with self._lock:
+            self._index = _Index(items, version)
+            # first version check after check_interval, once the window is up
+            self._checked_at = time.monotonic()
+        return True
+
+    def _current(self) -> _Index:
+        index = self._index
+        now = time.monotonic()
+        if index is not None and now - self._checked_at < self.check_interval:
+            return index
+        with self._lock:
+            version = db_utils.menu_version()
+            if self._index is None or self._index.version != version:
+                self._index = self._load(version)
+            self._checked_at = now
+            return self._index
+
+    def invalidate(self):
+        """Force a version check on the next lookup"""
+        self._checked_at = 0.0
+
+    def refresh(self):
+        """Reload the menu now, regardless of version"""
+        with self._lock:
+            self._index = self._load(db_utils.menu_version())
+            self._checked_at = time.monotonic()
+
+    # ------------------- Lookups -------------------
+    @property
+    def version(self) -> int:
+        return self._current().version
+
+    def get(self, name: str) -> Optional[MenuItem]:
+        return self._current().by_name.get(name)
+
+    def price(self, name: str) -> Money:
+        """Current price of an item; raises KeyError for unknown items"""
+        return self._current().by_name[name].price
+
+    def items(self) -> List[MenuItem]:
+        return list(self._current().by_name.values())
+
+    def names(self) -> List[str]:
+        return [n for _, n in self._current().sorted_keys]
+
+    def categories(self) -> List[str]:
+        return sorted(self._current().by_category)
+
+    def by_category(self, category: str) -> List[MenuItem]:
+        return list(self._current().by_category.get(category, []))
+
+    def search(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        """Item names starting with prefix (case-insensitive), in name order"""
+        index = self._current()
+        prefix = prefix.lower()
+        lo = bisect.bisect_left(index.lower_keys, prefix)
+        hi = bisect.bisect_left(index.lower_keys, prefix + "\uffff", lo)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return [n for _, n in index.sorted_keys[lo:hi]]
+
+
+def _read_menu_csv(path: Path) -> List[MenuItem]:
+    """Menu from a CSV with Item/Name and Price columns (used when the DB menu is empty)"""
+    if not path.exists():
+        return []
+    items = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            key_map = {k.lower(): k for k in row.keys()}
+            item_key = key_map.get("item") or key_map.get("name")
+            price_key = key_map.get("price")
+            if not item_key or not price_key:
+                raise ValueError("CSV must contain 'Item/Name' and 'Price' columns")
+            category = row.get(key_map.get("category", ""), "") or ""
+            items.append(MenuItem(None, row[item_key], category, Money.of(row[price_key].strip())))
+    return items
+
+
+_cache: Optional[MenuCache] = None
+
+
+def get_menu_cache() -> MenuCache:
+    """The process-wide menu cache"""
+    global _cache
+    if _cache is None:
+        _cache = MenuCache(fallback_csv=db_utils.MENU_CSV,
+                           snapshot_path=db_utils.DB_PATH.with_suffix(".menu.json"))
+    return _cache
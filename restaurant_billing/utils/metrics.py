@@ -0,0 +1,302 @@
+"""
+Lightweight instrumentation: counters, latency histograms and SQL timings.
+
+Off unless the BILLING_METRICS environment variable is set before the app
+starts ("1", or the path of the JSON file to write). When off, `timed`
+hands back the undecorated function, `span` is a shared no-op context
+manager and pooled connections are plain sqlite3 connections, so the hot
+paths cost nothing extra.
+
+    BILLING_METRICS=1 python app.py          # writes db/metrics.json at exit
+    python -m utils.metrics [db/metrics.json] [--top 10]
+"""
+import atexit
+import contextlib
+import functools
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_FLAG = os.environ.get("BILLING_METRICS", "").strip()
+ENABLED = _FLAG.lower() not in ("", "0", "false", "no", "off")
+DEFAULT_PATH = Path(__file__).resolve().parent.parent / "db" / "metrics.json"
+METRICS_PATH = DEFAULT_PATH if _FLAG.lower() in ("1", "true", "yes", "on") else Path(_FLAG or DEFAULT_PATH)
+
+# Latency buckets grow by 2**(1/4) (~19%) per step, starting at 1 microsecond
+BUCKETS_PER_OCTAVE = 4
+SLOWEST_KEPT = 50
+
+
+class Histogram:
+    """Log-bucketed latency histogram; percentiles are accurate to one bucket"""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def observe(self, seconds: float):
+        us = seconds * 1e6
+        index = int(math.log2(us) * BUCKETS_PER_OCTAVE) + 1 if us > 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile, in seconds"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(2 ** (index / BUCKETS_PER_OCTAVE) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "total": self.total, "max": self.max,
+                "buckets": {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        h = cls()
+        h.count, h.total, h.max = data["count"], data["total"], data["max"]
+        h.buckets = {int(k): v for k, v in data["buckets"].items()}
+        return h
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.timings: Dict[str, Histogram] = {}
+        self.sql: Dict[str, Histogram] = {}
+        self.slowest: List[Tuple[float, str]] = []   # min-heap of (seconds, sql)
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            h = self.timings.get(name)
+            if h is None:
+                h = self.timings[name] = Histogram()
+            h.observe(seconds)
+
+    def observe_sql(self, sql: str, seconds: float):
+        sql = _normalize(sql)
+        with self._lock:
+            h = self.sql.get(sql)
+            if h is None:
+                h = self.sql[sql] = Histogram()
+            h.observe(seconds)
+            if len(self.slowest) < SLOWEST_KEPT:
+                heapq.heappush(self.slowest, (seconds, sql))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, sql))
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+            self.sql.clear()
+            self.slowest.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "taken_at": time.time(),
+                "counters": dict(self.counters),
+                "timings": {k: h.to_dict() for k, h in self.timings.items()},
+                "sql": {k: h.to_dict() for k, h in self.sql.items()},
+                "slowest": sorted(self.slowest, reverse=True),
+            }
+
+
+registry = Registry()
+
+_WS = re.compile(r"\s+")
+
+
+def _normalize(sql: str) -> str:
+    return _WS.sub(" ", sql).strip()
+
+
+# ------------------- Instrumentation API -------------------
+def incr(name: str, n: int = 1):
+    if ENABLED:
+        registry.incr(name, n)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            registry.incr(self.name + ".errors")
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(name: str):
+    """Time a block: `with span("app.generate_bill"): ...`"""
+    return _Span(name) if ENABLED else _NULL_SPAN
+
+
+def timed(name: Optional[str] = None):
+    """Decorator recording each call's latency under `name` (default: module.function)"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ------------------- SQL timing -------------------
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            registry.observe_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            registry.observe_sql(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that records every statement and commit"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            registry.observe_sql("COMMIT", time.perf_counter() - start)
+
+    def __exit__(self, exc_type, exc, tb):
+        # `with con:` commits in C without calling commit(), so time it here
+        start = time.perf_counter()
+        try:
+            return super().__exit__(exc_type, exc, tb)
+        finally:
+            if exc_type is None:
+                registry.observe_sql("COMMIT", time.perf_counter() - start)
+
+
+def connection_factory():
+    """Factory for sqlite3.connect(): timed when metrics are on"""
+    return TimedConnection if ENABLED else sqlite3.Connection
+
+
+# ------------------- Output -------------------
+def save(path=None) -> Path:
+    path = Path(path or METRICS_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(registry.snapshot(), indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:9.3f}"
+
+
+def report(snapshot: dict, top: int = 10) -> str:
+    """p50/p99 per operation, SQL statements by total time, slowest single statements"""
+    out = []
+    header = f"{'count':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'total ms':>10}"
+
+    def rows(hists: Dict[str, dict], limit: Optional[int] = None, width: int = 32):
+        hs = sorted(((k, Histogram.from_dict(v)) for k, v in hists.items()),
+                    key=lambda kv: kv[1].total, reverse=True)
+        for name, h in hs[:limit]:
+            label = name if len(name) <= width else name[:width - 3] + "..."
+            out.append(f"{label:<{width}} {h.count:>8} {_ms(h.percentile(0.5))} "
+                       f"{_ms(h.percentile(0.99))} {_ms(h.max)} {h.total * 1000:10.1f}")
+
+    out.append(f"{'operation':<32} {header}")
+    rows(snapshot["timings"])
+    if snapshot["counters"]:
+        out.append("\ncounters")
+        out.extend(f"  {k:<30} {v:>8}" for k, v in sorted(snapshot["counters"].items()))
+    if snapshot["sql"]:
+        out.append(f"\n{'sql (by total time)':<60} {header}")
+        rows(snapshot["sql"], top, width=60)
+    if snapshot["slowest"]:
+        out.append("\nslowest statements")
+        out.extend(f"  {s * 1000:9.3f} ms  {sql[:100]}" for s, sql in snapshot["slowest"][:top])
+    return "\n".join(out)
+
+
+def dump(top: int = 10, file=None):
+    """Print the current process's metrics"""
+    print(report(registry.snapshot(), top), file=file or sys.stdout)
+
+
+if ENABLED:
+    atexit.register(save)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Show metrics recorded with BILLING_METRICS")
+    parser.add_argument("path", nargs="?", type=Path, default=METRICS_PATH)
+    parser.add_argument("--top", type=int, default=10, help="SQL rows to show (default %(default)s)")
+    args = parser.parse_args(argv)
+    if not args.path.exists():
+        print(f"No metrics at {args.path}; run the app with BILLING_METRICS=1 first")
+        return 1
+    print(report(json.loads(args.path.read_text(encoding="utf-8")), args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+from decimal import Decimal, ROUND_HALF_UP
+from functools import total_ordering
+from typing import Union
+
+# Percentages (GST, discounts) are applied with 0.01% resolution
+BASIS_POINTS = 10000
+
+
+def percent_of(paise: int, pct: float) -> int:
+    """pct percent of an amount in paise, rounded half away from zero to whole paise"""
+    bp = round(pct * 100)
+    q = (abs(paise) * bp * 2 + BASIS_POINTS) // (2 * BASIS_POINTS)
+    return -q if paise < 0 else q
+
+
+@total_ordering
+class Money:
+    """
+    Exact amount of money stored as integer paise.
+
+    Money.of() converts rupee values (int, float, str, Decimal) with
+    half-up rounding to the nearest paisa; Money(paise) takes minor units.
+    """
+    __slots__ = ("paise",)
+
+    def __init__(self, paise: int = 0):
+        self.paise = int(paise)
+
+    @classmethod
+    def of(cls, value: Union["Money", int, float, str, Decimal]) -> "Money":
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, int):
+            return cls(value * 100)
+        if isinstance(value, float):
+            # repr() gives the shortest string that round-trips, i.e. what the user typed
+            value = repr(value)
+        d = Decimal(value).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        return cls(int(d * 100))
+
+    @property
+    def rupees(self) -> float:
+        return self.paise / 100
+
+    def percent(self, pct: float) -> "Money":
+        return Money(percent_of(self.paise, pct))
+
+    # ------------------- Arithmetic -------------------
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.paise + other.paise)
+        return NotImplemented
+
+    def __radd__(self, other):
+        # lets sum() start from its default 0
+        if other == 0:
+            return self
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.paise - other.paise)
+        return NotImplemented
+
+    def __mul__(self, qty):
+        if isinstance(qty, int):
+            return Money(self.paise * qty)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.paise)
+
+    # ------------------- Comparison -------------------
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.paise == other.paise
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.paise < other.paise
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.paise)
+
+    def __bool__(self):
+        return self.paise != 0
+
+    # ------------------- Conversion -------------------
+    def __float__(self):
+        return self.paise / 100
+
+    def __str__(self):
+        sign = "-" if self.paise < 0 else ""
+        rupees, paise = divmod(abs(self.paise), 100)
+        return f"{sign}{rupees}.{paise:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        if not spec:
+            return str(self)
+        if spec.endswith("f"):
+            return format(Decimal(self.paise).scaleb(-2), spec)
+        return format(float(self), spec)
@@ -0,0 +1,307 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from . import db_utils
+from .db_pool import is_lock_error
+from .metrics import incr, timed
+from .db_utils import Amount
+from .money import Money
+
+_STOP = object()
+
+# backoff while the database stays locked after the pool's own retries
+LOCK_BACKOFF = 0.1
+MAX_LOCK_BACKOFF = 2.0
+
+
+class OrderDeferred(RuntimeError):
+    """The writer closed while the database was locked; the order stays in the spool"""
+
+
+class OrderStalled(OrderDeferred):
+    """An earlier order could not be passed over; this one waits in the spool behind it"""
+
+
+class OrderWriter:
+    """
+    Write-behind queue for save_order.
+
+    submit() appends the order to a local spool file (so a crash cannot lose
+    it), queues it and returns a Future that resolves to the order id. A
+    background thread drains the queue and writes up to `batch_size` orders
+    per transaction, waiting at most `max_latency` seconds for a batch to
+    fill. The spool file records a sequence number per order; the highest
+    committed number is stored in the order_spool table in the same
+    transaction as the orders, so recovery replays exactly the orders that
+    never reached the database.
+
+    A locked database is waited out. Any other error fails the batch over to
+    one order per transaction, so one bad order cannot take the others down:
+    an order that still fails is appended to the quarantine file
+    (<spool>.rejected) with its error, its Future gets the exception and the
+    committed sequence number moves past it, so it is never replayed. If
+    that step fails too, the writer stalls: later orders are held in the
+    spool (their Futures get OrderStalled) and the step is retried before
+    each batch, committing the held orders once it succeeds.
+    """
+
+    def __init__(self, spool_path=None, batch_size: int = 50, max_latency: float = 0.2,
+                 fsync: bool = True):
+        # by default next to the database, so a test or benchmark DB never replays db/'s spool
+        self.spool_path = Path(spool_path or Path(db_utils.DB_PATH).parent / "orders.spool")
+        self.spool_name = self.spool_path.name
+        self.reject_path = self.spool_path.with_name(self.spool_path.name + ".rejected")
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.fsync = fsync
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._spool_lock = threading.Lock()
+        self._closed = False
+        self._stalled: Optional[BaseException] = None
+        self._unblock_seq: Optional[int] = None       # committed seq to record before going on
+        self._held: List[Tuple[dict, Future]] = []    # deferred orders, still in the spool
+        self.rejected = 0
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._committed_seq = self._load_committed_seq()
+        self._next_seq = self._committed_seq + 1
+        self.recovered = self.recover()
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+
+        self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------- Spool -------------------
+    def _load_committed_seq(self) -> int:
+        con = db_utils.get_conn()
+        row = con.execute("SELECT last_seq FROM order_spool WHERE spool = ?",
+                          (self.spool_name,)).fetchone()
+        return row[0] if row else 0
+
+    def _read_spool(self) -> List[dict]:
+        if not self.spool_path.exists():
+            return []
+        entries = []
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # torn final line from a crash mid-append: the order was never acknowledged
+                    break
+        return entries
+
+    def recover(self) -> int:
+        """
+        Queue spooled orders that are not in the DB yet ahead of new ones;
+        returns how many. The background writer commits (or quarantines) them.
+        """
+        pending = [e for e in self._read_spool() if e["seq"] > self._committed_seq]
+        # keep only the pending orders, without a torn tail that would hide later appends
+        tmp = self.spool_path.with_name(self.spool_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(e) + "\n" for e in pending)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.spool_path)
+        for e in pending:
+            self._queue.put((e, Future()))
+        if pending:
+            self._next_seq = pending[-1]["seq"] + 1
+        return len(pending)
+
+    # ------------------- Public API -------------------
+    def submit(self, mode: str, payment: str, items: List[Tuple[str, int, Amount, Amount]],
+               subtotal: Amount, gst_amount: Amount, discount: Amount, total: Amount) -> Future:
+        """Queue an order; the returned Future resolves to its order id once committed"""
+        if self._closed:
+            raise RuntimeError("OrderWriter is closed")
+        fut: Future = Future()
+        with self._spool_lock:
+            entry = {
+                "seq": self._next_seq,
+                "mode": mode,
+                "payment": payment,
+                # amounts are spooled as exact decimal strings ("12.50")
+                "items": [[n, q, str(Money.of(p)), str(Money.of(lt))] for (n, q, p, lt) in items],
+                "subtotal": str(Money.of(subtotal)),
+                "gst_amount": str(Money.of(gst_amount)),
+                "discount": str(Money.of(discount)),
+                "total": str(Money.of(total)),
+                "created_at": datetime.now().isoformat(timespec='seconds'),
+            }
+            self._next_seq += 1
+            self._spool.write(json.dumps(entry) + "\n")
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            self._queue.put((entry, fut))
+        return fut
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every order submitted so far is committed"""
+        done: Future = Future()
+        self._queue.put((None, done))
+        done.result(timeout)
+
+    def close(self):
+        """Flush pending orders and stop the background writer"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_STOP, None))
+        self._thread.join()
+        self._spool.close()
+        atexit.unregister(self.close)
+
+    # ------------------- Background writer -------------------
+    def _run(self):
+        stop = False
+        while not stop:
+            entry, fut = self._queue.get()
+            batch = []
+            waiters = []
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if entry is _STOP:
+                    stop = True
+                elif entry is None:
+                    waiters.append(fut)
+                else:
+                    batch.append((entry, fut))
+                if stop or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    entry, fut = (self._queue.get(timeout=remaining) if remaining > 0
+                                  else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._commit(batch)
+                self._truncate_spool(self._committed_seq)
+            for w in waiters:
+                w.set_result(None)
+
+    def _commit(self, batch: List[Tuple[dict, Future]]):
+        if self._stalled is not None and not self._unstall():
+            # an earlier order is still uncommitted: writing this one would skip it
+            self._defer(batch)
+            return
+        try:
+            ids = self._retrying(self._write_batch, [e for e, _ in batch])
+        except Exception as e:
+            if is_lock_error(e):
+                self._stalled = e
+                self._defer(batch)
+            elif len(batch) > 1:
+                for one in batch:
+                    self._commit([one])
+            else:
+                self._reject(*batch[0], e)
+            return
+        for (_, f), order_id in zip(batch, ids):
+            f.set_result(order_id)
+
+    def _retrying(self, fn, *args):
+        """fn(*args), waiting out a locked database for as long as the writer is open"""
+        delay = LOCK_BACKOFF
+        while True:
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as e:
+                if self._closed or not is_lock_error(e):
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_LOCK_BACKOFF)
+
+    def _unstall(self) -> bool:
+        """Retry what stalled the writer, then commit the orders held behind it"""
+        try:
+            if self._unblock_seq is not None:
+                self._retrying(self._advance, self._unblock_seq)
+        except Exception as e:
+            self._stalled = e
+            return False
+        self._stalled = self._unblock_seq = None
+        held, self._held = self._held, []
+        if held:
+            # their Futures already carry the deferral; these only collect the outcome
+            self._commit([(e, Future()) for e, _ in held])
+        return self._stalled is None
+
+    def _defer(self, batch: List[Tuple[dict, Future]]):
+        if is_lock_error(self._stalled):
+            error = OrderDeferred(f"database still locked at close ({self._stalled}); "
+                                  f"the order stays in {self.spool_path} and is written on the next start")
+        else:
+            error = OrderStalled(f"an earlier order could not be passed over ({self._stalled}); "
+                                 f"the order stays in {self.spool_path} and is written once that "
+                                 f"succeeds, or on the next start")
+        self._held.extend(batch)
+        for _, f in batch:
+            f.set_exception(error)
+
+    def _reject(self, entry: dict, fut: Future, error: Exception):
+        """Quarantine an order the database refuses, then move the committed seq past it"""
+        record = {"entry": entry, "error": f"{type(error).__name__}: {error}",
+                  "rejected_at": datetime.now().isoformat(timespec='seconds')}
+        with open(self.reject_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        try:
+            self._retrying(self._advance, entry["seq"])
+        except Exception as e:
+            # the order is quarantined but still in the spool; later orders wait until the
+            # committed seq is past it (a restart replays and rejects it again)
+            self._stalled, self._unblock_seq = e, entry["seq"]
+        self.rejected += 1
+        incr("writer.rejected")
+        fut.set_exception(error)
+
+    @timed("writer.write_batch")
+    def _write_batch(self, entries: List[dict]) -> List[int]:
+        def write(con):
+            cur = con.cursor()
+            ids = [db_utils.insert_order(cur, e["mode"], e["payment"], e["items"],
+                                         e["subtotal"], e["gst_amount"], e["discount"],
+                                         e["total"], e["created_at"])
+                   for e in entries]
+            self._set_committed_seq(cur, entries[-1]["seq"])
+            return ids
+
+        ids = db_utils.get_pool().run(write)
+        self._committed_seq = entries[-1]["seq"]
+        return ids
+
+    def _advance(self, seq: int):
+        db_utils.get_pool().run(lambda con: self._set_committed_seq(con.cursor(), seq))
+        self._committed_seq = seq
+
+    def _set_committed_seq(self, cur, seq: int):
+        cur.execute("""
+            INSERT INTO order_spool(spool, last_seq) VALUES (?, ?)
+            ON CONFLICT(spool) DO UPDATE SET last_seq = excluded.last_seq
+        """, (self.spool_name, seq))
+
+    def _truncate_spool(self, committed_seq: int):
+        # Only safe once nothing newer than committed_seq has been appended
+        with self._spool_lock:
+            if self._next_seq - 1 == committed_seq:
+                self._spool.truncate(0)
+                self._spool.seek(0)
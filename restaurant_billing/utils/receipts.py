@@ -0,0 +1,349 @@
+"""
+Receipt rendering and export.
+
+Templates are compiled once per (name, width): format strings, column
+widths and rules are worked out up front. Rendering one receipt then
+builds its parts and makes a single join, or a single write.
+
+    whatsapp   the message sent to customers
+    text       fixed columns for the on-screen bill
+    thermal    receipt-printer layout, 32/42/48 characters wide
+    json       one JSON object (amounts as exact "123.45" strings)
+
+export_receipts() streams stored orders from orders/order_items in date
+order, one order in memory at a time. It writes one file per day:
+receipts-YYYY-MM-DD.ndjson (JSON lines), or .zip with one rendered text
+receipt per order.
+
+    python -m utils.receipts show ORDER_ID [--template thermal] [--width 42]
+    python -m utils.receipts export OUT_DIR [--start 2025-01-01] [--end 2025-02-01]
+                                    [--format ndjson|zip] [--template thermal]
+"""
+import json
+import sys
+import textwrap
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import db_utils
+from .money import Money
+
+TITLE = "Restaurant Bill"
+THERMAL_WIDTHS = (32, 42, 48)
+
+# (name, qty, unit price, line total) with amounts in paise
+ReceiptLine = Tuple[str, int, int, int]
+
+
+@dataclass
+class Receipt:
+    lines: List[ReceiptLine]
+    subtotal: int
+    gst: int
+    discount: int
+    total: int
+    mode: str = "Dine-In"
+    payment: str = "Cash"
+    created_at: Optional[str] = None
+    order_id: Optional[int] = None
+    gst_percent: Optional[float] = None   # shown on the bill when every line has the same rate
+    extra: Dict[str, object] = field(default_factory=dict)
+
+    @classmethod
+    def from_cart(cls, cart, mode: str = "Dine-In", payment: str = "Cash",
+                  totals: Optional[Dict[str, Money]] = None, **extra) -> "Receipt":
+        """Receipt for a Cart (or anything with CartLine-like lines and totals())"""
+        t = totals or cart.totals()
+        lines = [(l.name, l.qty, l.unit_price.paise, l.line_total.paise) for l in cart]
+        rules = getattr(cart, "rules", None)
+        rates = set()
+        if rules is not None:   # RemoteCart has none; the bill then shows plain "GST:"
+            rates = {rules.gst_rate(name) for name, *_ in lines} or {rules.default_gst}
+        return cls(lines, t["subtotal"].paise, t["gst_amount"].paise, t["discount_amount"].paise,
+                   t["total"].paise, mode, payment, datetime.now().isoformat(timespec="seconds"),
+                   gst_percent=rates.pop() if len(rates) == 1 else None, extra=extra)
+
+
+# ------------------- Templates -------------------
+class TextTemplate:
+    """header / one line per item / footer, as str.format templates"""
+
+    def __init__(self, header: str, line: str, footer: str):
+        # bound methods: no attribute lookups per receipt line
+        self._header = header.format
+        self._line = line.format
+        self._footer = footer.format
+
+    def _fields(self, r: Receipt) -> dict:
+        return {"title": TITLE, "order": f"#{r.order_id}" if r.order_id is not None else "",
+                "date": (r.created_at or "").replace("T", " "), "mode": r.mode, "payment": r.payment,
+                "gst_label": "GST:" if r.gst_percent is None else f"GST ({r.gst_percent}%):",
+                "subtotal": str(Money(r.subtotal)), "gst": str(Money(r.gst)),
+                "discount": str(Money(r.discount)), "total": str(Money(r.total))}
+
+    def parts(self, r: Receipt) -> Iterator[str]:
+        fields = self._fields(r)
+        yield self._header(**fields)
+        line = self._line
+        for name, qty, unit, total in r.lines:
+            yield line(name=name, qty=qty, unit_price=str(Money(unit)), line_total=str(Money(total)))
+        yield self._footer(**fields)
+
+    def render(self, r: Receipt) -> str:
+        return "\n".join(self.parts(r))
+
+
+class ThermalTemplate(TextTemplate):
+    """Fixed-width layout; long item names wrap above their amount"""
+
+    def __init__(self, width: int = 42):
+        if width < 24:
+            raise ValueError("thermal receipts need at least 24 columns")
+        self.width = width
+        amount = 11
+        name = width - amount
+        rule = "-" * width
+        pair = f"{{:<{name}}}{{:>{amount}}}"
+        self._name_width = name - 1
+        self._pair = pair.format
+        super().__init__(
+            header="\n".join([f"{{title:^{width}}}", f"{{date:<{name}}}{{order:>{amount}}}",
+                              f"{{mode:<{name}}}{{payment:>{amount}}}", rule]),
+            line="",   # item lines are laid out in parts()
+            footer="\n".join([rule] + [f"{label:<{name}}{{{key}:>{amount}}}" for label, key in
+                                        (("Subtotal", "subtotal"), ("GST", "gst"),
+                                         ("Discount", "discount"), ("TOTAL", "total"))] + [rule]),
+        )
+
+    def parts(self, r: Receipt) -> Iterator[str]:
+        fields = self._fields(r)
+        yield self._header(**fields)
+        pair, room = self._pair, self._name_width
+        for name, qty, unit, total in r.lines:
+            label = f"{name} x{qty}"
+            if len(label) > room:
+                *head, label = textwrap.wrap(label, room, subsequent_indent="  ")
+                yield from head
+            yield pair(label, str(Money(total)))
+        yield self._footer(**fields)
+
+
+class JsonTemplate:
+    def __init__(self):
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    def as_dict(self, r: Receipt) -> dict:
+        data = {
+            "order_id": r.order_id,
+            "created_at": r.created_at,
+            "mode": r.mode,
+            "payment": r.payment,
+            "items": [{"name": n, "qty": q, "unit_price": str(Money(u)), "line_total": str(Money(t))}
+                      for n, q, u, t in r.lines],
+            "totals": {"subtotal": str(Money(r.subtotal)), "gst_amount": str(Money(r.gst)),
+                       "discount_amount": str(Money(r.discount)), "total": str(Money(r.total))},
+        }
+        data.update(r.extra)
+        return data
+
+    def parts(self, r: Receipt) -> Iterator[str]:
+        yield self.render(r)
+
+    def render(self, r: Receipt) -> str:
+        return self._encode(self.as_dict(r))
+
+
+_BUILDERS: Dict[str, Callable[[Optional[int]], object]] = {
+    "whatsapp": lambda width: TextTemplate(
+        header="🧾 *{title}* 🧾\n",
+        line="{name} x{qty} = {line_total}",
+        footer="\nSubtotal: {subtotal}\nGST: {gst}\nDiscount: {discount}\n*Total: {total}*"),
+    "text": lambda width: TextTemplate(
+        header=f"{{title}} {{order}}\n{{date}}\n{'Item':<20}{'Qty':>5}{'Price':>10}{'Total':>11}\n{'-' * 46}",
+        line="{name:<20.20}{qty:>5}{unit_price:>10}{line_total:>11}",
+        footer=f"{'-' * 46}\n{'Subtotal:':<35}{{subtotal:>11}}\n{{gst_label:<35}}{{gst:>11}}\n"
+               f"{'Discount:':<35}{{discount:>11}}\n{'Total:':<35}{{total:>11}}"),
+    "thermal": lambda width: ThermalTemplate(width or THERMAL_WIDTHS[1]),
+    "json": lambda width: JsonTemplate(),
+}
+TEMPLATES = tuple(_BUILDERS)
+
+
+@lru_cache(maxsize=None)
+def get_template(name: str = "text", width: Optional[int] = None):
+    """Compiled template, built once per (name, width)"""
+    try:
+        return _BUILDERS[name](width)
+    except KeyError:
+        raise ValueError(f"unknown template {name!r}; choose from {', '.join(TEMPLATES)}") from None
+
+
+def render(receipt: Receipt, template: str = "text", width: Optional[int] = None) -> str:
+    return get_template(template, width).render(receipt)
+
+
+# ------------------- Saving -------------------
+def export_receipt(receipt: Receipt, directory, template: str = "json") -> Path:
+    """
+    Write one receipt to a new file in `directory` and return its path.
+    Names carry the order id or timestamp and never replace an existing file.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = (receipt.created_at or datetime.now().isoformat(timespec="seconds")).replace(":", "")
+    stem = f"bill-{receipt.order_id}" if receipt.order_id is not None else f"bill-{stamp}"
+    suffix = ".json" if template == "json" else ".txt"
+    text = render(receipt, template)
+    for n in range(1, 10000):
+        path = directory / (f"{stem}{suffix}" if n == 1 else f"{stem}-{n}{suffix}")
+        try:
+            with open(path, "x", encoding="utf-8") as f:
+                f.write(text + "\n")
+            return path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"no free file name for {stem} in {directory}")
+
+
+# ------------------- Stored orders -------------------
+_ORDER_LINES = """
+    SELECT o.id, o.created_at, o.mode, o.payment_method, o.subtotal_paise, o.gst_paise,
+           o.discount_paise, o.total_paise, i.item_name, i.qty, i.unit_price_paise, i.line_total_paise
+    FROM orders o LEFT JOIN order_items i ON i.order_id = o.id
+    WHERE {where}
+    ORDER BY o.created_at, o.id, i.id
+"""
+
+
+def _receipts(cursor) -> Iterator[Receipt]:
+    """Group consecutive (order, line) rows into receipts"""
+    current = None
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        for oid, created, mode, pay, sub, gst, disc, tot, name, qty, unit, line in rows:
+            if current is None or current.order_id != oid:
+                if current is not None:
+                    yield current
+                current = Receipt([], sub, gst, disc, tot, mode, pay, created, oid)
+            if name is not None:
+                current.lines.append((name, qty, unit, line))
+    if current is not None:
+        yield current
+
+
+def iter_receipts(start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Receipt]:
+    """Stored orders with created_at in [start, end), oldest first, one at a time"""
+    lo = start or "0000"
+    hi = end or "9999"
+    con = db_utils.get_conn()
+    yield from _receipts(con.execute(_ORDER_LINES.format(where="o.created_at >= ? AND o.created_at < ?"),
+                                     (lo, hi)))
+
+
+def load_receipt(order_id: int) -> Optional[Receipt]:
+    con = db_utils.get_conn()
+    return next(_receipts(con.execute(_ORDER_LINES.format(where="o.id = ?"), (order_id,))), None)
+
+
+@dataclass
+class ExportStats:
+    orders: int = 0
+    files: List[Path] = field(default_factory=list)
+
+
+class _DayWriter:
+    """Keeps the current day's file open; receipts arrive in date order"""
+
+    def __init__(self, out_dir: Path, fmt: str, template, suffix: str):
+        self.out_dir, self.fmt, self.template, self.suffix = out_dir, fmt, template, suffix
+        self.day = None
+        self.file = None
+        self.files: List[Path] = []
+
+    def write(self, r: Receipt):
+        day = (r.created_at or "unknown")[:10]
+        if day != self.day:
+            self.close()
+            self.day = day
+            path = self.out_dir / f"receipts-{day}.{self.fmt}"
+            self.files.append(path)
+            if self.fmt == "zip":
+                self.file = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+            else:
+                self.file = open(path, "w", encoding="utf-8", buffering=1 << 16)
+        if self.fmt == "zip":
+            self.file.writestr(f"order-{r.order_id}{self.suffix}", self.template.render(r) + "\n")
+        else:
+            self.file.write(self.template.render(r))
+            self.file.write("\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def export_receipts(out_dir, start: Optional[str] = None, end: Optional[str] = None,
+                    fmt: str = "ndjson", template: Optional[str] = None,
+                    width: Optional[int] = None) -> ExportStats:
+    """
+    Write stored orders in [start, end) to one file per day in out_dir:
+      ndjson  one JSON receipt per line (template must be json)
+      zip     one rendered receipt per order (default template: thermal)
+    Existing files for the same days are replaced.
+    """
+    if fmt not in ("ndjson", "zip"):
+        raise ValueError("fmt must be 'ndjson' or 'zip'")
+    template = template or ("json" if fmt == "ndjson" else "thermal")
+    if fmt == "ndjson" and template != "json":
+        raise ValueError("ndjson export needs the json template")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    writer = _DayWriter(out_dir, fmt, get_template(template, width), ".json" if template == "json" else ".txt")
+    stats = ExportStats()
+    try:
+        for receipt in iter_receipts(start, end):
+            writer.write(receipt)
+            stats.orders += 1
+    finally:
+        writer.close()
+    stats.files = writer.files
+    return stats
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Render and export receipts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print one stored order")
+    show.add_argument("order_id", type=int)
+    export = sub.add_parser("export", help="write per-day receipt files")
+    export.add_argument("out_dir", type=Path)
+    export.add_argument("--start", help="first day (YYYY-MM-DD)")
+    export.add_argument("--end", help="day after the last (YYYY-MM-DD)")
+    export.add_argument("--format", dest="fmt", choices=("ndjson", "zip"), default="ndjson")
+    for p in (show, export):
+        p.add_argument("--template", choices=TEMPLATES)
+        p.add_argument("--width", type=int, choices=THERMAL_WIDTHS)
+    args = parser.parse_args(argv)
+    db_utils.init_db()
+    if args.command == "show":
+        receipt = load_receipt(args.order_id)
+        if receipt is None:
+            print(f"No order {args.order_id}")
+            return 1
+        print(render(receipt, args.template or "text", args.width))
+        return 0
+    stats = export_receipts(args.out_dir, args.start, args.end, args.fmt, args.template, args.width)
+    print(f"{stats.orders} receipts in {len(stats.files)} files under {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
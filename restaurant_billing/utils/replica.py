@@ -0,0 +1,185 @@
+"""
+Read replica for reports.
+
+    python -m utils.replica refresh [--force]
+    python -m utils.replica report [daily|weekly|monthly] [--max-staleness S]
+
+A Replica is a snapshot copy of restaurant.db (restaurant.replica.db next
+to it), made with the SQLite backup API from a read-only connection.
+Reports run their queries on the copy, so a long scan never holds a lock
+on the file the tills write to. The copy is one backup step: a stepped
+backup starts over whenever another connection commits, so under steady
+order traffic it may never finish. In WAL mode that single read does not
+block the tills at all. With a rollback journal it holds the read lock for
+the length of the copy, which is a sequential read and far shorter than the
+scans it replaces. The copy goes to a private staging file first and from
+there into the replica, so waiting for report queries still running on the
+replica never keeps the live database locked.
+
+The copy is refreshed once it is older than max_staleness seconds.
+PRAGMA data_version tells whether anything was committed since the last
+copy. When nothing was, the snapshot is simply re-stamped as fresh. Results
+carry the snapshot time and age (db_utils.ReportRows), so callers can show
+how current they are.
+
+Enable it with db_utils.enable_replica(); sales_report, raw_sales_report,
+fetch_menu(as_of=...) and utils.analytics then read from it.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from .metrics import timed
+
+
+@dataclass
+class ReplicaStats:
+    refreshes: int = 0       # staleness checks that ran
+    copies: int = 0          # ... and actually copied the database
+    copy_seconds: float = 0.0
+
+
+class Replica:
+    def __init__(self, source, path=None, max_staleness: float = 60.0):
+        self.source = Path(source)
+        self.path = Path(path) if path else self.source.with_suffix(".replica.db")
+        self.max_staleness = max_staleness
+        self.stats = ReplicaStats()
+        self.as_of: Optional[datetime] = None   # when the snapshot was last known current
+        self._refreshed = 0.0                    # monotonic time of the same moment
+        self._data_version = None
+        self._src: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._readers = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- Freshness ----
+    def age(self) -> float:
+        """Seconds since the snapshot was last known to match the source (inf before the first copy)"""
+        return time.monotonic() - self._refreshed if self.as_of else float("inf")
+
+    def ensure_fresh(self):
+        if self.age() > self.max_staleness:
+            self.refresh()
+
+    @timed("replica.refresh")
+    def refresh(self, force: bool = False, max_age: Optional[float] = None) -> bool:
+        """
+        Bring the snapshot up to date unless it is younger than max_age
+        (default max_staleness); force copies even when nothing changed.
+        Returns True when the database was copied.
+        """
+        with self._lock:
+            if not force and self.age() <= (self.max_staleness if max_age is None else max_age):
+                return False   # another thread refreshed while this one waited
+            if self._src is None:
+                self._src = sqlite3.connect(f"{self.source.resolve().as_uri()}?mode=ro",
+                                            uri=True, check_same_thread=False)
+            started, stamp = time.monotonic(), datetime.now()
+            version = self._src.execute("PRAGMA data_version").fetchone()[0]
+            self.stats.refreshes += 1
+            copied = force or version != self._data_version or not self.path.exists()
+            if copied:
+                staging = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                tmp = sqlite3.connect(staging)
+                try:
+                    self._src.backup(tmp)   # the only step that reads the live database
+                    dst = sqlite3.connect(self.path, timeout=30)
+                    try:
+                        tmp.backup(dst)
+                    finally:
+                        dst.close()
+                finally:
+                    tmp.close()
+                    staging.unlink(missing_ok=True)
+                self.stats.copies += 1
+                self.stats.copy_seconds += time.monotonic() - started
+            self._data_version = version
+            self.as_of, self._refreshed = stamp, started
+            return copied
+
+    # ---- Reads ----
+    def connection(self) -> sqlite3.Connection:
+        """This thread's read-only connection to a snapshot no older than max_staleness"""
+        self.ensure_fresh()
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=30,
+                                  check_same_thread=False)
+            con.execute("PRAGMA query_only = 1")
+            self._local.con = con
+            with self._lock:
+                self._readers.append(con)
+        return con
+
+    # ---- Background refresh ----
+    def start(self) -> "Replica":
+        """Refresh from a daemon thread every max_staleness / 2 seconds"""
+        if self._thread is None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._run, name="replica-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        interval = max(self.max_staleness / 2, 0.05)
+        while not self._stop.wait(interval):
+            try:
+                self.refresh(max_age=interval)
+            except sqlite3.Error:
+                pass   # the next round tries again; readers refresh themselves when stale
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            for con in self._readers + ([self._src] if self._src else []):
+                con.close()
+            self._readers.clear()
+            self._src = None
+        self._local = threading.local()
+
+
+def main(argv=None):
+    import argparse
+    from . import db_utils
+    parser = argparse.ArgumentParser(description="Snapshot replica for reporting reads")
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh = sub.add_parser("refresh", help="copy the database to the replica now")
+    refresh.add_argument("--force", action="store_true", help="copy even if nothing changed")
+    report = sub.add_parser("report", help="sales report served from the replica")
+    report.add_argument("period", nargs="?", default="daily", choices=("daily", "weekly", "monthly"))
+    report.add_argument("--max-staleness", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    db_utils.init_db()
+    if args.command == "refresh":
+        replica = Replica(db_utils.DB_PATH)
+        replica.refresh(force=args.force)
+        print(f"{replica.path} as of {replica.as_of:%Y-%m-%d %H:%M:%S} "
+              f"({replica.stats.copy_seconds * 1000:.0f} ms)")
+        replica.close()
+        return 0
+    db_utils.enable_replica(max_staleness=args.max_staleness)
+    try:
+        rows = db_utils.sales_report(args.period)
+        for key, total, n in rows:
+            print(f"{key}  {total:>12}  {n:>6}")
+        print(f"from {rows.source} as of {rows.as_of:%Y-%m-%d %H:%M:%S} ({rows.age:.1f}s old)")
+    finally:
+        db_utils.disable_replica()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
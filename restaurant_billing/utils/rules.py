@@ -0,0 +1,358 @@
+"""
+Tax and discount rules, compiled once into lookup tables.
+
+Rules live in the pricing_rules table (seeded with 5% GST and 10% off
+bills above 100), or in a JSON file named by the BILLING_RULES
+environment variable:
+
+    {"rules": [
+        {"kind": "gst", "percent": 5},
+        {"kind": "gst", "category": "Beverages", "percent": 18},
+        {"kind": "threshold", "above": "100", "percent": 10},
+        {"kind": "happy_hour", "days": [0, 1, 2, 3], "start": "16:00", "end": "19:00",
+         "category": "Beverages", "percent": 20},
+        {"kind": "combo", "items": ["Burger", "Cold Drink"], "percent": 15}
+    ]}
+
+Applying the rules works as follows:
+- GST is charged per slab: an item's category picks its rate, and items
+  in other categories use the slab without a category.
+- Discounts add up. The threshold tier is taken on the subtotal: the
+  highest "above" that the subtotal exceeds. Each active happy hour is
+  taken on its category's lines (or all lines), and each complete combo
+  on the lines of its items.
+- The total discount never exceeds the subtotal. A manual discount
+  percentage replaces the automatic ones.
+
+CompiledRules turns a rule list into dict and sorted-array lookups, so
+pricing a bill never walks the rule list. get_rules() keeps the compiled
+rules for the session and recompiles only when the rules or the menu
+(item categories) change.
+"""
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import db_utils
+from .money import Money, percent_of
+
+DEFAULT_GST_PERCENT = 5.0
+
+GST, THRESHOLD, HAPPY_HOUR, COMBO = "gst", "threshold", "happy_hour", "combo"
+KINDS = (GST, THRESHOLD, HAPPY_HOUR, COMBO)
+
+MINUTES_PER_DAY = 24 * 60
+
+# (name, qty, unit price in paise) -- what the rules need to know about a bill line
+Line = Tuple[str, int, int]
+
+
+def _minutes(hhmm: str) -> int:
+    hours, _, minutes = hhmm.partition(":")
+    value = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= value <= MINUTES_PER_DAY:
+        raise ValueError(f"invalid time {hhmm!r}")
+    return value
+
+
+@dataclass(frozen=True)
+class Rule:
+    kind: str
+    percent: float
+    category: Optional[str] = None    # gst slab / happy-hour category; None = every item
+    above: Optional[Money] = None     # threshold: applies to subtotals above this
+    items: Tuple[str, ...] = ()       # combo: all of these must be in the bill
+    days: Tuple[int, ...] = ()        # happy hour: weekdays, Monday = 0; empty = every day
+    start: Optional[str] = None       # happy hour "HH:MM", inclusive
+    end: Optional[str] = None         # exclusive; before start means past midnight
+
+    def __post_init__(self):
+        if self.kind not in KINDS:
+            raise ValueError(f"unknown rule kind {self.kind!r}")
+        if self.kind == THRESHOLD and self.above is None:
+            raise ValueError("threshold rule needs 'above'")
+        if self.kind == COMBO and not self.items:
+            raise ValueError("combo rule needs 'items'")
+        if self.kind == HAPPY_HOUR:
+            if self.start is None or self.end is None:
+                raise ValueError("happy_hour rule needs 'start' and 'end'")
+            _minutes(self.start), _minutes(self.end)
+            if any(not 0 <= d <= 6 for d in self.days):
+                raise ValueError(f"invalid weekdays {self.days!r}")
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Rule":
+        above = data.get("above")
+        return cls(kind=data["kind"], percent=float(data["percent"]),
+                   category=data.get("category"),
+                   above=None if above is None else Money.of(str(above)),
+                   items=tuple(data.get("items") or ()), days=tuple(data.get("days") or ()),
+                   start=data.get("start"), end=data.get("end"))
+
+    def to_dict(self) -> dict:
+        data = {"kind": self.kind, "percent": self.percent}
+        if self.category is not None:
+            data["category"] = self.category
+        if self.above is not None:
+            data["above"] = str(self.above)
+        if self.items:
+            data["items"] = list(self.items)
+        if self.days:
+            data["days"] = list(self.days)
+        if self.start is not None:
+            data["start"], data["end"] = self.start, self.end
+        return data
+
+
+DEFAULT_RULES = (
+    Rule(GST, DEFAULT_GST_PERCENT),
+    Rule(THRESHOLD, 10.0, above=Money.of(100)),
+)
+
+
+# ------------------- Compiled form -------------------
+class CompiledRules:
+    """
+    Lookup tables built from a rule list:
+      - gst_by_item: item name -> rate, for items whose category has its own slab
+      - threshold_paise / threshold_pct: sorted tiers for bisect
+      - happy_hour_table: per weekday, segment boundaries (minute of day) and the
+        (category, percent) pairs active in each segment
+      - combos with an item -> combos index
+    `uniform` is set when every line is taxed and discounted alike, so a
+    bill's subtotal is all that is needed to price it.
+    """
+
+    def __init__(self, rules: Iterable[Rule], categories: Optional[Dict[str, str]] = None, version=None):
+        self.rules = tuple(rules)
+        self.version = version
+        self.categories = dict(categories or {})
+
+        slabs = {r.category: r.percent for r in self.rules if r.kind == GST}
+        self.default_gst = slabs.pop(None, DEFAULT_GST_PERCENT)
+        self.gst_by_category = slabs
+        self.gst_by_item = {name: slabs[cat] for name, cat in self.categories.items()
+                            if cat in slabs and slabs[cat] != self.default_gst}
+
+        tiers = sorted((r.above.paise, r.percent) for r in self.rules if r.kind == THRESHOLD)
+        self.threshold_paise = [above for above, _ in tiers]
+        self.threshold_pct = [pct for _, pct in tiers]
+
+        self.happy_hour_table = self._compile_happy_hours([r for r in self.rules if r.kind == HAPPY_HOUR])
+
+        self.combos = [(frozenset(r.items), r.percent) for r in self.rules if r.kind == COMBO]
+        self.combos_by_item: Dict[str, List[int]] = {}
+        for i, (items, _) in enumerate(self.combos):
+            for name in items:
+                self.combos_by_item.setdefault(name, []).append(i)
+
+        self.uniform = (not self.gst_by_item and not self.combos
+                        and all(r.category is None for r in self.rules if r.kind == HAPPY_HOUR))
+
+    @staticmethod
+    def _compile_happy_hours(rules: List[Rule]):
+        windows = []   # (weekday, start minute, end minute, category, percent)
+        for r in rules:
+            start, end = _minutes(r.start), _minutes(r.end)
+            for day in r.days or range(7):
+                if start < end:
+                    windows.append((day, start, end, r.category, r.percent))
+                elif start > end:
+                    # runs past midnight into the next weekday
+                    windows.append((day, start, MINUTES_PER_DAY, r.category, r.percent))
+                    windows.append(((day + 1) % 7, 0, end, r.category, r.percent))
+        table = {}
+        for day in range(7):
+            todays = [w for w in windows if w[0] == day]
+            if not todays:
+                continue
+            bounds = sorted({0, MINUTES_PER_DAY} | {w[1] for w in todays} | {w[2] for w in todays})
+            segments = [tuple((w[3], w[4]) for w in todays if w[1] <= lo < w[2]) for lo in bounds[:-1]]
+            table[day] = (bounds, segments)
+        return table
+
+    # ---- Lookups ----
+    def gst_rate(self, name: str) -> float:
+        return self.gst_by_item.get(name, self.default_gst)
+
+    def threshold_for(self, subtotal: int) -> float:
+        """Discount percent of the highest tier the subtotal (paise) is above"""
+        i = bisect.bisect_left(self.threshold_paise, subtotal)
+        return self.threshold_pct[i - 1] if i else 0.0
+
+    def happy_hours(self, at: datetime) -> Tuple[Tuple[Optional[str], float], ...]:
+        """(category, percent) of the happy hours running at `at`"""
+        entry = self.happy_hour_table.get(at.weekday())
+        if entry is None:
+            return ()
+        bounds, segments = entry
+        return segments[bisect.bisect_right(bounds, at.hour * 60 + at.minute) - 1]
+
+    # ---- Pricing ----
+    def price_subtotal(self, subtotal: int, at: Optional[datetime] = None,
+                       discount_pct: Optional[float] = None) -> Tuple[int, int]:
+        """(gst, discount) in paise for a bill of `uniform` rules, from its subtotal alone"""
+        gst = percent_of(subtotal, self.default_gst)
+        if discount_pct is not None:
+            return gst, percent_of(subtotal, discount_pct)
+        discount = percent_of(subtotal, self.threshold_for(subtotal))
+        if self.happy_hour_table:
+            for _, pct in self.happy_hours(at or datetime.now()):
+                discount += percent_of(subtotal, pct)
+        return gst, min(discount, subtotal)
+
+    def price_lines(self, lines: Iterable[Line], at: Optional[datetime] = None,
+                    discount_pct: Optional[float] = None) -> Tuple[int, int, int]:
+        """(subtotal, gst, discount) in paise"""
+        if self.uniform:
+            subtotal = sum(qty * price for _, qty, price in lines)
+            return (subtotal,) + self.price_subtotal(subtotal, at, discount_pct)
+
+        by_item: Dict[str, int] = {}
+        for name, qty, price in lines:
+            by_item[name] = by_item.get(name, 0) + qty * price
+        subtotal = sum(by_item.values())
+
+        by_rate: Dict[float, int] = {}
+        for name, amount in by_item.items():
+            rate = self.gst_by_item.get(name, self.default_gst)
+            by_rate[rate] = by_rate.get(rate, 0) + amount
+        gst = sum(percent_of(amount, rate) for rate, amount in by_rate.items())
+
+        if discount_pct is not None:
+            return subtotal, gst, percent_of(subtotal, discount_pct)
+        discount = percent_of(subtotal, self.threshold_for(subtotal))
+        if self.happy_hour_table:
+            for category, pct in self.happy_hours(at or datetime.now()):
+                base = subtotal if category is None else sum(
+                    amount for name, amount in by_item.items() if self.categories.get(name) == category)
+                discount += percent_of(base, pct)
+        if self.combos:
+            candidates = {i for name in by_item for i in self.combos_by_item.get(name, ())}
+            for i in sorted(candidates):
+                items, pct = self.combos[i]
+                if items.issubset(by_item):
+                    discount += percent_of(sum(by_item[name] for name in items), pct)
+        return subtotal, gst, min(discount, subtotal)
+
+    def totals(self, lines: Iterable[Line], at: Optional[datetime] = None,
+               discount_pct: Optional[float] = None) -> Dict[str, Money]:
+        subtotal, gst, discount = self.price_lines(lines, at, discount_pct)
+        return {
+            "subtotal": Money(subtotal),
+            "gst_amount": Money(gst),
+            "discount_amount": Money(discount),
+            "total": Money(subtotal + gst - discount),
+        }
+
+
+# ------------------- Loading -------------------
+def load_rules_file(path) -> List[Rule]:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return [Rule.from_dict(r) for r in data["rules"]]
+
+
+def save_rules_file(rules: Iterable[Rule], path):
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps({"rules": [r.to_dict() for r in rules]}, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_rules_db() -> List[Rule]:
+    return [Rule.from_dict(r) for r in db_utils.fetch_pricing_rules()]
+
+
+def _menu_categories() -> Dict[str, str]:
+    return {name: category for _, name, category, _ in db_utils.fetch_menu() if category}
+
+
+class RuleBook:
+    """
+    Session cache of the compiled rules.
+
+    The source's version -- rules_version (bumped by DB triggers) or the
+    file's mtime and size -- together with menu_version is checked at most
+    once per `check_interval` seconds; the rules are recompiled only when
+    it changes. Databases from before the pricing_rules table fall back to
+    DEFAULT_RULES.
+    """
+
+    def __init__(self, path=None, check_interval: float = 2.0):
+        self.path = Path(path) if path else None
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._compiled: Optional[CompiledRules] = None
+        self._checked_at = 0.0
+
+    def _version(self):
+        try:
+            menu = db_utils.menu_version()
+        except sqlite3.OperationalError:
+            menu = None
+        if self.path is not None:
+            st = self.path.stat()
+            return ("file", st.st_mtime_ns, st.st_size, menu)
+        try:
+            return ("db", db_utils.rules_version(), menu)
+        except sqlite3.OperationalError:
+            return ("default", menu)
+
+    def _compile(self, version) -> CompiledRules:
+        if version[0] == "file":
+            rules = load_rules_file(self.path)
+        elif version[0] == "db":
+            rules = load_rules_db()
+        else:
+            rules = DEFAULT_RULES
+        categories = _menu_categories() if version[-1] is not None else {}
+        return CompiledRules(rules, categories, version)
+
+    def current(self) -> CompiledRules:
+        compiled = self._compiled
+        now = time.monotonic()
+        if compiled is not None and now - self._checked_at < self.check_interval:
+            return compiled
+        with self._lock:
+            version = self._version()
+            if self._compiled is None or self._compiled.version != version:
+                self._compiled = self._compile(version)
+            self._checked_at = now
+            return self._compiled
+
+    def invalidate(self):
+        """Force a version check on the next lookup"""
+        self._checked_at = 0.0
+
+
+_book: Optional[RuleBook] = None
+
+
+def get_rule_book() -> RuleBook:
+    global _book
+    if _book is None:
+        _book = RuleBook(os.environ.get("BILLING_RULES") or None)
+    return _book
+
+
+def get_rules() -> CompiledRules:
+    """The session's compiled rules"""
+    return get_rule_book().current()
+
+
+_default: Optional[CompiledRules] = None
+
+
+def default_rules() -> CompiledRules:
+    """DEFAULT_RULES compiled, without touching the database"""
+    global _default
+    if _default is None:
+        _default = CompiledRules(DEFAULT_RULES, version=("default",))
+    return _default
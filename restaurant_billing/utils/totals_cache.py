@@ -0,0 +1,199 @@
+"""
+Memoized bill totals for repeated carts.
+
+    python -m utils.totals_cache reprice [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--rules FILE]
+
+Combo carts come back again and again with the same lines, and pricing
+them under non-uniform rules (GST slabs, combos, category happy hours) walks
+every line each time. TotalsCache remembers (subtotal, gst, discount) per
+canonical cart, in a bounded LRU. Rules that treat every line alike
+(CompiledRules.uniform) are not cached: pricing a subtotal is a few
+integer multiplies, cheaper than building a key and moving it in the LRU.
+The key holds:
+
+    rules      CompiledRules.version: rules_version or the rules file's
+               mtime, plus menu_version (prices and categories)
+    discount   the explicit discount percent, or None for automatic ones
+    happy hour the (category, percent) windows running at the bill's time,
+               so the same cart at another hour of the same offer still hits
+    cart       the sorted (name, qty, unit paise) lines
+
+When the session's rules or menu change, their version changes and the
+entries priced under the old one are dropped (stats.invalidations).
+invalidate() drops everything. Rules compiled without a version are keyed
+by object, so two different rule sets never share entries.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics import timed
+from .money import Money
+from .rules import CompiledRules, Line, get_rules
+
+DEFAULT_MAXSIZE = 4096
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0       # entries pushed out by maxsize
+    invalidations: int = 0   # entries dropped because their rules changed
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class TotalsCache:
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[tuple, Tuple[int, int, int]]" = OrderedDict()
+        self._versions: Dict[str, object] = {}   # source kind -> latest rules version seen
+        self._lock = threading.Lock()
+
+    # ---- Keys ----
+    def _rules_key(self, rules: CompiledRules):
+        version = rules.version
+        if version is None:
+            return rules
+        kind = version[0]
+        if self._versions.get(kind, version) != version:
+            self._drop_version(self._versions[kind])
+        self._versions[kind] = version
+        return version
+
+    def _drop_version(self, version):
+        stale = [k for k in self._entries if k[0] == version]
+        for k in stale:
+            del self._entries[k]
+        self.stats.invalidations += len(stale)
+
+    # ---- Pricing ----
+    def price(self, rules: CompiledRules, lines: List[Line], at: Optional[datetime] = None,
+              discount_pct: Optional[float] = None) -> Tuple[int, int, int]:
+        """(subtotal, gst, discount) in paise, as rules.price_lines(lines, at, discount_pct)"""
+        if rules.uniform:
+            subtotal = sum(qty * price for _, qty, price in lines)
+            return (subtotal,) + rules.price_subtotal(subtotal, at, discount_pct)
+        happy = rules.happy_hours(at or datetime.now()) if rules.happy_hour_table else ()
+        cart = tuple(sorted(lines))
+        with self._lock:
+            key = (self._rules_key(rules), discount_pct, happy, cart)
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return hit
+            self.stats.misses += 1
+        priced = rules.price_lines(cart, at, discount_pct)
+        with self._lock:
+            self._entries[key] = priced
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+        return priced
+
+    def totals(self, rules: CompiledRules, lines: List[Line], at: Optional[datetime] = None,
+               discount_pct: Optional[float] = None) -> Dict[str, Money]:
+        """Same keys and values as rules.totals(lines, at, discount_pct)"""
+        subtotal, gst, discount = self.price(rules, lines, at, discount_pct)
+        return {
+            "subtotal": Money(subtotal),
+            "gst_amount": Money(gst),
+            "discount_amount": Money(discount),
+            "total": Money(subtotal + gst - discount),
+        }
+
+    # ---- Housekeeping ----
+    def invalidate(self):
+        """Drop every entry, e.g. after changing rules that carry no version"""
+        with self._lock:
+            self.stats.invalidations += len(self._entries)
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats_dict(self) -> Dict[str, float]:
+        return {**asdict(self.stats), "hit_rate": self.stats.hit_rate, "size": len(self._entries)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[TotalsCache] = None
+
+
+def get_totals_cache() -> TotalsCache:
+    """The process-wide cache shared by compute_totals(cache=...) callers and reprice()"""
+    global _cache
+    if _cache is None:
+        _cache = TotalsCache()
+    return _cache
+
+
+# ------------------- Batch re-pricing -------------------
+@timed("totals_cache.reprice")
+def reprice(orders: Iterable[Tuple[int, List[Line], Optional[datetime]]],
+            rules: Optional[CompiledRules] = None, discount_pct: Optional[float] = None,
+            cache: Optional[TotalsCache] = None) -> Iterator[Tuple[int, int, int, int, int]]:
+    """
+    Price historical orders under `rules` (default: the session's).
+    orders: (order_id, [(name, qty, unit paise)], created_at) per order
+    yields (order_id, subtotal, gst, discount, total) in paise
+    """
+    rules = rules or get_rules()
+    cache = cache or get_totals_cache()
+    for order_id, lines, created_at in orders:
+        subtotal, gst, discount = cache.price(rules, lines, created_at, discount_pct)
+        yield order_id, subtotal, gst, discount, subtotal + gst - discount
+
+
+def main(argv=None):
+    import argparse
+    from . import db_utils
+    from .receipts import iter_receipts
+    from .rules import RuleBook
+    parser = argparse.ArgumentParser(description="Re-price stored orders through the totals cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("reprice", help="compare stored totals with the current (or given) rules")
+    run.add_argument("--start", help="first day (YYYY-MM-DD)")
+    run.add_argument("--end", help="last day (YYYY-MM-DD, inclusive)")
+    run.add_argument("--rules", help="rules JSON file to price with (default: the session's)")
+    args = parser.parse_args(argv)
+
+    db_utils.init_db()
+    rules = RuleBook(args.rules).current() if args.rules else get_rules()
+    # iter_receipts takes [start, end); --end is inclusive like sales_report's
+    end = (date.fromisoformat(args.end) + timedelta(days=1)).isoformat() if args.end else None
+    stored = {}
+
+    def orders():
+        for r in iter_receipts(args.start, end):
+            stored[r.order_id] = r.total
+            yield (r.order_id, [(name, qty, unit) for name, qty, unit, _line in r.lines],
+                   datetime.fromisoformat(r.created_at))
+
+    n = changed = delta = 0
+    for order_id, _sub, _gst, _disc, total in reprice(orders(), rules):
+        n += 1
+        diff = total - stored.pop(order_id)
+        changed += diff != 0
+        delta += diff
+    stats = get_totals_cache().stats_dict()
+    print(f"{n} orders re-priced, {changed} would change, net {Money(delta)}")
+    if rules.uniform:
+        print("cache: not used, the rules price every line alike")
+    else:
+        print(f"cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+              f"{stats['evictions']} evictions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
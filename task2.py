@@ -1,28 +1,18 @@
-import os
+import sys
 
-filename = r"D:\daily task\tasks.txt"  # <-- Correct path
+from taskstore import TaskStore
 
-def load_tasks():
-    if os.path.exists(filename):
-        with open(filename, "r") as file:
-            return [line.strip() for line in file.readlines()]
-    return []
-
-def save_tasks(tasks):
-    with open(filename, "w") as file:
-        for task in tasks:
-            file.write(task + "\n")
-
-def show_tasks(tasks):
-    if not tasks:
+def show_tasks(store):
+    if not len(store):
         print("No tasks yet.")
     else:
         print("Your tasks:")
-        for i, task in enumerate(tasks, start=1):
-            print(f"{i}. {task}")
+        for task_id, task in store.items():
+            print(f"{task_id}. {task}")
 
-def main():
-    tasks = load_tasks()
+def main(path=None):
+    # Journal file: first argument, else $TODO_FILE, else tasks.log beside this script
+    store = TaskStore(path)
 
     while True:
         print("\nTo-Do List Menu:")
@@ -34,21 +24,19 @@ def main():
         choice = input("Choose 1-4: ").strip()
 
         if choice == "1":
-            show_tasks(tasks)
+            show_tasks(store)
 
         elif choice == "2":
             task = input("Enter new task: ")
-            tasks.append(task)
-            save_tasks(tasks)
+            store.add(task)
             print("✅ Task added.")
 
         elif choice == "3":
-            show_tasks(tasks)
+            show_tasks(store)
             try:
-                number = int(input("Task number to remove: ")) - 1
-                if 0 <= number < len(tasks):
-                    removed = tasks.pop(number)
-                    save_tasks(tasks)
+                task_id = int(input("Task number to remove: "))
+                if store.get(task_id) is not None:
+                    removed = store.remove(task_id)
                     print(f"🗑️ Removed: {removed}")
                 else:
                     print("Invalid task number.")
@@ -56,10 +44,11 @@ def main():
                 print("❌ Enter a valid number.")
 
         elif choice == "4":
+            store.close()
             print("👋 Goodbye!")
             break
         else:
             print("Invalid choice. Try again.")
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
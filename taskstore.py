@@ -0,0 +1,151 @@
+"""
+Append-only task store shared by todo.py and task2.py.
+
+Every add/remove is one JSON line appended to the journal, so an edit costs
+the same whether the list holds ten tasks or ten thousand. Loading replays
+the journal into an in-memory index (id -> text, in insertion order).
+Removed tasks leave dead records behind. Once they outnumber the live ones,
+the journal is compacted: rewritten to a temp file and swapped in with
+os.replace.
+
+Task ids are never reused, so a task keeps its id across sessions and
+compactions.
+
+The journal path comes from the argument, then the TODO_FILE environment
+variable, then tasks.log next to this file. An old plain-text tasks.txt
+beside the journal is imported the first time the journal is created.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_PATH = Path(__file__).resolve().parent / "tasks.log"
+
+# Compact when dead records outnumber live tasks and there are at least this many
+COMPACT_MIN_DEAD = 256
+
+
+def default_path() -> Path:
+    return Path(os.environ.get("TODO_FILE") or DEFAULT_PATH)
+
+
+class TaskStore:
+    def __init__(self, path=None, fsync: bool = False):
+        self.path = Path(path) if path else default_path()
+        self.fsync = fsync
+        self._tasks: Dict[int, str] = {}
+        self._next_id = 1
+        self._dead = 0
+        self._file = None
+        self._load()
+
+    # ---- Loading ----
+    def _load(self):
+        if not self.path.exists():
+            self._import_legacy()
+            return
+        good = 0   # byte offset after the last complete record
+        with open(self.path, "rb") as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break   # torn write from a crash: drop it and the rest
+                if not raw.endswith(b"\n"):
+                    break
+                self._apply(record)
+                good += len(raw)
+        if good < self.path.stat().st_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+
+    def _apply(self, record: dict):
+        op, task_id = record["op"], record["id"]
+        if op == "add":
+            self._tasks[task_id] = record["text"]
+        elif op == "del":
+            if self._tasks.pop(task_id, None) is not None:
+                self._dead += 1
+            self._dead += 1   # the del record itself
+        self._next_id = max(self._next_id, task_id + 1)
+
+    def _import_legacy(self):
+        legacy = self.path.with_suffix(".txt")
+        if legacy == self.path or not legacy.exists():
+            return
+        with open(legacy, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self._tasks[self._next_id] = line.strip()
+                    self._next_id += 1
+        self.compact()
+
+    # ---- Journal ----
+    def _append(self, record: dict):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def compact(self):
+        """Rewrite the journal with only the live tasks"""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            # keeps the id counter when the newest tasks have been removed
+            f.write(json.dumps({"op": "next", "id": self._next_id - 1}) + "\n")
+            for task_id, text in self._tasks.items():
+                f.write(json.dumps({"op": "add", "id": task_id, "text": text}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._dead = 0
+
+    def _maybe_compact(self):
+        if self._dead >= COMPACT_MIN_DEAD and self._dead > len(self._tasks):
+            self.compact()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- Tasks ----
+    def add(self, text: str) -> int:
+        task_id = self._next_id
+        self._append({"op": "add", "id": task_id, "text": text})
+        self._tasks[task_id] = text
+        self._next_id += 1
+        return task_id
+
+    def remove(self, task_id: int) -> str:
+        """Remove a task by id and return its text; KeyError if there is none"""
+        text = self._tasks[task_id]
+        self._append({"op": "del", "id": task_id})
+        del self._tasks[task_id]
+        self._dead += 2
+        self._maybe_compact()
+        return text
+
+    def get(self, task_id: int) -> Optional[str]:
+        return self._tasks.get(task_id)
+
+    def items(self) -> List[Tuple[int, str]]:
+        return list(self._tasks.items())
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._tasks.values()))
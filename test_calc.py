@@ -0,0 +1,149 @@
+"""Tests for calc.py's batch mode and expression parser: python -m unittest test_calc"""
+import io
+import math
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import calc
+from calc import ExpressionError, Record, compile_expression, evaluate, evaluate_line, evaluate_stream, run_batch
+
+
+def batch_lines(n, seed=18):
+    """Random "op a b" lines, heavy on edge values: zero divisors, inf, nan, overflow"""
+    rand = random.Random(seed)
+    ops = ["add", "subtract", "multiply", "divide", "+", "-", "*", "/", "ADD", "Divide"]
+    numbers = ["0", "-0", "1", "-2.5", "1e308", "-1e308", "inf", "-inf", "nan", "3", "7e-320", "0.1"]
+    lines = []
+    for _ in range(n):
+        a = rand.choice(numbers) if rand.random() < 0.5 else repr(rand.uniform(-1e6, 1e6))
+        b = rand.choice(numbers) if rand.random() < 0.5 else repr(rand.uniform(-1e6, 1e6))
+        lines.append(f"{rand.choice(ops)} {a} {b}\n")
+    return lines
+
+
+def same(a, b):
+    """Records equal, counting nan == nan"""
+    if isinstance(a.value, float) and isinstance(b.value, float) and math.isnan(a.value):
+        return math.isnan(b.value) and a[0] == b[0] and a.error == b.error
+    return a == b
+
+
+class BatchLineTest(unittest.TestCase):
+    def test_results_and_error_records(self):
+        cases = {
+            "add 1 2": Record(1, 3.0),
+            "/ 7 2": Record(1, 3.5),
+            "MULTIPLY -2 1.5": Record(1, -3.0),
+            "": Record(1),
+            "# a comment": Record(1),
+            "divide 1 0": Record(1, error="Division by zero."),
+            "add 1": Record(1, error="expected 'op a b', got 'add 1'"),
+            "power 2 3": Record(1, error="unknown operation 'power'"),
+            "add one 2": Record(1, error="not a number in 'add one 2'"),
+        }
+        for line, expected in cases.items():
+            with self.subTest(line=line):
+                self.assertEqual(evaluate_line(line, 1), expected)
+        self.assertEqual(Record(4, error="Division by zero.").format(), "error: line 4: Division by zero.")
+        self.assertEqual(Record(4).format(), "")
+        self.assertEqual(Record(4, 0.1).format(), "0.1")
+
+    def test_run_batch_writes_one_line_per_input_line(self):
+        out = io.StringIO()
+        errors = run_batch(io.StringIO("add 1 2\n\ndivide 1 0\nbogus\n* 2 2\n"), out, vectorize=False)
+        self.assertEqual(errors, 2)
+        self.assertEqual(out.getvalue().splitlines(),
+                         ["3.0", "", "error: line 3: Division by zero.",
+                          "error: line 4: expected 'op a b', got 'bogus'", "4.0"])
+
+    def test_line_numbers_run_across_chunks(self):
+        lines = ["add 1 1\n"] * 5 + ["divide 1 0\n"] + ["add 1 1\n"] * 4
+        with mock.patch.object(calc, "CHUNK_LINES", 3):
+            records = list(evaluate_stream(lines, vectorize=False))
+        self.assertEqual([r.line for r in records], list(range(1, 11)))
+        self.assertEqual([r.line for r in records if r.error], [6])
+
+    def test_exit_status(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            good, bad = Path(tmp) / "good.txt", Path(tmp) / "bad.txt"
+            good.write_text("add 1 2\n", encoding="utf-8")
+            bad.write_text("add 1 2\ndivide 1 0\n", encoding="utf-8")
+            with mock.patch("sys.stdout", io.StringIO()) as out:
+                self.assertEqual(calc.main(["--batch", str(good), "--no-numpy"]), 0)
+                self.assertEqual(calc.main(["--batch", str(bad), "--no-numpy"]), 1)
+        self.assertEqual(out.getvalue(), "3.0\n3.0\nerror: line 2: Division by zero.\n")
+
+
+@unittest.skipIf(calc.np is None, "NumPy is not installed")
+class VectorizedBatchTest(unittest.TestCase):
+    def assertSameRecords(self, lines):
+        python = list(evaluate_stream(lines, vectorize=False))
+        vectorized = list(evaluate_stream(lines, vectorize=True))
+        self.assertEqual(len(python), len(vectorized))
+        for p, v in zip(python, vectorized):
+            self.assertTrue(same(p, v), f"{p} != {v}")
+
+    def test_numpy_path_matches_python_path(self):
+        self.assertSameRecords(batch_lines(20000))
+
+    def test_output_is_byte_identical(self):
+        lines = batch_lines(5000, seed=7)
+        outputs = []
+        for vectorize in (False, True):
+            out = io.StringIO()
+            outputs.append((run_batch(io.StringIO("".join(lines)), out, vectorize), out.getvalue()))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertGreater(outputs[0][0], 0)   # the zero divisors
+
+    def test_malformed_chunks_fall_back_to_python(self):
+        lines = batch_lines(100)
+        for bad in ("# note\n", "\n", "add 1\n", "pow 2 3\n", "add x 1\n", "add 1 2 3\n"):
+            with self.subTest(bad=bad):
+                mixed = lines[:50] + [bad] + lines[50:]
+                with mock.patch.object(calc, "_evaluate_python", wraps=calc._evaluate_python) as python:
+                    self.assertSameRecords(mixed)
+                self.assertTrue(python.called)
+
+    def test_large_inputs_use_numpy_by_default(self):
+        with mock.patch.object(calc, "_evaluate_numpy", wraps=calc._evaluate_numpy) as numpy_path:
+            list(evaluate_stream(batch_lines(calc.VECTOR_THRESHOLD - 1)))
+            numpy_path.assert_not_called()
+            list(evaluate_stream(batch_lines(calc.VECTOR_THRESHOLD)))
+            numpy_path.assert_called_once()
+
+
+class TokenizerTest(unittest.TestCase):
+    def test_whitespace_anywhere(self):
+        for source in ("1+2 ", " 1 + 2", "1+2\n", "\t1\t+\t2\t", "1 +\n 2", "1+2\r\n", " 1+2 "):
+            with self.subTest(source=source):
+                self.assertEqual(evaluate(source), 3.0)
+
+    def test_names_with_trailing_whitespace(self):
+        expression = compile_expression(" qty * price \n")
+        self.assertEqual(expression.variables, frozenset({"qty", "price"}))
+        self.assertEqual(expression(qty=2, price=1.5), 3.0)
+
+    def test_bad_input_raises_expression_error(self):
+        for source in ("", "  ", "\n", "1 +", "1 ? 2", "(1", "1 2", "$"):
+            with self.subTest(source=source):
+                with self.assertRaises(ExpressionError):
+                    compile_expression(source)
+
+
+class ConstantFoldingTest(unittest.TestCase):
+    def test_division_by_zero_fails_at_evaluation(self):
+        for source in ("1/0", "2*(3/(1-1))", "-(1/0)"):
+            with self.subTest(source=source):
+                expression = compile_expression(source)
+                with self.assertRaises(ZeroDivisionError):
+                    expression()
+
+    def test_folding_keeps_results(self):
+        self.assertEqual(evaluate("(2+3)*4 - 1/4"), 19.75)
+        self.assertEqual(evaluate("x*(2+2) - -1", x=1.5), 7.0)
+
+if __name__ == "__main__":
+    unittest.main()
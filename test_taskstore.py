@@ -0,0 +1,108 @@
+"""Tests for taskstore.py's journal: python -m unittest test_taskstore"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import taskstore
+from taskstore import TaskStore
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "tasks.log"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def reopen(self):
+        with TaskStore(self.path) as store:
+            return store.items()
+
+    def records(self):
+        return [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines()]
+
+
+class ReplayTest(JournalTestCase):
+    def test_reopening_replays_adds_and_removes(self):
+        with TaskStore(self.path) as store:
+            ids = [store.add(f"task {i}") for i in range(5)]
+            store.remove(ids[1])
+            store.remove(ids[3])
+        self.assertEqual(self.reopen(), [(1, "task 0"), (3, "task 2"), (5, "task 4")])
+        self.assertEqual(len(self.records()), 7)   # appended, never rewritten
+
+    def test_ids_are_not_reused(self):
+        with TaskStore(self.path) as store:
+            store.add("first")
+            last = store.add("second")
+            store.remove(last)
+        with TaskStore(self.path) as store:
+            self.assertEqual(store.add("third"), 3)
+
+    def test_torn_last_record_is_dropped(self):
+        with TaskStore(self.path) as store:
+            store.add("kept")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"op": "add", "id": 2, "te')   # crash mid-append
+        with TaskStore(self.path) as store:
+            self.assertEqual(store.items(), [(1, "kept")])
+            store.add("after the crash")
+        self.assertEqual(self.reopen(), [(1, "kept"), (2, "after the crash")])
+
+    def test_remove_unknown_task(self):
+        with TaskStore(self.path) as store:
+            with self.assertRaises(KeyError):
+                store.remove(42)
+        self.assertFalse(self.path.exists())
+
+    def test_plain_text_list_is_imported_once(self):
+        self.path.with_suffix(".txt").write_text("buy milk\n\ncall bank\n", encoding="utf-8")
+        self.assertEqual(self.reopen(), [(1, "buy milk"), (2, "call bank")])
+        self.path.with_suffix(".txt").write_text("ignored now\n", encoding="utf-8")
+        self.assertEqual(self.reopen(), [(1, "buy milk"), (2, "call bank")])
+
+
+@mock.patch.object(taskstore, "COMPACT_MIN_DEAD", 4)
+class CompactionTest(JournalTestCase):
+    def test_compacts_once_dead_records_outnumber_live_tasks(self):
+        with TaskStore(self.path) as store:
+            ids = [store.add(f"task {i}") for i in range(4)]
+            store.remove(ids[0])   # 2 dead, 3 live
+            self.assertEqual(len(self.records()), 5)
+            store.remove(ids[1])   # 4 dead, 2 live: compacted
+            self.assertEqual(self.records(), [{"op": "next", "id": 4},
+                                              {"op": "add", "id": 3, "text": "task 2"},
+                                              {"op": "add", "id": 4, "text": "task 3"}])
+            store.add("task 4")    # appends to the compacted journal
+        self.assertEqual(self.reopen(), [(3, "task 2"), (4, "task 3"), (5, "task 4")])
+
+    def test_compaction_keeps_the_id_counter(self):
+        with TaskStore(self.path) as store:
+            ids = [store.add(f"task {i}") for i in range(3)]
+            for task_id in reversed(ids):   # the newest go first
+                store.remove(task_id)
+            # compacted after the second removal, down to the counter and task 1
+            self.assertEqual(self.records(), [{"op": "next", "id": 3}, {"op": "add", "id": 1, "text": "task 0"},
+                                              {"op": "del", "id": 1}])
+        with TaskStore(self.path) as store:
+            self.assertEqual(len(store), 0)
+            self.assertEqual(store.add("new"), 4)
+
+    def test_reloaded_dead_records_count_towards_compaction(self):
+        with TaskStore(self.path) as store:
+            ids = [store.add(f"task {i}") for i in range(6)]
+            store.remove(ids[0])
+        with TaskStore(self.path) as store:
+            store.remove(ids[1])   # 4 dead, 4 live: not yet
+            self.assertEqual(len(self.records()), 8)
+            store.remove(ids[2])   # 6 dead, 3 live
+            self.assertEqual(len(self.records()), 4)
+        self.assertEqual([text for _, text in self.reopen()], ["task 3", "task 4", "task 5"])
+        self.assertFalse(self.path.with_suffix(".log.tmp").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()